@@ -0,0 +1,124 @@
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from time import perf_counter
+from typing import Iterator
+
+from board import Board
+from compact import CompactBoard
+from puzzle_io import LibraryWriter, encode_islands
+from structs import splitmix64
+
+def task_seed(seed:int, idx:int) -> int:
+    """
+        Seed of the `idx`-th puzzle of a batch with the base `seed`, mixed with splitmix64
+        so neighbouring tasks and batches do not get related seeds
+    """
+    return splitmix64(splitmix64(seed) ^ idx)
+
+def regenerate(seed:int, width:int, height:int, n:int, unique:bool=False, compact:bool=False) -> Board:
+    """Generate the puzzle of a batch result again from its seed and size"""
+    _board = (CompactBoard if compact else Board)(width, height)
+    _board.generate(n, unique=unique, seed=seed)
+    return _board
+
+def _generate_task(task:tuple[int, int, int, int, int, bool, bool]) -> dict:
+    """Generate one puzzle in a worker, the result only holds plain data so it is cheap to send back"""
+    (_idx, _seed, _width, _height, _n, _unique, _compact) = task
+    _result = {'index': _idx, 'seed': _seed, 'width': _width, 'height': _height, 'n': _n, 'unique': _unique}
+    _start = perf_counter()
+    try:
+        _board = regenerate(_seed, _width, _height, _n, _unique, _compact)
+    except Exception as e:
+        _result['error'] = str(e)
+    else:
+        _result['islands'] = [(_node.position.row, _node.position.col, _node.n) for _node in _board.node_ls]
+        _result['stats'] = _board.generate_stats
+        _result['layout_hash'] = _board.layout_hash
+    _result['seconds'] = perf_counter() - _start
+    return _result
+
+def generate_batch(count:int, width:int, height:int, n:int, seed:int=0, workers:int=None,
+                   unique:bool=False, compact:bool=False, chunksize:int=1, ordered:bool=False) -> Iterator[dict]:
+    """
+        Generate `count` puzzles on a process pool, results are yielded as soon as they finish
+        Args:
+            `seed`: base seed, the puzzle at index i uses `task_seed(seed, i)`
+            `workers`: number of processes, all cores by default, 1 generates in this process
+            `unique`, `compact`: passed to `regenerate`
+            `chunksize`: number of puzzles sent to a worker at once
+            `ordered`: yield the results in the order of their index instead of as soon as they finish
+        Return:
+            iterator of dict of index, seed, width, height, n, unique, seconds and either
+            islands (list of (row, col, number)) with the generation stats and the layout hash, or the error message
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    _task_iter = ((_idx, task_seed(seed, _idx), width, height, n, unique, compact) for _idx in range(count))
+
+    if workers <= 1:
+        for _task in _task_iter:
+            yield _generate_task(_task)
+        return
+
+    with multiprocessing.Pool(min(workers, max(count, 1))) as _pool:
+        _map = _pool.imap if ordered else _pool.imap_unordered
+        for _result in _map(_generate_task, _task_iter, chunksize):
+            yield _result
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser(description='Generate a pack of puzzles as JSON lines, in parallel')
+    _parser.add_argument('-c', '--count', type=int, required=True, help='number of puzzles')
+    _parser.add_argument('-W', '--width', type=int, required=True)
+    _parser.add_argument('-H', '--height', type=int, required=True)
+    _parser.add_argument('-n', '--nodes', type=int, required=True, help='number of node in each puzzle')
+    _parser.add_argument('--seed', type=int, default=0, help='base seed of the batch')
+    _parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes, all cores by default')
+    _parser.add_argument('--unique', action='store_true', help='only puzzles with one solution')
+    _parser.add_argument('--compact', action='store_true', help='generate on CompactBoard')
+    _parser.add_argument('--chunksize', type=int, default=1)
+    _parser.add_argument('-o', '--output', help='file to write to, stdout by default')
+    _parser.add_argument('--dedupe', action='store_true', help='skip puzzles with the layout hash of an earlier puzzle')
+    _parser.add_argument('--library', action='store_true',
+                         help='write a puzzle library in index order to the output file, failed puzzles are skipped')
+    _args = _parser.parse_args()
+
+    if _args.library:
+        if _args.output is None:
+            _parser.error('--library needs an output file')
+        _library = LibraryWriter(_args.output)
+        _file = None
+    else:
+        _library = None
+        _file = sys.stdout if _args.output is None else open(_args.output, 'w')
+    _start = perf_counter()
+    _done = 0
+    _failed = 0
+    _duplicate = 0
+    _hash_set : set[int] = set()
+    try:
+        for _result in generate_batch(_args.count, _args.width, _args.height, _args.nodes, _args.seed,
+                                      _args.workers, _args.unique, _args.compact, _args.chunksize, _library is not None):
+            _done += 1
+            _failed += 'error' in _result
+            if _args.dedupe and 'error' not in _result:
+                if _result['layout_hash'] in _hash_set:
+                    _duplicate += 1
+                    continue
+                _hash_set.add(_result['layout_hash'])
+            if _library is None:
+                _file.write(json.dumps(_result) + '\n')
+            elif 'error' not in _result:
+                _library.add_record(encode_islands(_result['width'], _result['height'], sorted(_result['islands'])))
+    finally:
+        if _library is not None:
+            _library.close()
+        elif _file is not sys.stdout:
+            _file.close()
+    _seconds = perf_counter() - _start
+    print('{} puzzles, {} failed, {} duplicate, {:.2f}s, {:.1f} puzzles/s'.format(
+        _done, _failed, _duplicate, _seconds, _done / _seconds if _seconds > 0 else 0
+    ), file=sys.stderr)
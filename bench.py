@@ -0,0 +1,292 @@
+from __future__ import annotations
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tracemalloc
+from array import array
+from time import perf_counter
+
+from structs import *
+from board import Board
+from compact import CompactBoard
+from sparse import SparseBoard
+from game import Game, pack_move
+from solver import Solver
+from parallel import ParallelSolver
+
+# (width, height, number of node), two densities for each size
+CASES = [
+    (9, 6, 8), (9, 6, 15),
+    (20, 20, 30), (20, 20, 80),
+    (50, 50, 150), (50, 50, 400),
+    (100, 100, 600), (100, 100, 1500),
+]
+QUICK_CASES = CASES[:4]
+# cases of the solver on one core against all cores, the search of the large ones is long enough to split
+PARALLEL_CASES = [(30, 30, 200), (60, 60, 900)]
+# numbers of processes of `ParallelSolver` benchmarked with `--parallel`
+PARALLEL_WORKERS = [4, 8, 16]
+
+BOARD_CLS = {'Board': Board, 'CompactBoard': CompactBoard, 'SparseBoard': SparseBoard}
+
+def _measure(setup, run, repeat:int) -> dict:
+    """
+        Time `run(setup())` and record its peak memory
+        Args:
+            `setup`: build a fresh input, not measured
+            `run`: the measured operation, return the number of operations done
+            `repeat`: number of timed runs, the fastest one is reported
+        Return:
+            dict of seconds, peak_bytes, ops and ops_per_sec
+    """
+    _seconds = None
+    for _ in range(repeat):
+        _arg = setup()
+        _start = perf_counter()
+        _ops = run(_arg)
+        _elapsed = perf_counter() - _start
+        if _seconds is None or _elapsed < _seconds:
+            _seconds = _elapsed
+
+    # tracemalloc slows python down, so memory is measured in a separate run
+    _arg = setup()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        run(_arg)
+        (_, _peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds': _seconds,
+        'peak_bytes': _peak,
+        'ops': _ops,
+        'ops_per_sec': _ops / _seconds if _seconds > 0 else None,
+    }
+
+def _new_board(cls, width:int, height:int, node_cnt:int, seed:int) -> Board:
+    random.seed(seed)
+    _board = cls(width, height)
+    _board.generate(node_cnt)
+    return _board
+
+# solution of each seeded case as (row, col, row, col, number of lines), solved once for all board classes
+_solution_cache : dict[tuple[int, int, int, int], list[tuple[int, int, int, int, int]]] = {}
+
+def _solved_board(cls, width:int, height:int, node_cnt:int, seed:int) -> Board:
+    _board = _new_board(cls, width, height, node_cnt, seed)
+    _key = (width, height, node_cnt, seed)
+    if _key not in _solution_cache:
+        _solution = _board.solve()
+        if _solution is None:
+            raise Exception('Generated board has no solution')
+        _solution_cache[_key] = [
+            (_a.position.row, _a.position.col, _b.position.row, _b.position.col, _cnt) for (_a, _b, _cnt) in _solution
+        ]
+    for (_ar, _ac, _br, _bc, _cnt) in _solution_cache[_key]:
+        (_a, _b) = (_board.get(Position(_ar, _ac)), _board.get(Position(_br, _bc)))
+        for _ in range(_cnt):
+            _board.draw_line(_a, _b)
+    return _board
+
+def _pairs(board:Board) -> list[tuple[Node, Direction]]:
+    """All pairs of neighbour nodes, as (node, RIGHT or BOTTOM)"""
+    _pair_ls = []
+    for _node in board.node_ls:
+        for _dir in (Direction.RIGHT(), Direction.BOTTOM()):
+            if board.get_neighbour(_node, _dir) is not None:
+                _pair_ls.append((_node, _dir))
+    return _pair_ls
+
+def bench_generate(cls, width:int, height:int, node_cnt:int, seed:int, repeat:int) -> dict:
+    def setup():
+        random.seed(seed)
+        return cls(width, height)
+    def run(board:Board) -> int:
+        board.generate(node_cnt)
+        return 1
+    return _measure(setup, run, repeat)
+
+def bench_lines(cls, width:int, height:int, node_cnt:int, seed:int, repeat:int) -> dict:
+    """Draw a double line between every pair of neighbours and erase it again"""
+    def setup():
+        _board = _new_board(cls, width, height, node_cnt, seed)
+        return (_board, _pairs(_board))
+    def run(arg) -> int:
+        (_board, _pair_ls) = arg
+        for (_node, _dir) in _pair_ls:
+            _to_node = _board.get_neighbour(_node, _dir)
+            _board.draw_line(_node, _to_node)
+            _board.draw_line(_node, _to_node)
+            _board.erase_line(_node, _dir)
+            _board.erase_line(_node, _dir)
+        return len(_pair_ls) * 4
+    return _measure(setup, run, repeat)
+
+def bench_actions(width:int, height:int, node_cnt:int, seed:int, repeat:int) -> dict:
+    """Draw on every pair of neighbours through `Game.handle_action`, then undo it"""
+    def setup():
+        random.seed(seed)
+        _game = Game(width, height, node_cnt)
+        return (_game, _pairs(_game.board))
+    def run(arg) -> int:
+        (_game, _pair_ls) = arg
+        for (_node, _dir) in _pair_ls:
+            _game.handle_action(_node, _dir, 'dd')
+            _game.move_history.append((_node, _dir, 'dd'))
+            _game.handle_action(None, None, 'r')
+        return len(_pair_ls) * 2
+    return _measure(setup, run, repeat)
+
+def bench_moves(cls, width:int, height:int, node_cnt:int, seed:int, repeat:int) -> dict:
+    """
+        Apply a packed batch drawing and erasing lines on every pair of neighbours, then undo every move,
+        about 100k to 170k moves/s on `Board` on one core, most of it in the boxes written by each line
+    """
+    def setup():
+        _board = _new_board(cls, width, height, node_cnt, seed)
+        _move_ls = array('I')
+        for (_node, _dir) in _pairs(_board):
+            (_row, _col) = (_node.position.row, _node.position.col)
+            for _action in ('dd', 'ee', 'd', 'e'):
+                _move_ls.append(pack_move(width, _row, _col, _dir.idx, _action))
+        _move_ls.extend(array('I', [pack_move(width, 0, 0, 0, 'r')]) * len(_move_ls))
+        return (Game(board=_board), _move_ls)
+    def run(arg) -> int:
+        (_game, _move_ls) = arg
+        _result = _game.apply_moves(_move_ls)
+        if _result['applied'] != len(_move_ls):
+            raise Exception('Move rejected')
+        return len(_move_ls)
+    return _measure(setup, run, repeat)
+
+def bench_is_finish(cls, width:int, height:int, node_cnt:int, seed:int, repeat:int, rounds:int=1000) -> dict:
+    """Check a solved board, after removing and restoring one line each round"""
+    def setup():
+        _board = _solved_board(cls, width, height, node_cnt, seed)
+        _node = _board.node_ls[0]
+        return (_board, _node, _node.get_linked_dir()[0])
+    def run(arg) -> int:
+        (_board, _node, _dir) = arg
+        _to_node = _node.get_node_in_dir(_dir)
+        for _ in range(rounds):
+            _board.erase_line(_node, _dir)
+            _board.is_finish()
+            _board.draw_line(_node, _to_node)
+            if not _board.is_finish():
+                raise Exception('Solved board is not finished')
+        return rounds * 2
+    return _measure(setup, run, repeat)
+
+def bench_print(cls, width:int, height:int, node_cnt:int, seed:int, repeat:int) -> dict:
+    """Render a solved board to a null sink"""
+    def setup():
+        return _solved_board(cls, width, height, node_cnt, seed)
+    def run(board:Board) -> int:
+        with open(os.devnull, 'w') as _sink, contextlib.redirect_stdout(_sink):
+            board.print_board()
+        return 1
+    return _measure(setup, run, repeat)
+
+def bench_parallel(width:int, height:int, node_cnt:int, seed:int, repeat:int, workers:int=None) -> dict:
+    """
+        Count up to 2 solutions with `Solver` and with `ParallelSolver`, the pool is started before the timed runs
+        Return:
+            the measure of `ParallelSolver`, with serial_seconds, speedup (serial seconds / parallel seconds),
+            workers, cores, tasks and splits
+    """
+    _board = _new_board(Board, width, height, node_cnt, seed)
+    _serial = _measure(lambda: _board, lambda board: Solver(board).count_solutions(2), repeat)
+    with ParallelSolver(workers, min_nodes=0) as _parallel:
+        _parallel.count_solutions(_board, 2)
+        _result = _measure(lambda: _board, lambda board: _parallel.count_solutions(board, 2), repeat)
+        _result.update({
+            'serial_seconds': _serial['seconds'],
+            'speedup': _serial['seconds'] / _result['seconds'] if _result['seconds'] > 0 else None,
+            'workers': _parallel.workers,
+            'cores': os.cpu_count(),
+            'tasks': _parallel.stats['tasks'],
+            'splits': _parallel.stats['splits'],
+        })
+    return _result
+
+def run_suite(cases:list[tuple[int, int, int]]=CASES, seed:int=0, repeat:int=3, board_names:list[str]=None,
+              parallel_cases:list[tuple[int, int, int]]=(), parallel_workers:list[int]=PARALLEL_WORKERS) -> dict:
+    """
+        Run every benchmark on every case
+        Args:
+            `cases`: list of (width, height, number of node)
+            `seed`: base seed, each case derives its own seed from it
+            `repeat`: number of timed runs of each benchmark
+            `board_names`: names in `BOARD_CLS` to benchmark, all by default
+            `parallel_cases`: cases of `bench_parallel`, none by default
+            `parallel_workers`: numbers of processes of each case of `bench_parallel`
+        Return:
+            dict with the environment and a list of results
+    """
+    if board_names is None:
+        board_names = list(BOARD_CLS)
+
+    _result_ls = []
+    def record(bench:str, board_name:str, case:tuple[int, int, int], measure:dict):
+        (_width, _height, _node_cnt) = case
+        _result = {
+            'bench': bench, 'board': board_name,
+            'width': _width, 'height': _height, 'nodes': _node_cnt,
+        }
+        _result.update(measure)
+        _result_ls.append(_result)
+        print('{:<10} {:<13} {:>4}x{:<4} {:>5} nodes  {:>10.6f}s  {:>10} B{}'.format(
+            bench, board_name, _width, _height, _node_cnt, measure['seconds'], measure['peak_bytes'],
+            '  x{:.2f} on {} workers'.format(measure['speedup'], measure['workers']) if measure.get('speedup') is not None else ''
+        ), file=sys.stderr)
+
+    for (_idx, (_width, _height, _node_cnt)) in enumerate(cases):
+        _seed = seed * 1000003 + _idx
+        _args = (_width, _height, _node_cnt, _seed, repeat)
+        _case = cases[_idx]
+        for _name in board_names:
+            _cls = BOARD_CLS[_name]
+            record('generate', _name, _case, bench_generate(_cls, *_args))
+            record('lines', _name, _case, bench_lines(_cls, *_args))
+            record('is_finish', _name, _case, bench_is_finish(_cls, *_args))
+            record('print', _name, _case, bench_print(_cls, *_args))
+            record('moves', _name, _case, bench_moves(_cls, *_args))
+        record('actions', 'Board', _case, bench_actions(*_args))
+    for (_idx, _case) in enumerate(parallel_cases):
+        for _workers in parallel_workers:
+            record('parallel', 'Board', _case, bench_parallel(*_case, seed * 1000003 + _idx, repeat, _workers))
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'repeat': repeat,
+        'results': _result_ls,
+    }
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser(description='Benchmark board generation, moves, completion check and rendering')
+    _parser.add_argument('-o', '--output', help='write the JSON report to this file instead of stdout')
+    _parser.add_argument('--seed', type=int, default=0)
+    _parser.add_argument('--repeat', type=int, default=3)
+    _parser.add_argument('--quick', action='store_true', help='only the small cases')
+    _parser.add_argument('--board', action='append', choices=list(BOARD_CLS), help='board class to benchmark, repeatable')
+    _parser.add_argument('--parallel', action='store_true', help='also compare the solver on one core and on several processes')
+    _parser.add_argument('--workers', type=int, action='append',
+                         help='number of processes of the parallel solver, repeatable, {} by default'.format(PARALLEL_WORKERS))
+    _args = _parser.parse_args()
+
+    _report = run_suite(QUICK_CASES if _args.quick else CASES, _args.seed, _args.repeat, _args.board,
+                        PARALLEL_CASES if _args.parallel else (), _args.workers or PARALLEL_WORKERS)
+    if _args.output is None:
+        json.dump(_report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(_args.output, 'w') as _f:
+            json.dump(_report, _f, indent=2)
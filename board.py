@@ -1,6 +1,36 @@
+from __future__ import annotations
 from structs import *
-from random import choice, randint
-from colorama import Fore, Style
+from solver import Solver
+from render import frame
+import random
+from time import perf_counter
+import sys
+
+class _Frontier:
+    """Nodes that may grow, stored in an array with swap removal so every operation is O(1)"""
+    def __init__(self):
+        self.node_ls : list[Node] = []
+        self.idx_map : dict[Node, int] = {}
+
+    def __len__(self):
+        return len(self.node_ls)
+
+    def add(self, node:Node):
+        if node not in self.idx_map:
+            self.idx_map[node] = len(self.node_ls)
+            self.node_ls.append(node)
+
+    def discard(self, node:Node):
+        _idx = self.idx_map.pop(node, None)
+        if _idx is None:
+            return
+        _last = self.node_ls.pop()
+        if _last is not node:
+            self.node_ls[_idx] = _last
+            self.idx_map[_last] = _idx
+
+    def choice(self, rng:random.Random) -> Node:
+        return self.node_ls[rng.randrange(len(self.node_ls))]
 
 class Board:
     def __init__(self, width:int, height:int):
@@ -10,194 +40,667 @@ class Board:
         self.height = height
         self.board:list[list[Box]] = []
         self.node_ls:list[Node] = []
+        # if the neighbour index and the completion tracking are built and kept up to date
+        self.indexed : bool = False
+        # number of nodes with just enough lines
+        self.satisfied_cnt : int = 0
+        # nodes linked by lines, merged when a pair gets its first line, and the ids of the pairs in the order
+        # they were merged. removing the last line of the latest pair undoes its union in O(1),
+        # removing an older pair marks it dirty and the next connectivity check rebuilds it from all nodes, O(n)
+        self.link_set : RollbackUnionFind = None
+        self.link_pair_ls : list[tuple[int, int]] = []
+        self.link_set_dirty : bool = False
+        # zobrist hash of the size and the nodes, and of the lines, the lines are kept up to date by draw and erase
+        self.layout_hash : int = zobrist_size_key(width, height)
+        self.line_hash : int = 0
+        # version of this board, nodes owned by another version are shared with a fork and copied before a change
+        self.owner : object = object()
+        # if `node_ls` and the rows of `board` are shared with a fork
+        self.node_ls_shared : bool = False
+        self.row_shared : bytearray = None
+        # if the board is a fork or has been forked, only then nodes have to be looked up by their id
+        self.forked : bool = False
     
+    # storage of the boxes, a board with another storage overrides these methods
+    def _init_cells(self):
+        """Fill the board with empty boxes"""
+        self.row_shared = None
+        self.board = [
+            [Box(row, col) for col in range(self.width)] for row in range(self.height)
+        ]
+
+    def _new_node(self, row:int, col:int) -> Node:
+        return Node(row, col)
+
+    def _set_box(self, box:Box):
+        """Put `box` to its position"""
+        _row = box.position.row
+        if self.row_shared is not None and self.row_shared[_row]:
+            self._own_row(_row)
+        self.board[_row][box.position.col] = box
+
+    def _clear_box(self, row:int, col:int):
+        """Make the box in (`row`, `col`) empty"""
+        if self.row_shared is not None and self.row_shared[row]:
+            self._own_row(row)
+        self.board[row][col] = Box(row, col)
+
+    def _own_row(self, row:int):
+        """Copy a row shared with a fork before changing it"""
+        self.board[row] = list(self.board[row])
+        self.row_shared[row] = 0
+
+    def _fork_cells(self, board:Board):
+        """Share the boxes with `board`, a fork of this board, each side copies a row before changing it"""
+        board.board = list(self.board)
+        self.row_shared = bytearray(b'\x01') * self.height
+        board.row_shared = bytearray(b'\x01') * self.height
+
+    def _box_at(self, row:int, col:int) -> Box:
+        """Get box in (`row`, `col`), which must be in bound"""
+        return self.board[row][col]
+
+    def _mark_line(self, from_node:Node, to_node:Node, dir:Direction, line_class:type):
+        """Put the boxes of a line just drawn from `from_node` to `to_node`"""
+        if self.row_shared is None and self.board is not None:
+            # the rows are only this board's, the boxes are written to them directly
+            (_pos, _to_pos) = (from_node.position, to_node.position)
+            if dir.v == 0:
+                _row = self.board[_pos.row]
+                for _c in range(_pos.col + dir.h, _to_pos.col, dir.h):
+                    box = _row[_c]
+                    if box.__class__ is line_class:
+                        box.is_double = True
+                    else:
+                        _row[_c] = line_class.at(box.position)
+            else:
+                _c = _pos.col
+                for _row in self.board[_pos.row + dir.v:_to_pos.row:dir.v]:
+                    box = _row[_c]
+                    if box.__class__ is line_class:
+                        box.is_double = True
+                    else:
+                        _row[_c] = line_class.at(box.position)
+            return
+        _r = from_node.position.row + dir.v
+        _c = from_node.position.col + dir.h
+        _to_pos = to_node.position
+        while _r != _to_pos.row or _c != _to_pos.col:
+            box = self._box_at(_r, _c)
+            if not isinstance(box, Line):
+                self._set_box(line_class(_r, _c))
+            elif self.forked:
+                # the box may be shared with a fork, it is replaced instead of changed
+                box = line_class(_r, _c)
+                box.is_double = True
+                self._set_box(box)
+            else:
+                box.is_double = True
+            _r += dir.v
+            _c += dir.h
+
+    def _unmark_line(self, node:Node, to_node:Node, dir:Direction):
+        """Remove the boxes of a line just erased between `node` and `to_node`"""
+        if self.row_shared is None and self.board is not None:
+            (_pos, _to_pos) = (node.position, to_node.position)
+            if dir.v == 0:
+                _row = self.board[_pos.row]
+                for _c in range(_pos.col + dir.h, _to_pos.col, dir.h):
+                    box = _row[_c]
+                    if box.is_double:
+                        box.is_double = False
+                    else:
+                        _row[_c] = Box.at(box.position)
+            else:
+                _c = _pos.col
+                for _row in self.board[_pos.row + dir.v:_to_pos.row:dir.v]:
+                    box = _row[_c]
+                    if box.is_double:
+                        box.is_double = False
+                    else:
+                        _row[_c] = Box.at(box.position)
+            return
+        _r = node.position.row + dir.v
+        _c = node.position.col + dir.h
+        _to_pos = to_node.position
+        _line_class = HorizonLine if dir.is_horizontal() else VerticalLine
+        while _r != _to_pos.row or _c != _to_pos.col:
+            box = self._box_at(_r, _c)
+            if box.is_double and self.forked:
+                self._set_box(_line_class(_r, _c))
+            elif box.is_double:
+                box.is_double = False
+            else:
+                self._clear_box(_r, _c)
+            _r += dir.v
+            _c += dir.h
+
+    def _clear_line(self, node:Node, to_node:Node, dir:Direction):
+        """Remove the boxes of all lines between `node` and `to_node`, the links are cleared by the caller"""
+        _r = node.position.row + dir.v
+        _c = node.position.col + dir.h
+        _to_pos = to_node.position
+        while _r != _to_pos.row or _c != _to_pos.col:
+            self._clear_box(_r, _c)
+            _r += dir.v
+            _c += dir.h
+
+    def get_row(self, row:int) -> list[Box]:
+        """Get all boxes in `row`"""
+        return self.board[row]
+
     def get(self, pos:Position) -> Box:
         """Get box in `pos`"""
         # if out of bound
         if pos.row < 0 or pos.row >= self.height or pos.col < 0 or pos.col >= self.width:
             return None
-        return self.board[pos.row][pos.col]
+        return self._box_at(pos.row, pos.col)
     
     def get_relative(self, box:Box, dir:Direction) -> Box:
         """Get the near box in `dir` from `box`"""
-        return self.get(box.position.move_to(dir))
+        _r = box.position.row + dir.v
+        _c = box.position.col + dir.h
+        if _r < 0 or _r >= self.height or _c < 0 or _c >= self.width:
+            return None
+        return self._box_at(_r, _c)
     
     def get_nearest_non_empty(self, box:Box, dir:Direction) -> Box:
         """Get the near non empty box in `dir` from `box`"""
-        _box = self.get_relative(box, dir)
-        while _box is not None and _box.is_empty():
-            _box = self.get_relative(_box, dir)
-        return _box
+        _r = box.position.row + dir.v
+        _c = box.position.col + dir.h
+        while 0 <= _r < self.height and 0 <= _c < self.width:
+            _box = self._box_at(_r, _c)
+            if not _box.is_empty():
+                return _box
+            _r += dir.v
+            _c += dir.h
+        return None
 
-    def print_board(self):
-        def print_col_number():
-            print(f'  {Fore.CYAN}#{Fore.WHITE}', end='')
-            for i in range(self.width):
-                if i < 10:
-                    print(0, end='')
-                print(i, end='  ' if i < self.width-1 else '')
-            print(f'{Fore.CYAN}#{Style.RESET_ALL}')
+    def build_neighbour_index(self):
+        """
+            Fill the neighbour index of all nodes: the nearest node in each direction,
+            the pairs crossing each pair, and how many lines are crossing each pair now
+        """
+        self.node_ls_shared = False
+        for (_i, _node) in enumerate(self.node_ls):
+            _node.near = [None, None, None, None]
+            _node.block = [0, 0, 0, 0]
+            _node.cross_right = ()
+            _node.cross_bottom = ()
+            _node.id = _i
+            _node.owner = self.owner
+
+        (_horizon_ls, _vertical_ls) = pair_nearest_nodes(self.node_ls)
+        for (_a, _b) in _horizon_ls:
+            _a.near[RIGHT_IDX] = _b
+            _b.near[LEFT_IDX] = _a
+        for (_a, _b) in _vertical_ls:
+            _a.near[BOTTOM_IDX] = _b
+            _b.near[UP_IDX] = _a
+        self._index_crossings(_horizon_ls, _vertical_ls)
+        self._build_hash()
+
+        self.satisfied_cnt = sum(1 for _node in self.node_ls if _node.n == _node.get_line_cnt())
+        self._build_link_set()
+        self.indexed = True
+
+    def _index_crossings(self, horizon_ls:list[tuple[Node, Node]], vertical_ls:list[tuple[Node, Node]]):
+        """Fill the crossing pairs of each pair, and count the lines crossing each pair now"""
+        for (_h, _v) in find_crossings(horizon_ls, vertical_ls):
+            (_a, _b) = (horizon_ls[_h][0], vertical_ls[_v][0])
+            if len(_a.cross_right) == 0:
+                _a.cross_right = []
+            if len(_b.cross_bottom) == 0:
+                _b.cross_bottom = []
+            _a.cross_right.append(_b)
+            _b.cross_bottom.append(_a)
+
+        for _node in self.node_ls:
+            if _node.line_cnt[RIGHT_IDX] > 0:
+                self._block_crossing(_node, RIGHT_IDX, 1)
+            if _node.line_cnt[BOTTOM_IDX] > 0:
+                self._block_crossing(_node, BOTTOM_IDX, 1)
+
+    def _build_hash(self):
+        """Compute the zobrist hash of the nodes and of the lines now"""
+        self.layout_hash = zobrist_size_key(self.width, self.height)
+        self.line_hash = 0
+        for _node in self.node_ls:
+            _idx = _node.position.row * self.width + _node.position.col
+            self.layout_hash ^= zobrist_node_key(_idx, _node.n)
+            self.line_hash ^= zobrist_line_key(_idx, False, _node.line_cnt[RIGHT_IDX])
+            self.line_hash ^= zobrist_line_key(_idx, True, _node.line_cnt[BOTTOM_IDX])
+
+    def _update_line_hash(self, node:Node, to_node:Node, dir:Direction, cnt:int):
+        """The number of lines between `node` and `to_node` in `dir` of it changed from `cnt` to `cnt` + 1 or back"""
+        # the key is of the node on the left or above, the node of the pair in `dir` BOTTOM or RIGHT
+        _i = dir.idx
+        _pos = node.position if _i & 1 else to_node.position
+        self.line_hash ^= zobrist_line_change(_pos.row * self.width + _pos.col, _i < LEFT_IDX, cnt)
+
+    def state_hash(self) -> int:
+        """64-bit zobrist hash of the size, the nodes and the lines of the board, O(1)"""
+        return self.layout_hash ^ self.line_hash
+
+    def _build_link_set(self):
+        """Union find of the id of the nodes, the pairs linked since it got dirty are merged last"""
+        _pair_set = set()
+        for _node in self.node_ls:
+            for _i in (RIGHT_IDX, BOTTOM_IDX):
+                if _node.link[_i] is not None:
+                    (_a, _b) = (_node.id, _node.link[_i].id)
+                    _pair_set.add((_a, _b) if _a < _b else (_b, _a))
+        # the latest of them is then the first to be undone, like a pair erased and drawn again
+        _recent_ls = [_pair for _pair in dict.fromkeys(reversed(self.link_pair_ls)) if _pair in _pair_set]
+        _pair_set.difference_update(_recent_ls)
+        self.link_set = RollbackUnionFind(len(self.node_ls))
+        self.link_pair_ls = []
+        self.link_set_dirty = False
+        for (_a, _b) in sorted(_pair_set):
+            self._link_pair(_a, _b)
+        for (_a, _b) in reversed(_recent_ls):
+            self._link_pair(_a, _b)
+
+    def _link_pair(self, a:int, b:int):
+        """Merge the nodes of id `a` and `b` which just got their first line"""
+        _pair = (a, b) if a < b else (b, a)
+        if self.link_set_dirty:
+            # only the order is kept until the union find is rebuilt, at most one pair per node
+            if len(self.link_pair_ls) >= len(self.node_ls):
+                del self.link_pair_ls[:len(self.link_pair_ls) // 2]
+        else:
+            self.link_set.union(a, b)
+        self.link_pair_ls.append(_pair)
+
+    def _unlink_pair(self, a:int, b:int):
+        """Split the nodes of id `a` and `b` which just lost their last line, O(1) if they were the latest pair"""
+        if self.link_set_dirty:
             return
-        def print_horizon_line():
-            print(f'{Fore.CYAN}{"#"*((self.width+1)*4)}{Style.RESET_ALL}')
+        if len(self.link_pair_ls) > 0 and self.link_pair_ls[-1] == ((a, b) if a < b else (b, a)):
+            self.link_pair_ls.pop()
+            self.link_set.rollback()
+        else:
+            # a union find cannot split an older union, it is rebuilt by the next `is_finish` that needs it
+            self.link_set_dirty = True
+            self.link_pair_ls = []
+
+    def _block_crossing(self, node:Node, dir_idx:int, delta:int):
+        """Add `delta` to the block count of the pairs crossing the pair from `node` to the right or below"""
+        (_cross_ls, _i) = (node.cross_right, BOTTOM_IDX) if dir_idx == RIGHT_IDX else (node.cross_bottom, RIGHT_IDX)
+        if not self.forked:
+            for _node in _cross_ls:
+                _node.block[_i] += delta
+                _node.near[_i].block[_i ^ 1] += delta
             return
-        
-        # header
-        print_col_number()
-        print_horizon_line()
-
-        # body
-        for r_idx, row in enumerate(self.board):
-            print(f'{Fore.WHITE}{"0" if r_idx < 10 else ""}{r_idx}{Fore.CYAN}#', end='')
-            print(Style.RESET_ALL, end='')
-            for c_idx, box in enumerate(row):
-                padding_col = ''
-                if c_idx < self.width-1:
-                    padding_col = '  '
-                    if isinstance(box, Node) and box.node_right is not None:
-                        padding_col = '--' if box.right_line_cnt == 1 else '=='
-                    if isinstance(box, HorizonLine):
-                        padding_col = '==' if box.is_double else '--'
-                print(box, end=padding_col)
-            print(f'{Fore.CYAN}#{Fore.WHITE}{"0" if r_idx < 10 else ""}{r_idx}')
-            
-            # padding row
-            if r_idx == self.height-1:
-                continue
-            print(f'{Fore.CYAN}  #{Style.RESET_ALL}', end='')
-            for c_idx, box in enumerate(row):
-                col = '  '
-                if isinstance(box, Node) and box.node_bottom is not None:
-                    col = ' |' if box.bottom_line_cnt == 1 else '||'
-                if isinstance(box, VerticalLine):
-                    col = '||' if box.is_double else ' |'
-                print(col, end='  ' if c_idx < self.width-1 else '')
-            print(f'{Fore.CYAN}#{Style.RESET_ALL}')
-            
-        # footer
-        print_horizon_line()
-        print_col_number()
-            
-    def generate(self, _n:int):
+        _node_ls = self.node_ls
+        _owner = self.owner
+        for _node in _cross_ls:
+            _a = _node_ls[_node.id]
+            if _a.owner is not _owner:
+                _a = self._clone_node(_a)
+            _b = _node_ls[_node.near[_i].id]
+            if _b.owner is not _owner:
+                _b = self._clone_node(_b)
+            _a.block[_i] += delta
+            _b.block[_i ^ 1] += delta
+
+    # copy on write, nodes are shared by the forks of a board until one of them changes a node
+    def fork(self) -> Board:
+        """
+            Get a copy of the board sharing the boxes and the nodes with this board,
+            after that each of them copies a row or a node the first time it changes it,
+            so a fork costs about the number of rows and a change costs about what it changes.\n
+            A node from a link of another node may be an older copy, use `resolve` to get the node of the board
+        """
+        if not self.indexed:
+            raise Exception('Only a board with the neighbour index can be forked')
+        _board = object.__new__(type(self))
+        _board.__dict__.update(self.__dict__)
+        self._fork_cells(_board)
+        # nodes of the old version are shared, both boards copy them before a change
+        self.owner = object()
+        _board.owner = object()
+        self.node_ls_shared = True
+        _board.node_ls_shared = True
+        self.forked = True
+        _board.forked = True
+        # ids of the nodes stay the same, the other board rebuilds its union find when it is needed
+        _board.link_set = None
+        _board.link_pair_ls = []
+        _board.link_set_dirty = True
+        if hasattr(self, 'generate_stats'):
+            _board.generate_stats = dict(self.generate_stats)
+        return _board
+
+    def snapshot(self) -> Board:
+        """Fork of the board to keep as it is now, the same as `fork`"""
+        return self.fork()
+
+    def resolve(self, node:Node) -> Node:
+        """The node of this board at the position of `node`, which may be the node of a fork"""
+        return self.node_ls[node.id] if self.forked else node
+
+    def _own_node(self, node:Node) -> Node:
+        """The node of this board for `node`, copied first if it is shared with a fork"""
+        node = self.node_ls[node.id]
+        return node if node.owner is self.owner else self._clone_node(node)
+
+    def _own_pair(self, node:Node, to_node:Node, dir:Direction) -> tuple[Node, Node]:
+        """
+            The nodes of this board for two nodes in `dir` of each other, copied first if they are shared with a fork,
+            the links between them point to each other
+        """
+        node = self._own_node(node)
+        to_node = self._own_node(to_node)
+        if node.link[dir.idx] is not None:
+            node.link[dir.idx] = to_node
+            to_node.link[dir.idx ^ 1] = node
+        return (node, to_node)
+
+    def _clone_node(self, node:Node) -> Node:
+        if self.node_ls_shared:
+            self.node_ls = list(self.node_ls)
+            self.node_ls_shared = False
+        _node = node.clone()
+        _node.owner = self.owner
+        self.node_ls[_node.id] = _node
+        self._set_box(_node)
+        return _node
+
+    def _update_block(self, node:Node, dir:Direction, delta:int):
+        """The pair from `node` in `dir` gets its first line (`delta` 1) or loses its last line (`delta` -1)"""
+        if not self.indexed:
+            return
+        _i = dir.idx
+        if _i == LEFT_IDX or _i == UP_IDX:
+            # the pair is stored in the node at the other end
+            self._block_crossing(node.near[_i], _i ^ 1, delta)
+        else:
+            self._block_crossing(node, _i, delta)
+
+    def get_neighbour(self, node:Node, dir:Direction) -> Node:
+        """Get the node that `node` can link to in `dir`, None if there is no such node"""
+        if self.indexed:
+            if not self.forked:
+                return node.get_visible_node(dir)
+            _node = self.node_ls[node.id].get_visible_node(dir)
+            return None if _node is None else self.node_ls[_node.id]
+        _box = self.get_nearest_non_empty(node, dir)
+        return _box if isinstance(_box, Node) else None
+
+    def can_draw(self, node:Node, dir:Direction) -> bool:
+        """Check if one more line can be drawn from `node` in `dir`"""
+        node = self.resolve(node)
+        return node.get_line_cnt_in_dir(dir) < 2 and self.get_neighbour(node, dir) is not None
+
+    def print_board(self):
+        """Print the board, the whole frame is built first and written at once"""
+        sys.stdout.write(frame(self))
+        sys.stdout.flush()
+
+    def generate(self, _n:int, unique:bool=False, max_attempts:int=20, max_checks:int=None, seed:int=None,
+                 solver=None):
         """
             Generate a new game board
             Args:
                 `n`: number of node in the board
+                `unique`: make sure the board has only one solution.\n
+                    each new node is checked by the solver, an ambiguous node is removed and another one is tried,
+                    after `max_attempts` failed tries the last accepted node is removed as well
+                `max_checks`: maximum number of solver calls when `unique`, default 20 * `n`
+                `seed`: seed of the board, the same seed and arguments give the same board on the same size.\n
+                    the global `random` module is used if it is None
+                `solver`: object with `count_solutions(board, limit)` for the checks of `unique`,
+                    like `parallel.ParallelSolver`, a new `Solver` of the board for each check by default
         """
         assert _n > 1 and _n <= self.width * self.height
+        if max_checks is None:
+            max_checks = 20 * _n
         
         # constrcut an empty board
-        self.board = [
-            [Box(row, col) for col in range(self.width)] for row in range(self.height)
-        ]
+        self._init_cells()
+        self.node_ls = []
+        self.indexed = False
+        self.forked = False
+        self.generate_stats = {'checks': 0, 'rejected': 0, 'removed': 0, 'seconds': 0.0}
+        self.rng = random if seed is None else random.Random(seed)
+        _start_time = perf_counter()
 
         # choose first random node
-        _first_node = Node(randint(0, self.height-1), randint(0, self.width-1))
-        self.board[_first_node.position.row][_first_node.position.col] = _first_node
+        _first_node = self._new_node(self.rng.randint(0, self.height-1), self.rng.randint(0, self.width-1))
+        self._set_box(_first_node)
         self.node_ls.append(_first_node)
     
         # created nodes the can be connected to other nodes
-        _avai_node_set : set[Node] = set()        
-        _avai_node_set.add(_first_node)
+        _frontier = _Frontier()
+        _frontier.add(_first_node)
+
+        # accepted growing steps, each element is (from_node, to_node, number of lines)
+        _step_ls : list[tuple[Node, Node, int]] = []
+        _fail_cnt = 0
 
         # choose n-1 more boxes as node
-        for _ in range(_n-1):
-            # find a node and a direction that can create another node
-            _from_node : Node = None
-            _dir : Direction = None
-            while _from_node is None or _dir is None:
-                _node = choice(list(_avai_node_set))
-                
-                _avai_dir_ls = []
-                for _dir in _node.get_unlinked_dir():
-                    _b = self.get_relative(_node, _dir)
-                    if _b is not None and _b.is_empty():
-                        _avai_dir_ls.append(_dir)
-                
-                if len(_avai_dir_ls) == 0:
-                    _avai_node_set.remove(_node)
+        while len(self.node_ls) < _n:
+            _step = self._grow(_frontier)
+            if _step is None:
+                if not unique or len(_step_ls) == 0:
+                    raise Exception('No space for more node')
+                _fail_cnt = max_attempts
+            elif unique:
+                if self.generate_stats['checks'] >= max_checks:
+                    raise Exception('Cannot generate a unique board within {} checks'.format(max_checks))
+                self.generate_stats['checks'] += 1
+                _cnt = Solver(self).count_solutions(2) if solver is None else solver.count_solutions(self, 2)
+                if _cnt == 1:
+                    _step_ls.append(_step)
+                    _fail_cnt = 0
                     continue
-                                
-                _from_node = _node
-                _dir = choice(_avai_dir_ls)
+                self.generate_stats['rejected'] += 1
+                self._ungrow(_step, _frontier)
+                _fail_cnt += 1
+
+            # the last accepted board is unique, so removing its newest node keeps it unique
+            if unique and _fail_cnt >= max_attempts and len(_step_ls) > 0:
+                self._ungrow(_step_ls.pop(), _frontier)
+                self.generate_stats['removed'] += 1
+                _fail_cnt = 0
                 
-            # choose a random empty box in this direction
-            _empty_box_ls = []
-            _b = self.get_relative(_from_node, _dir)
-            while _b is not None and _b.is_empty():
-                _empty_box_ls.append(_b)
-                _b = self.get_relative(_b, _dir)
-            _box : Box = choice(_empty_box_ls)
+        # clear all link, only the boxes between linked nodes are visited
+        for _node in self.node_ls:
+            for _dir in (Direction.RIGHT(), Direction.BOTTOM()):
+                if _node.line_cnt[_dir.idx] > 0:
+                    self._clear_line(_node, _node.link[_dir.idx], _dir)
+        for _node in self.node_ls:
+            _node.clear_link()
+        self.build_neighbour_index()
+        self.generate_stats['seconds'] = perf_counter() - _start_time
+
+    def place_nodes(self, island_ls:list[tuple[int, int, int]]):
+        """
+            Replace the board with a puzzle made of the given nodes, without lines
+            Args:
+                `island_ls`: list of (row, col, number) of the nodes
+        """
+        self._init_cells()
+        self.node_ls = []
+        self.indexed = False
+        self.forked = False
+        for (_row, _col, _n) in island_ls:
+            if not (0 <= _row < self.height and 0 <= _col < self.width):
+                raise Exception('Node ({}, {}) is out of the board'.format(_row, _col))
+            if not self._box_at(_row, _col).is_empty():
+                raise Exception('More than one node at ({}, {})'.format(_row, _col))
+            _node = self._new_node(_row, _col)
+            _node.n = _n
+            self._set_box(_node)
+            self.node_ls.append(_node)
+        self.build_neighbour_index()
+
+    def _free_run(self, node:Node, dir:Direction) -> int:
+        """Number of empty boxes next to `node` in `dir`"""
+        _cnt = 0
+        _r = node.position.row + dir.v
+        _c = node.position.col + dir.h
+        while 0 <= _r < self.height and 0 <= _c < self.width and self.board[_r][_c].is_empty():
+            _cnt += 1
+            _r += dir.v
+            _c += dir.h
+        return _cnt
+
+    def _grow(self, _frontier:_Frontier) -> tuple[Node, Node, int]:
+        """
+            Create a node linked to a random available node
+            Return:
+                (from_node, to_node, number of lines), None if no node can be created
+        """
+        # find a node and a direction that can create another node,
+        # nodes without any empty neighbour box never get space again, so they leave the frontier
+        _from_node : Node = None
+        while _from_node is None:
+            if len(_frontier) == 0:
+                return None
+            _node = _frontier.choice(self.rng)
+            
+            _avai_dir_ls = []
+            for _dir in _node.get_unlinked_dir():
+                _run = self._free_run(_node, _dir)
+                if _run > 0:
+                    _avai_dir_ls.append((_dir, _run))
             
-            # convert box to node
-            _to_node = Node(_box.position.row, _box.position.col)
-            self.board[_box.position.row][_box.position.col] = _to_node
-            _avai_node_set.add(_to_node)
-            self.node_ls.append(_to_node)
+            if len(_avai_dir_ls) == 0:
+                _frontier.discard(_node)
+                continue
+                            
+            _from_node = _node
+            (_dir, _run) = self.rng.choice(_avai_dir_ls)
+            
+        # choose a random empty box in this direction
+        _dist = self.rng.randint(1, _run)
+        _row = _from_node.position.row + _dir.v * _dist
+        _col = _from_node.position.col + _dir.h * _dist
+        
+        # convert box to node
+        _to_node = self._new_node(_row, _col)
+        self._set_box(_to_node)
+        _frontier.add(_to_node)
+        self.node_ls.append(_to_node)
 
-            # draw a line, and increase number of line of both node
+        # draw a line, 50% chance to double it, and increase number of line of both node
+        _cnt = 2 if self.rng.randint(0, 1) == 1 else 1
+        for _ in range(_cnt):
             self.draw_line(_from_node, _to_node)
-            _from_node.n += 1
-            _to_node.n += 1
-            
-            # 50% chance to double it
-            if randint(0, 1) == 1:
-                self.draw_line(_from_node, _to_node)
-                _from_node.n += 1
-                _to_node.n += 1
-                
-        # clear all link
-        for r_idx, row in enumerate(self.board):
-            for c_idx, box in enumerate(row):
-                if isinstance(box, Node):
-                    box.clear_link()
-                elif isinstance(box, Line):
-                    self.board[r_idx][c_idx] = Box(r_idx, c_idx)
+        _from_node.n += _cnt
+        _to_node.n += _cnt
+        return (_from_node, _to_node, _cnt)
+
+    def _ungrow(self, step:tuple[Node, Node, int], _frontier:_Frontier):
+        """Remove the newest node created by `_grow`, it must not be linked to other nodes"""
+        (_from_node, _to_node, _cnt) = step
+        _dir = _from_node.position.dir_to(_to_node.position)
+        for _ in range(_cnt):
+            self.erase_line(_from_node, _dir)
+        _from_node.n -= _cnt
+
+        _pos = _to_node.position
+        self._clear_box(_pos.row, _pos.col)
+        assert self.node_ls[-1] is _to_node
+        self.node_ls.pop()
+        _frontier.discard(_to_node)
+        _frontier.add(_from_node)
         
     def draw_line(self, from_node:Node, to_node:Node):
         dir = from_node.position.dir_to(to_node.position)
-        
-        if dir.is_horizontal():
-            line_class = HorizonLine
-        elif dir.is_vertical():
-            line_class = VerticalLine
-        else:
+        _i = dir.idx
+        if _i == -1:
             raise Exception('Drawing diagonal line')
         
-        if from_node.get_line_cnt_in_dir(dir) == 2:
+        if self.forked:
+            (from_node, to_node) = self._own_pair(from_node, to_node, dir)
+        _cnt = from_node.line_cnt[_i]
+        if _cnt == 2:
             raise Exception('Already have 2 lines in this direction')
+        assert from_node.link[_i] is None or from_node.link[_i] is to_node
         
-        from_node.link_node(to_node)
-        to_node.link_node(from_node)
-        
-        box = self.get_relative(from_node, dir)
-        while box.position != to_node.position:
-            if isinstance(box, Line):
-                box.is_double = True
-            else:
-                _line = line_class(box.position.row, box.position.col)
-                self.board[box.position.row][box.position.col] = _line
-            box = self.get_relative(box, dir)
+        _from_cnt = from_node.get_line_cnt()
+        _to_cnt = to_node.get_line_cnt()
+        from_node.link[_i] = to_node
+        from_node.line_cnt[_i] = _cnt + 1
+        to_node.link[_i ^ 1] = from_node
+        to_node.line_cnt[_i ^ 1] += 1
+        self._update_line_hash(from_node, to_node, dir, _cnt)
+        if self.indexed:
+            (_n, _to_n) = (from_node.n, to_node.n)
+            self.satisfied_cnt += (_n == _from_cnt + 1) - (_n == _from_cnt) + (_to_n == _to_cnt + 1) - (_to_n == _to_cnt)
+            if _cnt == 0:
+                self._update_block(from_node, dir, 1)
+                self._link_pair(from_node.id, to_node.id)
+        self._mark_line(from_node, to_node, dir, HorizonLine if _i >= LEFT_IDX else VerticalLine)
             
     def erase_line(self, node:Node, dir:Direction):
-        if node.get_line_cnt_in_dir(dir) == 0:
+        if self.forked:
+            node = self.resolve(node)
+        _i = dir.idx
+        _cnt = node.line_cnt[_i]
+        if _cnt == 0:
             raise Exception('No line in this direction')
         
+        _to_node = node.link[_i]
+        if self.forked:
+            (node, _to_node) = self._own_pair(node, _to_node, dir)
+        _from_cnt = node.get_line_cnt()
+        _to_cnt = _to_node.get_line_cnt()
         node.unlink_dir(dir)
-        
-        box = self.get_relative(node, dir)
-        while isinstance(box, Line):
-            if box.is_double:
-                box.is_double = False
-            else:
-                self.board[box.position.row][box.position.col] = Box(box.position.row, box.position.col)
-            box = self.get_relative(box, dir)
+        self._update_line_hash(node, _to_node, dir, _cnt - 1)
+        if self.indexed:
+            (_n, _to_n) = (node.n, _to_node.n)
+            self.satisfied_cnt += (_n == _from_cnt - 1) - (_n == _from_cnt) + (_to_n == _to_cnt - 1) - (_to_n == _to_cnt)
+            if _cnt == 1:
+                self._update_block(node, dir, -1)
+                self._unlink_pair(node.id, _to_node.id)
+        self._unmark_line(node, _to_node, dir)
+
+    def clear_lines(self):
+        """Erase all lines in the board"""
+        # erasing may replace a node shared with a fork, so the node is looked up again each time
+        for _i in range(len(self.node_ls)):
+            for _dir in self.node_ls[_i].get_linked_dir():
+                while self.node_ls[_i].get_line_cnt_in_dir(_dir) > 0:
+                    self.erase_line(self.node_ls[_i], _dir)
+
+    def solve(self, apply:bool=False) -> list[tuple[Node, Node, int]]:
+        """
+            Solve the board, lines drawn by the player are ignored
+            Args:
+                `apply`: replace the lines in the board with the solution
+            Return:
+                list of (node, node, number of lines), None if the board has no solution
+        """
+        _solution = Solver(self).solve()
+        if _solution is not None and apply:
+            self.draw_solution(_solution)
+        return _solution
+
+    def draw_solution(self, solution:list[tuple[Node, Node, int]]):
+        """Replace the lines in the board with `solution`, a list of (node, node, number of lines)"""
+        self.clear_lines()
+        for (_a, _b, _cnt) in solution:
+            for _ in range(_cnt):
+                self.draw_line(_a, _b)
 
     def is_finish(self) -> bool:
         """
             Check if all node has just enough line connected to it,\n
             and all nodes can be reached from the first node
         """        
+        if self.indexed:
+            # O(1) unless all nodes are satisfied after a link other than the latest was removed,
+            # then the union find is rebuilt in O(n)
+            if self.satisfied_cnt != len(self.node_ls):
+                return False
+            if self.link_set_dirty:
+                self._build_link_set()
+            return self.link_set.set_cnt == 1
+
         _visited_node_set = set()
         _visited_node_set.add(self.node_ls[0])
         _node_ls = [self.node_ls[0]]
@@ -0,0 +1,173 @@
+from __future__ import annotations
+from array import array
+
+from structs import *
+from board import Board
+
+# kind of box stored in `CompactBoard.kind`
+KIND_EMPTY = 0
+KIND_NODE = 1
+KIND_HORIZON = 2
+KIND_VERTICAL = 3
+
+class CompactNode(Node):
+    """Node whose number is stored in `CompactBoard.number`"""
+    __slots__ = ('board', 'row', 'col')
+
+    def __init__(self, board:CompactBoard, row:int, col:int):
+        self.board = board
+        self.row = row
+        self.col = col
+        super().__init__(row, col)
+
+    @property
+    def n(self) -> int:
+        return self.board.number[self.row][self.col]
+    @n.setter
+    def n(self, value:int):
+        _board = self.board
+        if _board.number[self.row][self.col] == value:
+            # like a node copied by `Node.clone`, a row shared with a fork is not copied for nothing
+            return
+        if _board.row_shared is not None and _board.row_shared[self.row]:
+            _board._own_row(self.row)
+        _board.number[self.row][self.col] = value
+
+class _LineView:
+    """Line whose `is_double` is stored in `CompactBoard.mult`"""
+    __slots__ = ()
+
+    def __init__(self, board:CompactBoard, row:int, col:int):
+        self.board = board
+        self.position = Position(row, col)
+
+    @property
+    def is_double(self) -> bool:
+        return self.board.mult[self.position.row][self.position.col] == 2
+    @is_double.setter
+    def is_double(self, value:bool):
+        _board = self.board
+        _row = self.position.row
+        if _board.row_shared is not None and _board.row_shared[_row]:
+            _board._own_row(_row)
+        _board.mult[_row][self.position.col] = 2 if value else 1
+
+class HorizonLineView(_LineView, HorizonLine):
+    __slots__ = ('board',)
+
+    def __init__(self, board:CompactBoard, row:int, col:int):
+        super().__init__(board, row, col)
+        self.dir = Direction.RIGHT()
+
+class VerticalLineView(_LineView, VerticalLine):
+    __slots__ = ('board',)
+
+    def __init__(self, board:CompactBoard, row:int, col:int):
+        super().__init__(board, row, col)
+        self.dir = Direction.UP()
+
+class CompactBoard(Board):
+    """
+        Board that keeps the kind of each box, the number of each node and the number of lines
+        in each line box in a byte array per row, instead of one object per box.\n
+        Only nodes are real objects, `get` returns a view for a line box and a new `Box` for an empty box.\n
+        A fork shares the rows like `Board.fork`, each side copies a row the first time it changes it
+    """
+    def _init_cells(self):
+        self.board = None
+        self.row_shared = None
+        _empty = bytes(self.width)
+        self.kind = [array('B', _empty) for _ in range(self.height)]
+        self.number = [array('B', _empty) for _ in range(self.height)]
+        self.mult = [array('B', _empty) for _ in range(self.height)]
+        # col -> node of each row
+        self.node_map : list[dict[int, Node]] = [{} for _ in range(self.height)]
+
+    def _fork_cells(self, board:CompactBoard):
+        board.kind = list(self.kind)
+        board.number = list(self.number)
+        board.mult = list(self.mult)
+        board.node_map = list(self.node_map)
+        self.row_shared = bytearray(b'\x01') * self.height
+        board.row_shared = bytearray(b'\x01') * self.height
+
+    def _own_row(self, row:int):
+        """Copy the arrays and the nodes of a row shared with a fork before changing them, O(width)"""
+        self.kind[row] = array('B', self.kind[row])
+        self.number[row] = array('B', self.number[row])
+        self.mult[row] = array('B', self.mult[row])
+        self.node_map[row] = dict(self.node_map[row])
+        self.row_shared[row] = 0
+
+    def _clone_node(self, node:Node) -> Node:
+        _node = super()._clone_node(node)
+        _node.board = self
+        return _node
+
+    def _new_node(self, row:int, col:int) -> Node:
+        return CompactNode(self, row, col)
+
+    def _set_box(self, box:Box):
+        (_row, _col) = (box.position.row, box.position.col)
+        if self.row_shared is not None and self.row_shared[_row]:
+            self._own_row(_row)
+        if isinstance(box, Node):
+            self.kind[_row][_col] = KIND_NODE
+            self.node_map[_row][_col] = box
+            if not isinstance(box, CompactNode):
+                self.number[_row][_col] = box.n
+        elif isinstance(box, Line):
+            self.kind[_row][_col] = KIND_HORIZON if isinstance(box, HorizonLine) else KIND_VERTICAL
+            self.mult[_row][_col] = 2 if box.is_double else 1
+        else:
+            self._clear_box(_row, _col)
+
+    def _clear_box(self, row:int, col:int):
+        if self.row_shared is not None and self.row_shared[row]:
+            self._own_row(row)
+        if self.kind[row][col] == KIND_NODE:
+            del self.node_map[row][col]
+        self.kind[row][col] = KIND_EMPTY
+        self.number[row][col] = 0
+        self.mult[row][col] = 0
+
+    def _box_at(self, row:int, col:int) -> Box:
+        _kind = self.kind[row][col]
+        if _kind == KIND_NODE:
+            return self.node_map[row][col]
+        if _kind == KIND_HORIZON:
+            return HorizonLineView(self, row, col)
+        if _kind == KIND_VERTICAL:
+            return VerticalLineView(self, row, col)
+        return Box(row, col)
+
+    def get_row(self, row:int) -> list[Box]:
+        return [self._box_at(row, _col) for _col in range(self.width)]
+
+    def get(self, pos:Position) -> Box:
+        # if out of bound
+        if pos.row < 0 or pos.row >= self.height or pos.col < 0 or pos.col >= self.width:
+            return None
+        return self._box_at(pos.row, pos.col)
+
+    def get_nearest_non_empty(self, box:Box, dir:Direction) -> Box:
+        _r = box.position.row + dir.v
+        _c = box.position.col + dir.h
+        _kind = self.kind
+        while 0 <= _r < self.height and 0 <= _c < self.width:
+            if _kind[_r][_c] != KIND_EMPTY:
+                return self._box_at(_r, _c)
+            _r += dir.v
+            _c += dir.h
+        return None
+
+    def _free_run(self, node:Node, dir:Direction) -> int:
+        _kind = self.kind
+        _cnt = 0
+        _r = node.position.row + dir.v
+        _c = node.position.col + dir.h
+        while 0 <= _r < self.height and 0 <= _c < self.width and _kind[_r][_c] == KIND_EMPTY:
+            _cnt += 1
+            _r += dir.v
+            _c += dir.h
+        return _cnt
@@ -0,0 +1,257 @@
+from __future__ import annotations
+import random
+
+import numpy as np
+
+from structs import *
+from board import Board
+from batch import task_seed
+
+# channels of an observation, each is a height x width plane of int8
+OBS_NUMBER = 0
+OBS_REMAIN = 1
+OBS_RIGHT = 2
+OBS_BOTTOM = 3
+OBS_CHANNELS = 4
+
+# an action is `pair * 2 + ACTION_DRAW` or `pair * 2 + ACTION_ERASE`, pairs are listed in `HashiEnv.pair_ls`
+ACTION_DRAW = 0
+ACTION_ERASE = 1
+
+class HashiEnv:
+    """
+        Gym-like environment of one puzzle, the state is kept in numpy arrays updated with each step.\n
+        Observation is an int8 array of `OBS_CHANNELS` x height x width:
+            `OBS_NUMBER`: number of the node, 0 for other boxes
+            `OBS_REMAIN`: number of the node minus its lines, negative if it has too many
+            `OBS_RIGHT`, `OBS_BOTTOM`: lines from a node to the right or below,
+                on the node and on the boxes of the line\n
+        Actions draw or erase a line between a pair of neighbour nodes, `mask` tells which actions are legal
+    """
+    def __init__(self, board:Board=None, width:int=None, height:int=None, node_cnt:int=None, seed:int=None,
+                 max_steps:int=None, strict:bool=False, illegal_reward:float=-0.1, board_cls:type=Board,
+                 out_obs:np.ndarray=None, out_mask:np.ndarray=None, out_remain:np.ndarray=None):
+        """
+            Play `board`, or a new puzzle of `width` x `height` with `node_cnt` nodes for each episode
+            Args:
+                `seed`: seed of the puzzles generated by `reset`
+                `max_steps`: steps of an episode before it is done, unlimited by default
+                `strict`: a line cannot be drawn on a node that has all its lines
+                `illegal_reward`: reward of an action not in the mask, the board is unchanged
+                `out_obs`, `out_mask`, `out_remain`: arrays to keep the observation, the mask and the
+                    remaining number of each node in, like the rows of the arrays of `VecHashiEnv`, new arrays by default.
+                    The mask has room for the actions of 2 pairs per node when puzzles are generated,
+                    `out_remain` is only used for generated puzzles, which have `node_cnt` nodes
+        """
+        if board is None:
+            self.width = width
+            self.height = height
+            self.max_actions = node_cnt * 4
+        else:
+            self.width = board.width
+            self.height = board.height
+            (_horizon_ls, _vertical_ls) = pair_nearest_nodes(board.node_ls)
+            self.max_actions = (len(_horizon_ls) + len(_vertical_ls)) * 2
+        self.node_cnt = node_cnt
+        self.fixed_board = board
+        self.rng = random.Random(seed)
+        self.max_steps = max_steps
+        self.strict = strict
+        self.illegal_reward = illegal_reward
+        self.board_cls = board_cls
+        self.obs = np.zeros((OBS_CHANNELS, self.height, self.width), np.int8) if out_obs is None else out_obs
+        self.mask = np.zeros(self.max_actions, np.bool_) if out_mask is None else out_mask
+        self.out_remain = out_remain if board is None else None
+        if self.obs.shape != (OBS_CHANNELS, self.height, self.width) or len(self.mask) < self.max_actions:
+            raise Exception('Observation or mask array does not fit the board')
+        self.board : Board = None
+        self.step_cnt = 0
+
+    def _new_board(self) -> Board:
+        if self.fixed_board is not None:
+            self.fixed_board.clear_lines()
+            return self.fixed_board
+        _board = self.board_cls(self.width, self.height)
+        _board.generate(self.node_cnt, seed=self.rng.getrandbits(63))
+        return _board
+
+    def reset(self) -> np.ndarray:
+        """Start an episode on a board without lines, return the observation"""
+        _board = self._new_board()
+        self.board = _board
+        self.step_cnt = 0
+        _node_ls = _board.node_ls
+        _idx_of = {id(_node): _i for (_i, _node) in enumerate(_node_ls)}
+
+        # pairs of neighbour nodes, horizontal pairs then vertical pairs
+        (_horizon_ls, _vertical_ls) = pair_nearest_nodes(_node_ls)
+        self.pair_ls : list[tuple[Node, Node]] = _horizon_ls + _vertical_ls
+        if len(self.pair_ls) * 2 > len(self.mask):
+            raise Exception('Board has more actions than the mask')
+        _pair_cnt = len(self.pair_ls)
+        self.pair_a = np.array([_idx_of[id(_a)] for (_a, _) in self.pair_ls], np.int32)
+        self.pair_b = np.array([_idx_of[id(_b)] for (_, _b) in self.pair_ls], np.int32)
+        self.line_cnt = np.zeros(_pair_cnt, np.int8)
+        # number of pairs with lines crossing each pair
+        self.block = np.zeros(_pair_cnt, np.int32)
+        self.cross_ls : list[list[int]] = [[] for _ in range(_pair_cnt)]
+        for (_h, _v) in find_crossings(_horizon_ls, _vertical_ls):
+            _v += len(_horizon_ls)
+            self.cross_ls[_h].append(_v)
+            self.cross_ls[_v].append(_h)
+        self.horizon_cnt = len(_horizon_ls)
+        # pairs of each node, to update the mask when a node gets all its lines in strict mode
+        self.node_pair_ls : list[list[int]] = [[] for _ in _node_ls]
+        for _p in range(_pair_cnt):
+            self.node_pair_ls[self.pair_a[_p]].append(_p)
+            self.node_pair_ls[self.pair_b[_p]].append(_p)
+        self.remain = np.array([_node.n for _node in _node_ls], np.int8)
+        if self.out_remain is not None:
+            self.out_remain[:] = self.remain
+            self.remain = self.out_remain
+        self.row = np.array([_node.position.row for _node in _node_ls], np.int32)
+        self.col = np.array([_node.position.col for _node in _node_ls], np.int32)
+
+        self.obs[:] = 0
+        self.obs[OBS_NUMBER, self.row, self.col] = self.remain
+        self.obs[OBS_REMAIN, self.row, self.col] = self.remain
+        self.mask[:] = False
+        self.mask[0:_pair_cnt*2:2] = True
+        return self.obs
+
+    def _update_mask(self, pair:int):
+        _cnt = self.line_cnt[pair]
+        _can_draw = _cnt < 2 and self.block[pair] == 0
+        if _can_draw and self.strict:
+            _can_draw = self.remain[self.pair_a[pair]] > 0 and self.remain[self.pair_b[pair]] > 0
+        self.mask[pair * 2 + ACTION_DRAW] = _can_draw
+        self.mask[pair * 2 + ACTION_ERASE] = _cnt > 0
+
+    def _apply(self, pair:int, delta:int):
+        """Add `delta` lines to `pair` on the board and in the arrays"""
+        (_a, _b) = (self.pair_a[pair], self.pair_b[pair])
+        (_node, _to_node) = self.pair_ls[pair]
+        if delta > 0:
+            self.board.draw_line(_node, _to_node)
+        else:
+            self.board.erase_line(_node, Direction.RIGHT() if pair < self.horizon_cnt else Direction.BOTTOM())
+        _cnt = self.line_cnt[pair] + delta
+        self.line_cnt[pair] = _cnt
+        (_row, _col) = (self.row[_a], self.col[_a])
+        if pair < self.horizon_cnt:
+            self.obs[OBS_RIGHT, _row, _col:self.col[_b]] = _cnt
+        else:
+            self.obs[OBS_BOTTOM, _row:self.row[_b], _col] = _cnt
+        self.remain[_a] -= delta
+        self.remain[_b] -= delta
+        self.obs[OBS_REMAIN, _row, _col] = self.remain[_a]
+        self.obs[OBS_REMAIN, self.row[_b], self.col[_b]] = self.remain[_b]
+
+        # the first line blocks the crossing pairs, the last line frees them
+        if (delta > 0 and _cnt == 1) or (delta < 0 and _cnt == 0):
+            for _p in self.cross_ls[pair]:
+                self.block[_p] += delta
+                self._update_mask(_p)
+        if self.strict:
+            for _p in self.node_pair_ls[_a] + self.node_pair_ls[_b]:
+                self._update_mask(_p)
+        else:
+            self._update_mask(pair)
+
+    def step(self, action:int) -> tuple[np.ndarray, float, bool, dict]:
+        """
+            Draw or erase a line
+            Return:
+                (observation, reward, done, info), the reward is 1 when the puzzle is finished,
+                info has if the puzzle is finished and if the action was illegal
+        """
+        self.step_cnt += 1
+        _illegal = not (0 <= action < len(self.mask) and self.mask[action])
+        if _illegal:
+            _reward = self.illegal_reward
+            _finished = False
+        else:
+            (_pair, _kind) = divmod(int(action), 2)
+            self._apply(_pair, 1 if _kind == ACTION_DRAW else -1)
+            _finished = self.board.is_finish()
+            _reward = 1.0 if _finished else 0.0
+        _done = _finished or (self.max_steps is not None and self.step_cnt >= self.max_steps)
+        return (self.obs, _reward, _done, {'finished': _finished, 'illegal': _illegal})
+
+    def legal_actions(self) -> np.ndarray:
+        return np.flatnonzero(self.mask)
+
+class VecHashiEnv:
+    """
+        `count` environments of generated puzzles of the same size stepped together,
+        observations, masks and the remaining number of the nodes of all of them are rows of shared arrays,
+        an environment is reset when it is done.\n
+        `step` checks the actions against the masks, computes the rewards and the done flags on the whole arrays,
+        only the boards of the legal actions and the connectivity of the boards with every node satisfied
+        are visited one environment at a time
+    """
+    def __init__(self, count:int, width:int, height:int, node_cnt:int, seed:int=0, **kwargs):
+        """
+            Args:
+                `seed`: base seed, environment i uses `task_seed(seed, i)`
+                `kwargs`: passed to each `HashiEnv`
+        """
+        self.obs = np.zeros((count, OBS_CHANNELS, height, width), np.int8)
+        self.mask = np.zeros((count, node_cnt * 4), np.bool_)
+        self.remain = np.zeros((count, node_cnt), np.int8)
+        # steps of the episode of each environment, the `step_cnt` of the environments is not used
+        self.step_cnt = np.zeros(count, np.int64)
+        self.env_ls = [
+            HashiEnv(width=width, height=height, node_cnt=node_cnt, seed=task_seed(seed, _i),
+                     out_obs=self.obs[_i], out_mask=self.mask[_i], out_remain=self.remain[_i], **kwargs)
+            for _i in range(count)
+        ]
+        self.max_steps = kwargs.get('max_steps')
+        self.illegal_reward = kwargs.get('illegal_reward', -0.1)
+
+    def __len__(self):
+        return len(self.env_ls)
+
+    def reset(self) -> np.ndarray:
+        for _env in self.env_ls:
+            _env.reset()
+        self.step_cnt[:] = 0
+        return self.obs
+
+    def step(self, actions) -> tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+        """
+            Step each environment with its action
+            Args:
+                `actions`: array of one action per environment
+            Return:
+                (observations, rewards, dones, info) as arrays with one row per environment,
+                info has the arrays finished and illegal, an environment done is reset
+                so its observation is the first of the next episode
+        """
+        _actions = np.asarray(actions, np.int64)
+        _rows = np.arange(len(self.env_ls))
+        _in_range = (_actions >= 0) & (_actions < self.mask.shape[1])
+        _legal = _in_range & self.mask[_rows, np.where(_in_range, _actions, 0)]
+        (_pair_ls, _kind_ls) = np.divmod(_actions, 2)
+        for _i in np.flatnonzero(_legal).tolist():
+            self.env_ls[_i]._apply(int(_pair_ls[_i]), 1 if _kind_ls[_i] == ACTION_DRAW else -1)
+        self.step_cnt += 1
+
+        # a board can only be finished when all its nodes have just enough lines,
+        # the connectivity is checked on those boards only
+        _finished_ls = _legal & np.all(self.remain == 0, axis=1)
+        for _i in np.flatnonzero(_finished_ls).tolist():
+            _finished_ls[_i] = self.env_ls[_i].board.is_finish()
+        _reward_ls = np.where(_legal, _finished_ls, self.illegal_reward).astype(np.float32)
+        _done_ls = _finished_ls.copy()
+        if self.max_steps is not None:
+            _done_ls |= self.step_cnt >= self.max_steps
+        for _i in np.flatnonzero(_done_ls).tolist():
+            self.env_ls[_i].reset()
+        self.step_cnt[_done_ls] = 0
+        return (self.obs, _reward_ls, _done_ls, {'finished': _finished_ls, 'illegal': ~_legal})
+
+    def sample_actions(self, rng:np.random.Generator) -> np.ndarray:
+        """A random legal action of each environment, 0 for an environment without any"""
+        _score = rng.random(self.mask.shape) * self.mask
+        return np.argmax(_score, axis=1)
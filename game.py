@@ -2,16 +2,76 @@ from __future__ import annotations
 
 from structs import *
 from board import *
+from render import Renderer
 from colorama import Fore, Style
+from array import array
+import os
+import sys
+
+# input to scroll the board on a terminal, (columns, rows) to move
+SCROLL_KEYS = {'w': (0, -4), 's': (0, 4), 'a': (-4, 0), 'd': (4, 0)}
+
+# actions by their code in a packed move, see `pack_move`
+ACTIONS = ('d', 'dd', 'e', 'ee', 'r')
+_ACTION_CODE = {_action: _i for (_i, _action) in enumerate(ACTIONS)}
+_REVERSE_ACTION = {'d': 'e', 'e': 'd', 'dd': 'ee', 'ee': 'dd'}
+
+# status of a move, see `Game.apply_moves`
+MOVE_OK = 0
+MOVE_NO_NODE = 1
+MOVE_INVALID = 2
+MOVE_NO_NEIGHBOUR = 3
+MOVE_FULL = 4
+MOVE_NO_LINE = 5
+MOVE_NO_UNDO = 6
+MOVE_MESSAGE = (
+  None,
+  'No node at this position',
+  'Invalid direction or action',
+  'Cannot draw line there',
+  'Cannot draw line there',
+  'No line to erase',
+  'No move to undo',
+)
+
+def pack_move(width:int, row:int, col:int, dir_idx:int, action:str) -> int:
+  """
+    Pack a move into an int, `((row * width + col) * 4 + dir_idx) * 8 + action code`,
+    the action code is its index in `ACTIONS`, an undo is packed with any position and direction
+  """
+  return ((row * width + col) * 4 + dir_idx) * 8 + _ACTION_CODE[action]
+
+def unpack_move(width:int, move:int) -> tuple[int, int, int, str]:
+  """(row, col, direction index, action) of a packed move, the action is None for an invalid code"""
+  (_rest, _code) = divmod(move, 8)
+  (_idx, _dir_idx) = divmod(_rest, 4)
+  (_row, _col) = divmod(_idx, width)
+  return (_row, _col, _dir_idx, ACTIONS[_code] if _code < len(ACTIONS) else None)
 
 class Game:
-  def __init__(self, row, col, node_cnt):
-    self.board = Board(row, col)
-    self.board.generate(node_cnt)
+  def __init__(self, row=None, col=None, node_cnt=None, board:Board=None):
+    """
+      Start a game on `board`, or on a new board of `row` x `col` with `node_cnt` nodes
+    """
+    if board is None:
+      board = Board(row, col)
+      board.generate(node_cnt)
+    self.board = board
     
     # move history, each element is a tuple of (from_node, direction, action)
     self.move_history : list[tuple[Node, Direction, str]] = []
     
+    # log the moves are appended to, see `record`
+    self.replay_log = None
+    
+    # forced bridges kept up to date with the moves, made by the first `hint`
+    self.hint_engine = None
+  
+  def record(self, path:str):
+    """Append every move from now on to a new replay log at `path`, or a numbered file next to it if it exists, see replay.py"""
+    from replay import ReplayWriter
+    self.replay_log = ReplayWriter(path, self.board)
+    
   def parse_input(self, move_input) -> tuple[Node, Direction, str]:
     """
       Parse input to get from_node, direction, action
@@ -61,88 +121,241 @@ class Game:
     
     return (from_node, direction, action)
   
-  def handle_action(self, from_node : Node, direction : Direction, action : str):
+  def handle_action(self, from_node : Node, direction : Direction, action : str) -> str:
+    """
+      Apply an action, raise an exception if it cannot be done
+      Return:
+        the action done, 'e' for 'ee' on a single line, to be added to the move history
+    """
     # undo
     if action == 'r':
       if len(self.move_history) == 0:
-        raise Exception('No move to undo')
+        raise Exception(MOVE_MESSAGE[MOVE_NO_UNDO])
       (from_node, direction, action) = self.move_history.pop()
-      
-      # reverse action
-      if action == 'd':
+      action = _REVERSE_ACTION[action]
+    
+    (status, action) = self._apply_action(from_node, direction, action)
+    if status != MOVE_OK:
+      raise Exception(MOVE_MESSAGE[status])
+    return action
+  
+  def _apply_action(self, from_node : Node, direction : Direction, action : str) -> tuple[int, str]:
+    """
+      Apply a draw or erase action without touching the move history
+      Return:
+        (status, action done), the board is unchanged unless the status is `MOVE_OK`
+    """
+    board = self.board
+    if board.forked:
+      from_node = board.resolve(from_node)
+    connected_line_cnt = from_node.line_cnt[direction.idx]
+    
+    # erase a line, or two lines with 'ee'
+    if action == 'e' or action == 'ee':
+      if connected_line_cnt == 0:
+        return (MOVE_NO_LINE, action)
+      board.erase_line(from_node, direction)
+      if action == 'ee' and connected_line_cnt == 2:
+        board.erase_line(from_node, direction)
+      else:
         action = 'e'
-      elif action == 'e':
-        action = 'd'
-      elif action == 'dd':
-        action = 'ee'
-      elif action == 'ee':
-        action = 'dd'      
+      if self.hint_engine is not None:
+        self.hint_engine.update(from_node, direction)
+      return (MOVE_OK, action)
     
     # get to_node
-    if from_node.get_node_in_dir(direction) is None:
-      to_node = self.board.get_nearest_non_empty(from_node, direction)
-      if not isinstance(to_node, Node):
-        raise Exception('Cannot draw line there')
-    else:
-      to_node = from_node.get_node_in_dir(direction)  
+    to_node = from_node.link[direction.idx]
+    if to_node is None:
+      to_node = board.get_neighbour(from_node, direction)
+      if to_node is None:
+        return (MOVE_NO_NEIGHBOUR, action)
     
-    connected_line_cnt = from_node.get_line_cnt_in_dir(direction)
     # draw a line
     if action == 'd':
       if connected_line_cnt == 2:
-        raise Exception('Cannot draw line there')
-      self.board.draw_line(from_node, to_node)
+        return (MOVE_FULL, action)
+      board.draw_line(from_node, to_node)
     # draw a double line
     elif action == 'dd':
       if connected_line_cnt != 0:
-        raise Exception('Cannot draw line there')
-      self.board.draw_line(from_node, to_node)
-      self.board.draw_line(from_node, to_node)
-    # erase a line
-    elif action == 'e':
-      if connected_line_cnt > 0:
-        self.board.erase_line(from_node, direction)
-    # double erase line
-    elif action == 'ee':
-      if connected_line_cnt == 2:
-        self.board.erase_line(from_node, direction)
-      if connected_line_cnt == 1:
-        self.board.erase_line(from_node, direction)
+        return (MOVE_FULL, action)
+      board.draw_line(from_node, to_node)
+      board.draw_line(from_node, to_node)
+    else:
+      return (MOVE_INVALID, action)
+    if self.hint_engine is not None:
+      self.hint_engine.update(from_node, direction)
+    return (MOVE_OK, action)
+  
+  def hint(self) -> tuple[Node, Node, int]:
+    """
+      A bridge forced by the puzzle and the lines drawn, see hint.py
+      Return:
+        (node, node, number of lines it must have at least), None if no bridge is forced
+    """
+    if self.hint_engine is None:
+      from hint import HintEngine
+      self.hint_engine = HintEngine(self.board)
+    if not self.hint_engine.consistent:
+      raise Exception('The lines drawn cannot be part of a solution')
+    return self.hint_engine.hint()
+  
+  def apply_moves(self, moves, stop_on_error:bool=False) -> dict:
+    """
+      Apply a batch of moves without input or output, a move that cannot be done is skipped
+      and gets a status code instead of raising an exception
+      Args:
+        `moves`: iterable of (from_node, direction, action) like `parse_input` returns,
+          or of ints packed by `pack_move` like an `array('I')` or a numpy array
+        `stop_on_error`: stop at the first move that cannot be done
+      Return:
+        dict of
+          status: `array('B')` of the status of each move applied, `MOVE_OK` or one of the other `MOVE_` codes
+          applied: number of moves done
+          finished: if the board is finished after the moves
+          hash: `state_hash` of the board after the moves
+    """
+    board = self.board
+    width = board.width
+    height = board.height
+    box_at = board._box_at
+    apply_action = self._apply_action
+    history = self.move_history
+    status_ls = array('B')
+    applied = 0
+    # packed moves to append to the replay log
+    log_ls = None if self.replay_log is None else array('I')
+    for move in moves:
+      if type(move) is tuple:
+        (from_node, direction, action) = move
+      else:
+        # packed move, see `pack_move`
+        move = int(move)
+        code = move & 7
+        action = ACTIONS[code] if code < len(ACTIONS) else None
+        from_node = None
+        direction = DIRECTIONS[(move >> 3) & 3]
+        if action is not None and action != 'r':
+          (row, col) = divmod(move >> 5, width)
+          from_node = box_at(row, col) if 0 <= row < height else None
+      
+      if action == 'r':
+        if len(history) == 0:
+          status = MOVE_NO_UNDO
+        else:
+          (from_node, direction, action) = history.pop()
+          (status, _) = apply_action(from_node, direction, _REVERSE_ACTION[action])
+      elif action not in _REVERSE_ACTION:
+        status = MOVE_INVALID
+      elif not isinstance(from_node, Node):
+        status = MOVE_NO_NODE
+      else:
+        (status, action) = apply_action(from_node, direction, action)
+        if status == MOVE_OK:
+          history.append((from_node, direction, action))
+      
+      status_ls.append(status)
+      if status == MOVE_OK:
+        applied += 1
+        if log_ls is not None:
+          if type(move) is not tuple:
+            log_ls.append(move)
+          elif move[2] == 'r':
+            log_ls.append(pack_move(width, 0, 0, 0, 'r'))
+          else:
+            log_ls.append(pack_move(width, move[0].position.row, move[0].position.col, move[1].idx, move[2]))
+      elif stop_on_error:
+        break
+    
+    if log_ls is not None and len(log_ls) > 0:
+      self.replay_log.add_moves(log_ls)
+    return {
+      'status': status_ls,
+      'applied': applied,
+      'finished': board.is_finish(),
+      'hash': board.state_hash(),
+    }
   
   def start(self):
+    # on a terminal only the changed rows are redrawn, otherwise the whole board is printed each move
+    renderer = Renderer(self.board) if sys.stdout.isatty() else None
+    message = None
     while not self.board.is_finish():
-      self.board.print_board()
+      if renderer is None:
+        self.board.print_board()
+      else:
+        renderer.render()
+        if message is not None:
+          print(message, end='\n\n')
+          message = None
       move = input('Move: ')
       print()
       
+      # scroll the board
+      if renderer is not None and move in SCROLL_KEYS:
+        renderer.scroll(*SCROLL_KEYS[move])
+        continue
+      
+      if move == 'h':
+        try:
+          hint = self.hint()
+          if hint is None:
+            message = f"{Fore.YELLOW}No bridge is forced now{Style.RESET_ALL}"
+          else:
+            (a, b, cnt) = hint
+            message = f"{Fore.CYAN}Hint: {cnt} line{'s' if cnt > 1 else ''} between ({a.position.col:02d}, {a.position.row:02d}) and ({b.position.col:02d}, {b.position.row:02d}){Style.RESET_ALL}"
+        except Exception as e:
+          message = f"{Fore.YELLOW}{e}{Style.RESET_ALL}"
+        if renderer is None:
+          print(message, end='\n\n')
+          message = None
+        continue
+      
       try:  
         # parse input
         (from_node, direction, action) = self.parse_input(move)
         
         # actions
-        self.handle_action(from_node, direction, action)
+        action = self.handle_action(from_node, direction, action)
         
         # add to move history
-        if action != 'r':
+        if move != 'r':
           self.move_history.append((from_node, direction, action))
+        if self.replay_log is not None:
+          self.replay_log.add_action(from_node, direction, 'r' if move == 'r' else action)
 
       except Exception as e:
-        print(f"{Fore.YELLOW}{e}{Style.RESET_ALL}", end='\n\n')
+        message = f"{Fore.YELLOW}{e}{Style.RESET_ALL}"
+        if renderer is None:
+          print(message, end='\n\n')
+          message = None
         continue
       
-    self.board.print_board()
+    if renderer is None:
+      self.board.print_board()
+    else:
+      renderer.render()
+    if self.replay_log is not None:
+      self.replay_log.finish(self.board)
     print(f"{Fore.GREEN}Game over{Style.RESET_ALL}")
     
 if __name__ == '__main__':
   print(f"{Fore.GREEN}########## Hashi ##########{Style.RESET_ALL}")
   
-  # setup game
-  print(f"{Fore.CYAN}==== Setup game ====")
-  print(f'If you do not know how to setup, try 9 for row, 6 for col, 15 for number of node{Style.RESET_ALL}')
-  row = int(input('Row: '))
-  col = int(input('Col: '))
-  node_cnt = int(input('Number of node: '))
-  print()
+  # setup game, a puzzle can be loaded with `python game.py {file} {index in library}`
+  board = None
+  if len(sys.argv) > 1:
+    import puzzle_io
+    board = puzzle_io.load(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+  else:
+    print(f"{Fore.CYAN}==== Setup game ====")
+    print(f'If you do not know how to setup, try 9 for row, 6 for col, 15 for number of node{Style.RESET_ALL}')
+    row = int(input('Row: '))
+    col = int(input('Col: '))
+    node_cnt = int(input('Number of node: '))
+    print()
+    board = Board(row, col)
+    board.generate(node_cnt)
   
   # print player guide
   print(f"{Fore.CYAN}===== Player guide ====={Style.RESET_ALL}")
@@ -153,8 +366,21 @@ if __name__ == '__main__':
   print(f'{Fore.YELLOW}Example{Style.RESET_ALL}: "010208d" for draw a single line from (01, 02) to the node in the up direction (8)')
   print()
   print(f'{Fore.YELLOW}Note{Style.RESET_ALL}: Enter "r" only to undo a move')
+  print(f'{Fore.YELLOW}Note{Style.RESET_ALL}: Enter "h" for a hint')
+  print(f'{Fore.YELLOW}Note{Style.RESET_ALL}: Enter "w", "a", "s" or "d" to scroll a board larger than the terminal')
   print()
+  # the board is drawn on a cleared terminal
+  if sys.stdout.isatty():
+    input('Press enter to start')
   
-  # start game
-  game = Game(row, col, node_cnt)
+  # opt-in profiling, see instrument.py
+  import instrument
+  instrument.enable_from_env()
+
+  # start game, the moves are logged to the file in `HASHI_REPLAY` if it is set, see replay.py
+  game = Game(board=board)
+  if os.environ.get('HASHI_REPLAY'):
+    game.record(os.environ['HASHI_REPLAY'])
+    if game.replay_log.path != os.environ['HASHI_REPLAY']:
+      print(f"{Fore.YELLOW}{os.environ['HASHI_REPLAY']} exists, the moves are logged to {game.replay_log.path}{Style.RESET_ALL}")
   game.start()
\ No newline at end of file
@@ -0,0 +1,433 @@
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from time import perf_counter
+from typing import Iterator
+
+from structs import *
+from board import Board
+from solver import Solver, _luby
+from puzzle_io import iter_puzzles
+
+# bump when the rules or the levels change, cached grades of other versions are graded again
+GRADE_VERSION = 2
+
+# deduction rules, in the order a player learns them
+RULE_FULL = 'full'                  # a node needs every line its neighbours allow
+RULE_SATISFIED = 'satisfied'        # a node has all its lines, its other edges are closed
+RULE_DEGREE = 'degree'              # the other edges of a node cannot give all its lines, so this edge has some
+RULE_ISOLATION = 'isolation'        # two nodes joined by all their lines would be cut off from the rest
+RULE_CROSSING = 'crossing'          # a line closes the edges crossing it
+RULE_CONNECTIVITY = 'connectivity'  # the only way between two parts of the board must have a line,
+                                    # and a line cannot close off a group of nodes from the rest
+RULES = (RULE_FULL, RULE_SATISFIED, RULE_DEGREE, RULE_ISOLATION, RULE_CROSSING, RULE_CONNECTIVITY)
+
+LEVEL_EASY = 0
+LEVEL_MEDIUM = 1
+LEVEL_HARD = 2
+LEVEL_EXPERT = 3
+LEVEL_NAMES = ('easy', 'medium', 'hard', 'expert')
+# level of a puzzle that needs the rule, a puzzle that needs search is `LEVEL_EXPERT`
+_RULE_LEVEL = {
+    RULE_FULL: LEVEL_EASY, RULE_SATISFIED: LEVEL_EASY, RULE_DEGREE: LEVEL_EASY,
+    RULE_ISOLATION: LEVEL_MEDIUM, RULE_CROSSING: LEVEL_MEDIUM,
+    RULE_CONNECTIVITY: LEVEL_HARD,
+}
+# effort of each use of a rule and of each search decision in the score
+_RULE_WEIGHT = {
+    RULE_FULL: 1, RULE_SATISFIED: 1, RULE_DEGREE: 2,
+    RULE_ISOLATION: 3, RULE_CROSSING: 3, RULE_CONNECTIVITY: 5,
+}
+_DECISION_WEIGHT = 10
+
+class _TraceSolver(Solver):
+    """`Solver` that counts the rules used by its propagation and the decisions of its search"""
+    def __init__(self, board):
+        super().__init__(board)
+        self.rule_cnt = {_rule: 0 for _rule in RULES}
+        self.decision_cnt = 0
+        # edges the isolation rule may take a line from, it is applied by `_isolate` and not by `_init_domain`
+        self.isolation_ls : list[int] = []
+
+    def _init_domain(self):
+        super()._init_domain()
+        for (_e, (_a, _b, _)) in enumerate(self.edge_ls):
+            _full = min(2, self.need[_a], self.need[_b])
+            if self.hi[_e] < _full:
+                self.hi[_e] = _full
+                self.isolation_ls.append(_e)
+        self.open_cnt = [0] * len(self.node_ls)
+        for (_e, (_a, _b, _)) in enumerate(self.edge_ls):
+            if self.lo[_e] < self.hi[_e]:
+                self.open_cnt[_a] += 1
+                self.open_cnt[_b] += 1
+
+    def _assign(self, e:int, v:int) -> bool:
+        self.decision_cnt += 1
+        return super()._assign(e, v)
+
+    def _close_crossing(self, e:int, queue:list[int]) -> bool:
+        """Close the edges crossing `e`, which got its first line, return False if one of them has lines"""
+        for _c in self.cross_ls[e]:
+            if self.lo[_c] > 0:
+                return False
+            if self.hi[_c] > 0:
+                self._set(_c, 0, 0)
+                self.rule_cnt[RULE_CROSSING] += 1
+                queue.extend(self.edge_ls[_c][:2])
+        return True
+
+    def _deduce(self, queue:list[int]) -> bool:
+        """
+            Tighten the bounds from the numbers of the nodes until nothing changes, like `_propagate`,
+            counting the rule behind each change
+            Args:
+                `queue`: idx of nodes to be checked
+            Return:
+                False if contradiction is found
+        """
+        _lo_ls = self.lo
+        _hi_ls = self.hi
+        _rule_cnt = self.rule_cnt
+        _queued = set(queue)
+        _queue = deque(_queued)
+        while len(_queue) > 0:
+            _i = _queue.popleft()
+            _queued.discard(_i)
+            _need = self.need[_i]
+            _edges = self.node_edge_ls[_i]
+            _sum_lo = sum(_lo_ls[_e] for _e in _edges)
+            _sum_hi = sum(_hi_ls[_e] for _e in _edges)
+            if _sum_lo > _need or _sum_hi < _need:
+                return False
+            if _sum_lo == _sum_hi:
+                continue
+            _rule = RULE_FULL if _sum_hi == _need else RULE_SATISFIED if _sum_lo == _need else RULE_DEGREE
+
+            _next = []
+            for _e in _edges:
+                _lo = max(_lo_ls[_e], _need - (_sum_hi - _hi_ls[_e]))
+                _hi = min(_hi_ls[_e], _need - (_sum_lo - _lo_ls[_e]))
+                if _lo > _hi:
+                    return False
+                if _lo == _lo_ls[_e] and _hi == _hi_ls[_e]:
+                    continue
+                if _lo_ls[_e] == 0 and _lo > 0 and not self._close_crossing(_e, _next):
+                    return False
+                _sum_lo += _lo - _lo_ls[_e]
+                _sum_hi += _hi - _hi_ls[_e]
+                self._set(_e, _lo, _hi)
+                _rule_cnt[_rule] += 1
+                _next.extend(self.edge_ls[_e][:2])
+            for _j in _next:
+                if _j not in _queued:
+                    _queued.add(_j)
+                    _queue.append(_j)
+        return True
+
+    def _isolate(self) -> tuple[bool, bool]:
+        """
+            Take a line from each edge that could still give both of its nodes all their lines, and propagate
+            Return:
+                (False if contradiction is found, True if any bound changed)
+        """
+        _queue = []
+        for _e in self.isolation_ls:
+            (_a, _b, _) = self.edge_ls[_e]
+            if self.hi[_e] != self.need[_a] or self.hi[_e] != self.need[_b]:
+                continue
+            if self.lo[_e] == self.hi[_e]:
+                return (False, True)
+            self._set(_e, self.lo[_e], self.hi[_e] - 1)
+            self.rule_cnt[RULE_ISOLATION] += 1
+            _queue.extend(self.edge_ls[_e][:2])
+        if len(_queue) == 0:
+            return (True, False)
+        return (self._deduce(_queue), True)
+
+    def _bridges(self) -> list[int]:
+        """Edges whose closing would split the graph of the edges still open (Tarjan, without recursion)"""
+        _hi_ls = self.hi
+        _adj_ls = self.adj_ls
+        _disc = [-1] * len(self.node_ls)
+        _low = [0] * len(self.node_ls)
+        _time = 0
+        _res = []
+        for _s in range(len(self.node_ls)):
+            if _disc[_s] != -1:
+                continue
+            _disc[_s] = _low[_s] = _time
+            _time += 1
+            # (node idx, edge idx from its parent, iterator over its neighbours)
+            _stack = [(_s, -1, iter(_adj_ls[_s]))]
+            while len(_stack) > 0:
+                (_i, _parent_e, _it) = _stack[-1]
+                _descend = False
+                for (_e, _j) in _it:
+                    if _hi_ls[_e] == 0 or _e == _parent_e:
+                        continue
+                    if _disc[_j] == -1:
+                        _disc[_j] = _low[_j] = _time
+                        _time += 1
+                        _stack.append((_j, _e, iter(_adj_ls[_j])))
+                        _descend = True
+                        break
+                    if _disc[_j] < _low[_i]:
+                        _low[_i] = _disc[_j]
+                if _descend:
+                    continue
+                _stack.pop()
+                if len(_stack) > 0:
+                    _p = _stack[-1][0]
+                    if _low[_i] < _low[_p]:
+                        _low[_p] = _low[_i]
+                    if _low[_i] > _disc[_p]:
+                        _res.append(_parent_e)
+        return _res
+
+    def _connect(self) -> tuple[bool, bool]:
+        """
+            Give a line to each open bridge without lines, take a line from each edge whose last line
+            would leave a group of nodes without any line to give, and propagate
+            Return:
+                (False if contradiction is found, True if any bound changed)
+        """
+        _queue = []
+        # groups joined by lines already, with the lines their nodes still need
+        _node_cnt = len(self.node_ls)
+        _set = UnionFind(range(_node_cnt))
+        for (_e, (_a, _b, _)) in enumerate(self.edge_ls):
+            if self.lo[_e] > 0:
+                _set.union(_a, _b)
+        _remain = {}
+        _size = {}
+        for _i in range(_node_cnt):
+            _root = _set.find(_i)
+            _remain[_root] = _remain.get(_root, 0) + self.need[_i] - sum(self.lo[_e] for _e in self.node_edge_ls[_i])
+            _size[_root] = _size.get(_root, 0) + 1
+        for (_e, (_a, _b, _)) in enumerate(self.edge_ls):
+            (_lo, _hi) = (self.lo[_e], self.hi[_e])
+            if _lo == _hi:
+                continue
+            (_root_a, _root_b) = (_set.find(_a), _set.find(_b))
+            if _root_a == _root_b:
+                (_left, _group) = (_remain[_root_a], _size[_root_a])
+            else:
+                (_left, _group) = (_remain[_root_a] + _remain[_root_b], _size[_root_a] + _size[_root_b])
+            if _group < _node_cnt and _left == 2 * (_hi - _lo):
+                self._set(_e, _lo, _hi - 1)
+                self.rule_cnt[RULE_CONNECTIVITY] += 1
+                _queue.extend(self.edge_ls[_e][:2])
+
+        for _e in self._bridges():
+            if self.lo[_e] > 0:
+                continue
+            if not self._close_crossing(_e, _queue):
+                return (False, True)
+            self._set(_e, 1, self.hi[_e])
+            self.rule_cnt[RULE_CONNECTIVITY] += 1
+            _queue.extend(self.edge_ls[_e][:2])
+        if len(_queue) == 0:
+            return (True, False)
+        return (self._deduce(_queue), True)
+
+def grade(board:Board) -> dict:
+    """
+        Grade a puzzle by solving it like a player: the easiest rules are applied until they find nothing,
+        then the isolation rule, then the connectivity rule, and a search only when no rule helps anymore.
+        A rule is counted only when it changes a bound.
+        Lines drawn on the board are ignored
+        Return:
+            dict of layout_hash, nodes, level (None if the puzzle has no solution), grade (name of the level),
+            rules (number of uses of each rule), decisions (of the search, 0 if the rules solve it), score and version
+    """
+    _solver = _TraceSolver(board)
+    if len(_solver.node_ls) == 0:
+        raise Exception('Board has no node')
+    _solver._init_domain()
+
+    _ok = _solver._deduce(list(range(len(_solver.node_ls)))) and _solver._is_connectable()
+    while _ok and sum(_solver.open_cnt) > 0:
+        (_ok, _changed) = _solver._isolate()
+        if _ok and not _changed:
+            (_ok, _changed) = _solver._connect()
+        _ok = _ok and _solver._is_connectable()
+        if not _changed:
+            break
+    _solver.closed.clear()
+
+    if _ok and sum(_solver.open_cnt) > 0:
+        _res = []
+        _restart = 1
+        while not _solver._search(_res, 1, _luby(_restart) * 64):
+            _restart += 1
+        _ok = len(_res) > 0
+
+    _rule_cnt = _solver.rule_cnt
+    _level = None
+    if _ok:
+        _level = max([_RULE_LEVEL[_rule] for _rule in RULES if _rule_cnt[_rule] > 0], default=LEVEL_EASY)
+        if _solver.decision_cnt > 0:
+            _level = LEVEL_EXPERT
+    return {
+        'layout_hash': board.layout_hash,
+        'nodes': len(_solver.node_ls),
+        'level': _level,
+        'grade': LEVEL_NAMES[_level] if _level is not None else 'unsolvable',
+        'rules': _rule_cnt,
+        'decisions': _solver.decision_cnt,
+        'score': sum(_rule_cnt[_rule] * _RULE_WEIGHT[_rule] for _rule in RULES) + _solver.decision_cnt * _DECISION_WEIGHT,
+        'version': GRADE_VERSION,
+    }
+
+class GradeCache:
+    """
+        Grades by `Board.layout_hash`, kept in a JSON lines file when a path is given,
+        new grades are appended as they are added so an interrupted run keeps its work
+    """
+    def __init__(self, path:str=None):
+        self.grade_map : dict[int, dict] = {}
+        self.file = None
+        if path is None:
+            return
+        if os.path.exists(path):
+            with open(path) as _file:
+                for _line in _file:
+                    try:
+                        _grade = json.loads(_line)
+                    except ValueError:
+                        # a line cut by an interrupted run
+                        continue
+                    if _grade.get('version') == GRADE_VERSION:
+                        self.grade_map[_grade['layout_hash']] = _grade
+        self.file = open(path, 'a')
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.grade_map)
+
+    def get(self, layout_hash:int) -> dict:
+        return self.grade_map.get(layout_hash)
+
+    def add(self, grade:dict):
+        self.grade_map[grade['layout_hash']] = grade
+        if self.file is not None:
+            self.file.write(json.dumps(grade) + '\n')
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def _grade_task(task:tuple[int, int, int, list[tuple[int, int, int]]]) -> tuple[int, dict]:
+    """Grade one puzzle in a worker, return (index, grade), the grade has an error message if the puzzle is invalid"""
+    (_idx, _width, _height, _island_ls) = task
+    try:
+        _board = Board(_width, _height)
+        _board.place_nodes(_island_ls)
+        return (_idx, grade(_board))
+    except Exception as e:
+        return (_idx, {'layout_hash': zobrist_layout_hash(_width, _height, _island_ls), 'error': str(e)})
+
+def _grade_chunk(task_ls:list[tuple[int, int, int, list[tuple[int, int, int]]]]) -> list[tuple[int, dict]]:
+    """Grade a chunk of puzzles in a worker, see `_grade_task`"""
+    return [_grade_task(_task) for _task in task_ls]
+
+def grade_pack(puzzles, workers:int=None, cache:GradeCache=None, chunksize:int=16,
+               max_pending:int=None) -> Iterator[dict]:
+    """
+        Grade puzzles on a process pool, grades are yielded as soon as they are ready,
+        a puzzle in the cache as soon as it is read and the others in the order of their chunks
+        Args:
+            `puzzles`: iterable of (width, height, (row, col, number) of the nodes), like `puzzle_io.iter_puzzles`,
+                it is read only as fast as the workers grade
+            `workers`: number of processes, all cores by default, 1 grades in this process
+            `cache`: grades of puzzles graded before, a puzzle in the cache is not graded again
+            `chunksize`: number of puzzles sent to a worker at once
+            `max_pending`: most chunks sent and not graded yet, 4 per worker by default,
+                so memory does not grow with the size of the pack
+        Return:
+            iterator of the grades with the index of the puzzle and if it was cached
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if cache is None:
+        cache = GradeCache()
+
+    def finish(result:tuple[int, dict]) -> dict:
+        (_idx, _grade) = result
+        if 'error' not in _grade:
+            cache.add(_grade)
+        return dict(_grade, index=_idx, cached=False)
+
+    if workers <= 1:
+        for (_idx, (_width, _height, _island_ls)) in enumerate(puzzles):
+            _grade = cache.get(zobrist_layout_hash(_width, _height, _island_ls))
+            if _grade is not None:
+                yield dict(_grade, index=_idx, cached=True)
+            else:
+                yield finish(_grade_task((_idx, _width, _height, _island_ls)))
+        return
+
+    if max_pending is None:
+        max_pending = workers * 4
+    with multiprocessing.Pool(workers) as _pool:
+        _pending : deque[multiprocessing.pool.AsyncResult] = deque()
+        _chunk = []
+        for (_idx, (_width, _height, _island_ls)) in enumerate(puzzles):
+            _grade = cache.get(zobrist_layout_hash(_width, _height, _island_ls))
+            if _grade is not None:
+                yield dict(_grade, index=_idx, cached=True)
+                continue
+            _chunk.append((_idx, _width, _height, _island_ls))
+            if len(_chunk) < chunksize:
+                continue
+            _pending.append(_pool.apply_async(_grade_chunk, (_chunk,)))
+            _chunk = []
+            if len(_pending) >= max_pending:
+                for _result in _pending.popleft().get():
+                    yield finish(_result)
+        if len(_chunk) > 0:
+            _pending.append(_pool.apply_async(_grade_chunk, (_chunk,)))
+        while len(_pending) > 0:
+            for _result in _pending.popleft().get():
+                yield finish(_result)
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser(description='Grade the difficulty of puzzles in parallel, grades are written as JSON lines')
+    _parser.add_argument('paths', nargs='+', help='libraries, JSON lines of batch.py or text puzzles')
+    _parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes, all cores by default')
+    _parser.add_argument('--chunksize', type=int, default=16)
+    _parser.add_argument('--cache', help='JSON lines file of the grades, puzzles in it are not graded again')
+    _parser.add_argument('-o', '--output', help='file to write to, stdout by default')
+    _args = _parser.parse_args()
+
+    def iter_all():
+        for _path in _args.paths:
+            yield from iter_puzzles(_path)
+
+    _file = sys.stdout if _args.output is None else open(_args.output, 'w')
+    _start = perf_counter()
+    _count = {_name: 0 for _name in LEVEL_NAMES + ('unsolvable', 'error')}
+    _cached = 0
+    try:
+        with GradeCache(_args.cache) as _cache:
+            for _grade in grade_pack(iter_all(), _args.workers, _cache, _args.chunksize):
+                _count['error' if 'error' in _grade else _grade['grade']] += 1
+                _cached += _grade['cached']
+                _file.write(json.dumps(_grade) + '\n')
+    finally:
+        if _file is not sys.stdout:
+            _file.close()
+    print('{} puzzles, {}, {} cached, {:.2f}s'.format(
+        sum(_count.values()), ', '.join('{} {}'.format(_cnt, _name) for (_name, _cnt) in _count.items()),
+        _cached, perf_counter() - _start
+    ), file=sys.stderr)
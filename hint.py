@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from structs import *
+from solver import Solver
+
+class HintEngine:
+    """
+        Bridges forced by the lines drawn on a board, kept up to date one line change at a time.\n
+        The lines drawn are lower bounds of the edges of a `Solver`, each change is propagated from the bounds
+        of the changes before it, so a hint is read without propagating anything.
+        Removing the last line change is undone from the trail, removing an older one undoes the changes after it
+        and propagates them again
+    """
+    def __init__(self, board):
+        self.board = board
+        self.solver = Solver(board)
+        _solver = self.solver
+        # edge of each (node idx, direction idx), from both ends
+        self.edge_map : dict[tuple[int, int], int] = {}
+        for (_e, (_a, _b, _dir)) in enumerate(_solver.edge_ls):
+            self.edge_map[(_a, _dir.idx)] = _e
+            self.edge_map[(_b, _dir.idx ^ 1)] = _e
+        # number of lines drawn on each edge
+        self.line_cnt = [0] * len(_solver.edge_ls)
+        # (trail length before, edge idx, lines) of each line change, oldest first,
+        # a change that tightened nothing is kept as well since the bounds it relied on may be undone
+        self.change_ls : list[tuple[int, int, int]] = []
+        # edges whose lower bound is more than the lines drawn, in the order they were found
+        self.forced : dict[int, None] = {}
+
+        # bounds of the puzzle itself, every line change starts from them
+        _solver._init_domain()
+        self.solvable = (
+            len(_solver.node_ls) > 0
+            and _solver._propagate(list(range(len(_solver.node_ls))))
+            and _solver._is_connectable()
+        )
+        _solver.closed.clear()
+        self.root_mark = len(_solver.trail)
+        # False if the lines drawn cannot be part of a solution
+        self.consistent = self.solvable
+        for _e in range(len(_solver.edge_ls)):
+            self._check(_e)
+
+        for _node in board.node_ls:
+            for _dir_idx in (RIGHT_IDX, BOTTOM_IDX):
+                if _node.line_cnt[_dir_idx] > 0:
+                    self.update(_node, DIRECTIONS[_dir_idx])
+
+    def _check(self, e:int):
+        """Update if edge `e` is forced"""
+        if self.solver.lo[e] > self.line_cnt[e]:
+            self.forced[e] = None
+        else:
+            self.forced.pop(e, None)
+
+    def _undo(self, mark:int):
+        _trail = self.solver.trail
+        _edge_ls = [_t[0] for _t in _trail[mark:]]
+        self.solver._undo(mark)
+        for _e in _edge_ls:
+            self._check(_e)
+
+    def _raise(self, e:int) -> bool:
+        """
+            Raise the lower bound of edge `e` to its lines and propagate
+            Return:
+                False if contradiction is found, the bounds are restored then
+        """
+        _solver = self.solver
+        _cnt = self.line_cnt[e]
+        _mark = len(_solver.trail)
+        if _solver.lo[e] >= _cnt:
+            # kept as a change too, the lines must be raised again if the changes before it are undone
+            self.change_ls.append((_mark, e, _cnt))
+            return True
+        _ok = _cnt <= _solver.hi[e]
+        if _ok:
+            _queue = list(_solver.edge_ls[e][:2])
+            if _solver.lo[e] == 0:
+                # the first line blocks the crossing edges
+                for _c in _solver.cross_ls[e]:
+                    if _solver.lo[_c] > 0:
+                        _ok = False
+                        break
+                    if _solver.hi[_c] > 0:
+                        _solver._set(_c, 0, 0)
+                        _queue.extend(_solver.edge_ls[_c][:2])
+            if _ok:
+                _solver._set(e, _cnt, _solver.hi[e])
+                _ok = _solver._propagate(_queue) and _solver._check_closed()
+        if not _ok:
+            self._undo(_mark)
+            return False
+        self.change_ls.append((_mark, e, _cnt))
+        for _t in _solver.trail[_mark:]:
+            self._check(_t[0])
+        return True
+
+    def _rebuild(self):
+        """Propagate all lines drawn again from the bounds of the puzzle"""
+        self._undo(self.root_mark)
+        self.change_ls.clear()
+        self.consistent = self.solvable
+        for _e in range(len(self.line_cnt)):
+            if not self.consistent:
+                break
+            if self.line_cnt[_e] > 0:
+                self.consistent = self._raise(_e)
+
+    def update(self, node:Node, dir:Direction):
+        """The number of lines from `node` in `dir` changed, read it from the node"""
+        node = self.board.resolve(node)
+        _e = self.edge_map.get((node.id, dir.idx))
+        if _e is None:
+            return
+        _old = self.line_cnt[_e]
+        _cnt = node.line_cnt[dir.idx]
+        if _cnt == _old:
+            return
+        self.line_cnt[_e] = _cnt
+        self._check(_e)
+        if _cnt > _old:
+            if self.consistent:
+                self.consistent = self._raise(_e)
+            return
+        if not self.consistent:
+            self._rebuild()
+            return
+
+        # undo back to the first change of this edge to more lines than now, then apply the changes after it again
+        _i = 0
+        while _i < len(self.change_ls) and not (self.change_ls[_i][1] == _e and self.change_ls[_i][2] > _cnt):
+            _i += 1
+        if _i == len(self.change_ls):
+            return
+        _redo_ls = [_edge for (_, _edge, _) in self.change_ls[_i+1:] if _edge != _e]
+        self._undo(self.change_ls[_i][0])
+        del self.change_ls[_i:]
+        for _edge in [_e] + _redo_ls:
+            if self.line_cnt[_edge] > 0 and not self._raise(_edge):
+                self.consistent = False
+                break
+
+    def hint(self) -> tuple[Node, Node, int]:
+        """
+            A bridge forced by the lines drawn, O(1)
+            Return:
+                (node, node, number of lines it must have at least), None if no bridge is forced
+                or the lines drawn cannot be part of a solution, see `consistent`
+        """
+        if not self.consistent or len(self.forced) == 0:
+            return None
+        _e = next(iter(self.forced))
+        (_a, _b, _) = self.solver.edge_ls[_e]
+        _node_ls = self.board.node_ls
+        return (_node_ls[_a], _node_ls[_b], self.solver.lo[_e])
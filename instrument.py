@@ -0,0 +1,219 @@
+from __future__ import annotations
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import tracemalloc
+from time import perf_counter
+
+from board import Board
+from game import Game
+
+# methods to instrument, subclasses overriding one of them are instrumented too
+TARGETS : list[tuple[type, tuple[str, ...]]] = [
+    (Board, ('generate', 'draw_line', 'erase_line', 'get_nearest_non_empty', 'is_finish', 'print_board')),
+    (Game, ('handle_action',)),
+]
+
+# 'Class.method' -> [number of calls, seconds, allocations, number of calls with their allocations counted]
+_counter_map : dict[str, list] = {}
+# (class, method name, original function) of the installed wrappers
+_patch_ls : list[tuple[type, str, object]] = []
+# if `enable` started tracemalloc, it is stopped by `disable`
+_started_tracemalloc : bool = False
+# allocations of tracemalloc and of the wrappers are not counted
+_SNAPSHOT_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+_dump_timer : threading.Timer = None
+_dump_lock = threading.Lock()
+
+def _wrap(key:str, func):
+    _counter = _counter_map.setdefault(key, [0, 0.0, 0, 0])
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _counter[1] += perf_counter() - _start
+            _counter[0] += 1
+    wrapper.__instrumented__ = True
+    return wrapper
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+def _wrap_allocations(key:str, func):
+    """Like `_wrap`, and count the memory blocks allocated by each call with tracemalloc"""
+    _counter = _counter_map.setdefault(key, [0, 0.0, 0, 0])
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _before = _snapshot()
+        _start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _counter[1] += perf_counter() - _start
+            _counter[0] += 1
+            # new blocks of each line of code, a line that freed more than it allocated does not cancel the others
+            _counter[2] += sum(_stat.count_diff for _stat in _snapshot().compare_to(_before, 'lineno') if _stat.count_diff > 0)
+            _counter[3] += 1
+    wrapper.__instrumented__ = True
+    return wrapper
+
+def _classes(cls:type) -> list[type]:
+    """`cls` and all its subclasses"""
+    _cls_ls = [cls]
+    for _sub in cls.__subclasses__():
+        _cls_ls.extend(_classes(_sub))
+    return _cls_ls
+
+def is_enabled() -> bool:
+    return len(_patch_ls) > 0
+
+def enable(allocations:bool=False):
+    """
+        Wrap the methods in `TARGETS` of the classes loaded now to count calls and wall time.\n
+        Nothing is wrapped until this is called, so disabled instrumentation costs nothing
+        Args:
+            `allocations`: also count the memory blocks each call allocates and keeps, with tracemalloc.\n
+                a snapshot of all traced blocks is taken before and after each call, so the calls get
+                many times slower and the seconds of a method include the snapshots of the methods it calls
+    """
+    global _started_tracemalloc
+    if is_enabled():
+        return
+    _wrap_func = _wrap
+    if allocations:
+        _wrap_func = _wrap_allocations
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracemalloc = True
+    for (_base, _name_ls) in TARGETS:
+        for _cls in _classes(_base):
+            for _name in _name_ls:
+                # only the class defining the method, inherited methods are already wrapped
+                _func = _cls.__dict__.get(_name)
+                if _func is None or getattr(_func, '__instrumented__', False):
+                    continue
+                _patch_ls.append((_cls, _name, _func))
+                setattr(_cls, _name, _wrap_func('{}.{}'.format(_cls.__name__, _name), _func))
+
+def disable():
+    """Restore the original methods, the counters are kept"""
+    global _started_tracemalloc
+    stop_dump()
+    while len(_patch_ls) > 0:
+        (_cls, _name, _func) = _patch_ls.pop()
+        setattr(_cls, _name, _func)
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+def reset():
+    """Set all counters to zero"""
+    for _counter in _counter_map.values():
+        _counter[0] = 0
+        _counter[1] = 0.0
+        _counter[2] = 0
+        _counter[3] = 0
+
+def stats() -> dict[str, dict]:
+    """
+        Get the counters of the called methods
+        Return:
+            dict of 'Class.method' -> dict of calls, seconds (inclusive wall time) and seconds_per_call,
+            with allocations and allocations_per_call if they were counted, see `enable`.\n
+            allocations are the memory blocks allocated by the calls and still alive when they return,
+            a temporary object freed before the call returns is not counted
+    """
+    _stat_map = {}
+    for (_key, (_calls, _seconds, _allocations, _allocation_calls)) in _counter_map.items():
+        if _calls == 0:
+            continue
+        _stat_map[_key] = {
+            'calls': _calls,
+            'seconds': _seconds,
+            'seconds_per_call': _seconds / _calls,
+        }
+        if _allocation_calls > 0:
+            _stat_map[_key]['allocations'] = _allocations
+            _stat_map[_key]['allocations_per_call'] = _allocations / _allocation_calls
+    return _stat_map
+
+def report() -> str:
+    """Counters as a table, slowest method first"""
+    _line_ls = ['{:<32} {:>10} {:>12} {:>12} {:>12}'.format('method', 'calls', 'seconds', 'us/call', 'allocs/call')]
+    _stat_ls = sorted(stats().items(), key=lambda item: item[1]['seconds'], reverse=True)
+    for (_key, _stat) in _stat_ls:
+        _allocations = _stat.get('allocations_per_call')
+        _line_ls.append('{:<32} {:>10} {:>12.6f} {:>12.2f} {:>12}'.format(
+            _key, _stat['calls'], _stat['seconds'], _stat['seconds_per_call'] * 1e6,
+            '-' if _allocations is None else '{:.2f}'.format(_allocations)
+        ))
+    return '\n'.join(_line_ls)
+
+def dump(file=None, as_json:bool=False):
+    """Write the counters to `file`, stderr by default"""
+    if file is None:
+        file = sys.stderr
+    if as_json:
+        file.write(json.dumps(stats()) + '\n')
+    else:
+        file.write(report() + '\n')
+    file.flush()
+
+def start_dump(interval:float, file=None, as_json:bool=False):
+    """
+        Dump the counters every `interval` seconds from a daemon thread, until `stop_dump` or `disable`
+        Args:
+            `file`: file to write to, stderr by default
+            `as_json`: write one JSON object per dump instead of a table
+    """
+    global _dump_timer
+    stop_dump()
+
+    # the timer of this dump, a timer replaced by another `start_dump` stops re-arming
+    _current : list[threading.Timer] = [None]
+
+    def tick():
+        global _dump_timer
+        dump(file, as_json)
+        with _dump_lock:
+            if _dump_timer is _current[0]:
+                _dump_timer = _current[0] = _new_timer()
+
+    def _new_timer() -> threading.Timer:
+        _timer = threading.Timer(interval, tick)
+        _timer.daemon = True
+        _timer.start()
+        return _timer
+
+    with _dump_lock:
+        _dump_timer = _current[0] = _new_timer()
+
+def enable_from_env():
+    """
+        Enable and start the periodic dump if `HASHI_INSTRUMENT` is set to the dump interval in seconds,
+        the dump is appended to the file `HASHI_INSTRUMENT_FILE` or written to stderr,
+        allocations are counted too if `HASHI_INSTRUMENT_ALLOCATIONS` is set to 1
+    """
+    _interval = os.environ.get('HASHI_INSTRUMENT')
+    if not _interval:
+        return
+    enable(os.environ.get('HASHI_INSTRUMENT_ALLOCATIONS') == '1')
+    _path = os.environ.get('HASHI_INSTRUMENT_FILE')
+    _file = open(_path, 'a') if _path else None
+    start_dump(float(_interval), _file)
+    # the last counters, the dump thread does not outlive the session
+    atexit.register(dump, _file)
+
+def stop_dump():
+    global _dump_timer
+    with _dump_lock:
+        if _dump_timer is not None:
+            _dump_timer.cancel()
+            _dump_timer = None
@@ -0,0 +1,277 @@
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+from collections import deque
+from time import perf_counter
+
+from structs import *
+from board import Board
+from solver import Solver, _luby
+
+# shared with the workers by `_init_worker`: the event set by the parent to cancel the tasks of the current job,
+# the number of solutions found in the job, the number of idle workers no running task gave work to yet
+# and the queue of the messages to the parent
+_stop_event = None
+_found_cnt = None
+_idle_cnt = None
+_message_queue = None
+# (job id, solver, trail length after the root propagation) of the last puzzle a worker searched
+_worker_cache : tuple[int, Solver, int] = (-1, None, 0)
+
+def _init_worker(stop_event, found_cnt, idle_cnt, message_queue):
+    global _stop_event, _found_cnt, _idle_cnt, _message_queue
+    _stop_event = stop_event
+    _found_cnt = found_cnt
+    _idle_cnt = idle_cnt
+    _message_queue = message_queue
+
+class _TaskSignal:
+    """
+        `Solver.stop` and `Solver.share` of a task in a worker.\n
+        The solutions of the task are added to the shared count as they are found. The subtrees of different tasks
+        are disjoint and a task restarts only in the subtree it kept, so a solution is counted twice only
+        if it was found before a restart in a subtree given away, it is taken out of the task then
+    """
+    def __init__(self, job:int, prefix:list[tuple[int, int]], res:list[list[int]], limit:int):
+        self.job = job
+        # (edge idx, number of lines) decided before the subtree the task searches
+        self.prefix = prefix
+        self.res = res
+        self.limit = limit
+        self.counted = 0
+        # decisions of the subtree kept by the last `put`, the search goes on under them
+        self.keep : list[tuple[int, int]] = None
+        # number of (job id, 'split', prefix_ls) messages sent to the parent
+        self.split_cnt = 0
+
+    def _publish(self):
+        """Bring the shared count up to date with the solutions of the task"""
+        if len(self.res) != self.counted:
+            with _found_cnt.get_lock():
+                _found_cnt.value += len(self.res) - self.counted
+            self.counted = len(self.res)
+
+    def is_set(self) -> bool:
+        self._publish()
+        return _stop_event.is_set() or _found_cnt.value >= self.limit
+
+    def wanted(self) -> bool:
+        """Take one idle worker, the subtrees put next are for it"""
+        if _idle_cnt.value <= 0:
+            return False
+        with _idle_cnt.get_lock():
+            if _idle_cnt.value <= 0:
+                return False
+            _idle_cnt.value -= 1
+        return True
+
+    def put(self, prefix_ls:list[list[tuple[int, int]]], keep:list[tuple[int, int]]):
+        _prefix_ls = [self.prefix + _sub for _sub in prefix_ls]
+        self.res[:] = [_lines for _lines in self.res if not any(all(_lines[_e] == _v for (_e, _v) in _p) for _p in _prefix_ls)]
+        self._publish()
+        _message_queue.put((self.job, 'split', _prefix_ls))
+        self.split_cnt += 1
+        self.keep = keep
+
+def _search_task(task:tuple[int, int, int, list[tuple[int, int, int]], list[tuple[int, int]], int]) -> tuple[list[tuple[int, ...]], int]:
+    """
+        Search the subtree of a puzzle in a worker, the subtrees it gives away to idle workers are sent to the parent
+        Args:
+            `task`: (job id, width, height, (row, col, number) of the nodes in the order of `Board.node_ls`,
+                (edge idx, number of lines) decided before the subtree, solution limit of the job),
+                the solver of a job is built once per worker, its edges are in the same order as in the parent
+        Return:
+            (number of lines of each edge of the solutions found, number of messages of subtrees given away)
+    """
+    global _worker_cache
+    (_job, _width, _height, _island_ls, _prefix, _limit) = task
+    if _stop_event.is_set():
+        return ([], 0)
+    (_cached_job, _solver, _root) = _worker_cache
+    if _cached_job != _job:
+        _board = Board(_width, _height)
+        _board.place_nodes(_island_ls)
+        _solver = Solver(_board)
+        _solver._init_domain()
+        _solver._propagate(list(range(len(_solver.node_ls))))
+        _solver.closed.clear()
+        _root = len(_solver.trail)
+        _worker_cache = (_job, _solver, _root)
+
+    _solver._undo(_root)
+    # the last value of a prefix was not tried by the search that gave it away, its subtree may be empty
+    for (_e, _v) in _prefix:
+        if not _solver._assign(_e, _v):
+            return ([], 0)
+    _res = []
+    _signal = _TaskSignal(_job, _prefix, _res, _limit)
+    _solver.stop = _solver.share = _signal
+    _restart = 1
+    while not _solver._search(_res, _limit, _luby(_restart) * 64):
+        if _signal.is_set():
+            break
+        if _signal.keep is not None:
+            # the value kept by the deepest decision was not tried yet, its subtree may be empty
+            if not all(_solver._assign(_e, _v) for (_e, _v) in _signal.keep):
+                break
+            _signal.prefix = _signal.prefix + _signal.keep
+            _signal.keep = None
+        _restart += 1
+    return ([tuple(_lines) for _lines in _res], _signal.split_cnt)
+
+class ParallelSolver:
+    """
+        Search for the solutions of a puzzle on a process pool.\n
+        The whole tree is one task at first and is split as the workers pull work: while a worker is idle
+        and no task is waiting, the next running task to check its stop gives the values left of its shallowest
+        decision to the parent, which hands them out as new tasks, and goes on with the subtree it kept.
+        The count of solutions is shared with the workers, which stop once `limit` are found in total.
+        The pool is started on the first puzzle that needs it and kept for the next puzzles, close it with `close`
+    """
+    def __init__(self, workers:int=None, min_nodes:int=100):
+        """
+            Args:
+                `workers`: number of processes, the number of cores by default, 1 searches in this process
+                `min_nodes`: puzzles with fewer nodes are searched in this process
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.min_nodes = min_nodes
+        self.pool : multiprocessing.pool.Pool = None
+        self.stop_event = None
+        self.found_cnt = None
+        self.idle_cnt = None
+        self.message_queue = None
+        self.job_cnt = 0
+        # stats of the last search
+        self.stats = {}
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def _set_idle(self, cnt:int):
+        with self.idle_cnt.get_lock():
+            self.idle_cnt.value = cnt
+
+    def _solve_lines(self, board:Board, limit:int) -> list[tuple[int, ...]]:
+        _start = perf_counter()
+        _solver = Solver(board)
+        self.stats = {'tasks': 0, 'splits': 0, 'parallel': False}
+        if len(_solver.node_ls) == 0:
+            return []
+        if self.workers <= 1 or len(_solver.node_ls) < self.min_nodes:
+            _res = [tuple(_lines) for _lines in _solver._solve_lines(limit)]
+            self.stats['seconds'] = perf_counter() - _start
+            return _res
+
+        # the checks of the root are cheap, a puzzle that fails them does not start the pool
+        _solver._init_domain()
+        if not _solver._propagate(list(range(len(_solver.node_ls)))):
+            return []
+        _solver.closed.clear()
+        if not _solver._is_connectable():
+            return []
+
+        if self.pool is None:
+            self.stop_event = multiprocessing.Event()
+            self.found_cnt = multiprocessing.Value('i', 0)
+            self.idle_cnt = multiprocessing.Value('i', 0)
+            self.message_queue = multiprocessing.Queue()
+            self.pool = multiprocessing.Pool(self.workers, _init_worker,
+                                             (self.stop_event, self.found_cnt, self.idle_cnt, self.message_queue))
+        self.stats['parallel'] = True
+        self.job_cnt += 1
+        self.stop_event.clear()
+        self.found_cnt.value = 0
+        _island_ls = [(_node.position.row, _node.position.col, _node.n) for _node in _solver.node_ls]
+
+        # the results of the tasks are put in the same queue by the result thread of the pool,
+        # as (job id, 'done', result) or (job id, 'error', error)
+        _job = self.job_cnt
+        def on_result(result:tuple[list[tuple[int, ...]], int]):
+            self.message_queue.put((_job, 'done', result))
+        def on_error(e:BaseException):
+            self.message_queue.put((_job, 'error', e))
+        _waiting : deque[list[tuple[int, int]]] = deque([[]])
+        _running = 0
+        # messages of subtrees given away that are not received yet, known once their task is done
+        _split_pending = 0
+        _found : set[tuple[int, ...]] = set()
+        _error = None
+        while True:
+            # no more tasks than workers are submitted, so a task waiting in the parent means no worker is idle
+            while len(_waiting) > 0 and _running < self.workers and _error is None and len(_found) < limit:
+                self.pool.apply_async(_search_task, ((_job, board.width, board.height, _island_ls,
+                                                      _waiting.popleft(), limit),),
+                                      callback=on_result, error_callback=on_error)
+                _running += 1
+                self.stats['tasks'] += 1
+            # the subtrees given away by a failed task are not waited for, they are told apart by the job id
+            if _running == 0 and (_split_pending == 0 or _error is not None):
+                break
+            self._set_idle(self.workers - _running if len(_waiting) == 0 else 0)
+            (_message_job, _kind, _value) = self.message_queue.get()
+            if _message_job != _job:
+                continue
+            if _kind == 'split':
+                _split_pending -= 1
+                self.stats['splits'] += 1
+                _waiting.extend(_value)
+                continue
+            _running -= 1
+            if _kind == 'error':
+                # the other tasks are cancelled and waited for, so the pool is clean for the next job
+                _error = _value
+                self.stop_event.set()
+                continue
+            (_lines_ls, _split_cnt) = _value
+            _split_pending += _split_cnt
+            _found.update(_lines_ls)
+            if len(_found) >= limit:
+                self.stop_event.set()
+        self._set_idle(0)
+        if _error is not None:
+            raise _error
+        self.stats['seconds'] = perf_counter() - _start
+        return list(_found)[:limit]
+
+    def solve_all(self, board:Board, limit:int=2) -> list[list[tuple[Node, Node, int]]]:
+        """Find at most `limit` different solutions of the board, lines drawn by the player are ignored"""
+        _solver = Solver(board)
+        return [_solver._to_solution(_lines) for _lines in self._solve_lines(board, limit)]
+
+    def solve(self, board:Board) -> list[tuple[Node, Node, int]]:
+        """
+            Find a solution of the board
+            Return:
+                list of (node, node, number of lines), None if the board has no solution
+        """
+        _res = self.solve_all(board, 1)
+        return _res[0] if len(_res) > 0 else None
+
+    def count_solutions(self, board:Board, limit:int=2) -> int:
+        """Count the solutions of the board, stop counting at `limit`"""
+        return len(self._solve_lines(board, limit))
+
+if __name__ == '__main__':
+    import puzzle_io
+    _parser = argparse.ArgumentParser(description='Count the solutions of a puzzle on all cores')
+    _parser.add_argument('path', help='puzzle text file or library')
+    _parser.add_argument('index', type=int, nargs='?', default=0, help='index of the puzzle in a library')
+    _parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes, the number of cores by default')
+    _parser.add_argument('--limit', type=int, default=2, help='stop counting at this number of solutions')
+    _args = _parser.parse_args()
+
+    _board = puzzle_io.load(_args.path, _args.index)
+    with ParallelSolver(_args.workers, min_nodes=0) as _parallel:
+        _cnt = _parallel.count_solutions(_board, _args.limit)
+        print(json.dumps(dict(_parallel.stats, solutions=_cnt)))
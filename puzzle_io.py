@@ -0,0 +1,305 @@
+from __future__ import annotations
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Iterator
+
+from structs import *
+from board import Board
+
+# text format, see `to_text`
+TEXT_EMPTY = '.'
+TEXT_LINES_HEADER = '# lines'
+# character of a line by (is vertical, is double), and number of lines of each character
+TEXT_LINE = {(False, False): '-', (False, True): '=', (True, False): '|', (True, True): '"'}
+_TEXT_LINE_CNT = {'-': 1, '=': 2, '|': 1, '"': 2}
+
+# binary record: width, height, number of nodes, flags,
+# then one u32 per node `(row * width + col) * 8 + number - 1` in row-major order,
+# then with FLAG_LINES one byte per node `right line count | bottom line count << 2`
+_RECORD_HEADER = struct.Struct('<HHIB')
+FLAG_LINES = 1
+
+# library file: header, records, then the offsets of all records as u64
+LIBRARY_MAGIC = b'HASHILIB'
+LIBRARY_VERSION = 1
+_LIBRARY_HEADER = struct.Struct('<8sIIQQ')
+_OFFSET = struct.Struct('<Q')
+
+def _islands(board:Board) -> list[tuple[int, int, int]]:
+    """(row, col, number) of the nodes in row-major order"""
+    return sorted((_node.position.row, _node.position.col, _node.n) for _node in board.node_ls)
+
+def _draw_lines(board:Board, line_ls:list[tuple[int, int, int, int]]):
+    """Draw lines given as (row, col, direction index, number of lines) from the nodes at (row, col)"""
+    for (_row, _col, _dir_idx, _cnt) in line_ls:
+        _node = board.get(Position(_row, _col))
+        _to_node = board.get_neighbour(_node, DIRECTIONS[_dir_idx])
+        if _to_node is None:
+            raise Exception('No node to link from ({}, {})'.format(_row, _col))
+        for _ in range(_cnt):
+            board.draw_line(_node, _to_node)
+
+def to_text(board:Board, lines:bool=False) -> str:
+    """
+        Write the board as text, '.' for an empty box and the number for a node.\n
+        Without `lines` there is one character per box.
+        With `lines` the text starts with the line '# lines' and has a gap between boxes, like `print_board`,
+        with '-' and '=' for single and double horizontal lines, '|' and '"' for vertical ones
+    """
+    if not lines:
+        _row_ls = [[TEXT_EMPTY] * board.width for _ in range(board.height)]
+        for _node in board.node_ls:
+            _row_ls[_node.position.row][_node.position.col] = str(_node.n)
+        return ''.join(''.join(_row) + '\n' for _row in _row_ls)
+
+    _row_ls = [[TEXT_EMPTY] * (board.width * 2 - 1) for _ in range(board.height * 2 - 1)]
+    for _node in board.node_ls:
+        (_r, _c) = (_node.position.row * 2, _node.position.col * 2)
+        _row_ls[_r][_c] = str(_node.n)
+        if _node.line_cnt[RIGHT_IDX] > 0:
+            _char = TEXT_LINE[(False, _node.line_cnt[RIGHT_IDX] == 2)]
+            for _i in range(_c + 1, _node.link[RIGHT_IDX].position.col * 2):
+                _row_ls[_r][_i] = _char
+        if _node.line_cnt[BOTTOM_IDX] > 0:
+            _char = TEXT_LINE[(True, _node.line_cnt[BOTTOM_IDX] == 2)]
+            for _i in range(_r + 1, _node.link[BOTTOM_IDX].position.row * 2):
+                _row_ls[_i][_c] = _char
+    return TEXT_LINES_HEADER + '\n' + ''.join(''.join(_row) + '\n' for _row in _row_ls)
+
+def from_text(text:str, cls:type=Board) -> Board:
+    """
+        Read a board written by `to_text`, lines in the text are drawn on the board.\n
+        Blank lines and other lines starting with '#' are skipped, short rows are padded with empty boxes
+    """
+    _row_ls = [_line.rstrip() for _line in text.splitlines()]
+    _row_ls = [_line for _line in _row_ls if _line != '']
+    _spaced = len(_row_ls) > 0 and _row_ls[0] == TEXT_LINES_HEADER
+    _row_ls = [_line for _line in _row_ls if not _line.startswith('#')]
+    if len(_row_ls) == 0:
+        raise Exception('No board in the text')
+    # position in the text of the box at (row, col)
+    _step = 2 if _spaced else 1
+
+    _island_ls = []
+    _line_ls = []
+    for (_r, _line) in enumerate(_row_ls):
+        for (_c, _char) in enumerate(_line):
+            if _char in '12345678':
+                if _r % _step != 0 or _c % _step != 0:
+                    raise Exception('Node in a gap at ({}, {})'.format(_r, _c))
+                _island_ls.append((_r // _step, _c // _step, int(_char)))
+                if not _spaced:
+                    continue
+                # lines are stored in the node on their left or top end
+                if _c + 1 < len(_line) and _line[_c+1] in _TEXT_LINE_CNT:
+                    _line_ls.append((_r // 2, _c // 2, RIGHT_IDX, _TEXT_LINE_CNT[_line[_c+1]]))
+                if _r + 1 < len(_row_ls) and _c < len(_row_ls[_r+1]) and _row_ls[_r+1][_c] in _TEXT_LINE_CNT:
+                    _line_ls.append((_r // 2, _c // 2, BOTTOM_IDX, _TEXT_LINE_CNT[_row_ls[_r+1][_c]]))
+            elif _char != TEXT_EMPTY and (not _spaced or _char not in _TEXT_LINE_CNT):
+                raise Exception('Invalid character {!r} at ({}, {})'.format(_char, _r, _c))
+
+    _board = cls(
+        (max(len(_line) for _line in _row_ls) + _step - 1) // _step,
+        (len(_row_ls) + _step - 1) // _step
+    )
+    _board.place_nodes(_island_ls)
+    _draw_lines(_board, _line_ls)
+    return _board
+
+def encode_islands(width:int, height:int, island_ls:list[tuple[int, int, int]],
+                   line_ls:list[tuple[int, int]]=None) -> bytes:
+    """
+        Pack a puzzle into a binary record
+        Args:
+            `island_ls`: list of (row, col, number) of the nodes, in row-major order
+            `line_ls`: optional (right line count, bottom line count) of each node
+    """
+    if width * height * 8 > 1 << 32:
+        raise Exception('Board of {}x{} is too large for the binary format'.format(width, height))
+    if any(_n < 1 or _n > 8 for (_, _, _n) in island_ls):
+        raise Exception('Node number must be from 1 to 8')
+    _packed = array('I', [(_row * width + _col) * 8 + _n - 1 for (_row, _col, _n) in island_ls])
+    if sys.byteorder == 'big':
+        _packed.byteswap()
+    _part_ls = [_RECORD_HEADER.pack(width, height, len(island_ls), FLAG_LINES if line_ls is not None else 0), _packed.tobytes()]
+    if line_ls is not None:
+        _part_ls.append(bytes(_right | _bottom << 2 for (_right, _bottom) in line_ls))
+    return b''.join(_part_ls)
+
+def encode(board:Board, lines:bool=False) -> bytes:
+    """Pack the board into a binary record, with the lines drawn on it if `lines`"""
+    _island_ls = _islands(board)
+    _line_ls = None
+    if lines:
+        _line_ls = [
+            (_node.line_cnt[RIGHT_IDX], _node.line_cnt[BOTTOM_IDX])
+            for _node in (board.get(Position(_row, _col)) for (_row, _col, _) in _island_ls)
+        ]
+    return encode_islands(board.width, board.height, _island_ls, _line_ls)
+
+def record_size(data, offset:int=0) -> int:
+    """Number of bytes of the record at `offset`"""
+    (_, _, _cnt, _flags) = _RECORD_HEADER.unpack_from(data, offset)
+    return _RECORD_HEADER.size + _cnt * (5 if _flags & FLAG_LINES else 4)
+
+def decode_islands(data, offset:int=0) -> tuple[int, int, list[tuple[int, int, int]]]:
+    """Unpack (width, height, (row, col, number) of the nodes) of the binary record at `offset`, without a board"""
+    (_width, _height, _cnt, _) = _RECORD_HEADER.unpack_from(data, offset)
+    _start = offset + _RECORD_HEADER.size
+    _packed = array('I')
+    _packed.frombytes(data[_start:_start + _cnt * 4])
+    if sys.byteorder == 'big':
+        _packed.byteswap()
+
+    _island_ls = []
+    for _value in _packed:
+        (_idx, _n) = divmod(_value, 8)
+        (_row, _col) = divmod(_idx, _width)
+        _island_ls.append((_row, _col, _n + 1))
+    return (_width, _height, _island_ls)
+
+def decode(data, cls:type=Board, offset:int=0) -> Board:
+    """
+        Unpack the binary record at `offset` of `data` (bytes, memoryview or mmap),
+        the lines in the record are drawn on the board
+    """
+    (_width, _height, _island_ls) = decode_islands(data, offset)
+    (_, _, _cnt, _flags) = _RECORD_HEADER.unpack_from(data, offset)
+    _board = cls(_width, _height)
+    _board.place_nodes(_island_ls)
+
+    if _flags & FLAG_LINES:
+        _start = offset + _RECORD_HEADER.size + _cnt * 4
+        _line_ls = []
+        for ((_row, _col, _), _byte) in zip(_island_ls, data[_start:_start + _cnt]):
+            if _byte & 3:
+                _line_ls.append((_row, _col, RIGHT_IDX, _byte & 3))
+            if _byte >> 2:
+                _line_ls.append((_row, _col, BOTTOM_IDX, _byte >> 2))
+        _draw_lines(_board, _line_ls)
+    return _board
+
+class LibraryWriter:
+    """
+        Write puzzles to a library file, records are appended as they are added
+        and the offset index is written by `close`
+    """
+    def __init__(self, path:str):
+        self.file = open(path, 'wb')
+        self.offset_ls = array('Q')
+        self.file.write(_LIBRARY_HEADER.pack(LIBRARY_MAGIC, LIBRARY_VERSION, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.offset_ls)
+
+    def add_record(self, record:bytes):
+        """Append a record made by `encode` or `encode_islands`"""
+        self.offset_ls.append(self.file.tell())
+        self.file.write(record)
+
+    def add(self, board:Board, lines:bool=False):
+        self.add_record(encode(board, lines))
+
+    def close(self):
+        if self.file.closed:
+            return
+        _index_offset = self.file.tell()
+        if sys.byteorder == 'big':
+            self.offset_ls.byteswap()
+        self.file.write(self.offset_ls.tobytes())
+        self.file.seek(0)
+        self.file.write(_LIBRARY_HEADER.pack(LIBRARY_MAGIC, LIBRARY_VERSION, 0, len(self.offset_ls), _index_offset))
+        self.file.close()
+
+class Library:
+    """
+        Read-only puzzle library, the file is memory-mapped
+        so reading a puzzle only touches its own record and its offset in the index
+    """
+    def __init__(self, path:str):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (_magic, _version, _, self.count, self.index_offset) = _LIBRARY_HEADER.unpack_from(self.data, 0)
+        if _magic != LIBRARY_MAGIC:
+            raise Exception('{} is not a puzzle library'.format(path))
+        if _version != LIBRARY_VERSION:
+            raise Exception('Unsupported library version {}'.format(_version))
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def offset(self, idx:int) -> int:
+        """Offset of the record of the `idx`-th puzzle"""
+        if not 0 <= idx < self.count:
+            raise IndexError('Puzzle {} is not in the library of {} puzzles'.format(idx, self.count))
+        return _OFFSET.unpack_from(self.data, self.index_offset + idx * _OFFSET.size)[0]
+
+    def record(self, idx:int) -> bytes:
+        _offset = self.offset(idx)
+        return self.data[_offset:_offset + record_size(self.data, _offset)]
+
+    def load(self, idx:int, cls:type=Board) -> Board:
+        return decode(self.data, cls, self.offset(idx))
+
+    def islands(self, idx:int) -> tuple[int, int, list[tuple[int, int, int]]]:
+        """(width, height, (row, col, number) of the nodes) of the `idx`-th puzzle, without a board"""
+        return decode_islands(self.data, self.offset(idx))
+
+    def __getitem__(self, idx:int) -> Board:
+        return self.load(idx)
+
+    def __iter__(self) -> Iterator[Board]:
+        for _idx in range(self.count):
+            yield self.load(_idx)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+def load(path:str, idx:int=0, cls:type=Board) -> Board:
+    """Load the `idx`-th puzzle of a library file, or the puzzle in a text file"""
+    with open(path, 'rb') as _file:
+        _is_library = _file.read(len(LIBRARY_MAGIC)) == LIBRARY_MAGIC
+    if _is_library:
+        with Library(path) as _library:
+            return _library.load(idx, cls)
+    with open(path) as _file:
+        return from_text(_file.read(), cls)
+
+def iter_puzzles(path:str) -> Iterator[tuple[int, int, list[tuple[int, int, int]]]]:
+    """
+        (width, height, (row, col, number) of the nodes) of each puzzle of a file, read lazily.\n
+        The file is a library, JSON lines written by batch.py (failed puzzles are skipped) or a text puzzle
+    """
+    with open(path, 'rb') as _file:
+        _head = _file.read(len(LIBRARY_MAGIC))
+    if _head == LIBRARY_MAGIC:
+        with Library(path) as _library:
+            for _idx in range(len(_library)):
+                yield _library.islands(_idx)
+        return
+    if _head.lstrip().startswith(b'{'):
+        with open(path) as _file:
+            for _line in _file:
+                if _line.strip() == '':
+                    continue
+                _result = json.loads(_line)
+                if 'islands' in _result:
+                    yield (_result['width'], _result['height'], [tuple(_island) for _island in _result['islands']])
+        return
+    with open(path) as _file:
+        _board = from_text(_file.read())
+    yield (_board.width, _board.height, [(_node.position.row, _node.position.col, _node.n) for _node in _board.node_ls])
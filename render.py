@@ -0,0 +1,147 @@
+from __future__ import annotations
+import shutil
+import sys
+
+from structs import *
+from colorama import Fore, Style
+
+# characters taken by the row numbers and borders around the boxes, and by each box with its padding
+_BORDER_WIDTH = 4
+_BOX_WIDTH = 4
+# rows taken by the header and footer, and rows kept below the frame for the prompt
+_BORDER_HEIGHT = 4
+_PROMPT_HEIGHT = 3
+
+def _col_number_line(col_start:int, col_end:int) -> str:
+    _text = ''.join(
+        '{}{}{}'.format('0' if _c < 10 else '', _c, '  ' if _c < col_end - 1 else '')
+        for _c in range(col_start, col_end)
+    )
+    return f'  {Fore.CYAN}#{Fore.WHITE}{_text}{Fore.CYAN}#{Style.RESET_ALL}'
+
+def _horizon_line(col_cnt:int) -> str:
+    return f'{Fore.CYAN}{"#"*((col_cnt+1)*4)}{Style.RESET_ALL}'
+
+def _box_lines(row:list[Box], r_idx:int, is_last:bool) -> tuple[str, str]:
+    """The line of the boxes in a row and the padding line below it, None for the last row"""
+    _part_ls = [f'{Fore.WHITE}{"0" if r_idx < 10 else ""}{r_idx}{Fore.CYAN}#{Style.RESET_ALL}']
+    _pad_ls = [f'{Fore.CYAN}  #{Style.RESET_ALL}']
+    _last = len(row) - 1
+    for (_c, _box) in enumerate(row):
+        _part_ls.append(str(_box))
+        _padding_col = ''
+        _col = '  '
+        if isinstance(_box, Node):
+            if _c < _last:
+                _padding_col = '  ' if _box.link[RIGHT_IDX] is None else ('--' if _box.line_cnt[RIGHT_IDX] == 1 else '==')
+            if _box.link[BOTTOM_IDX] is not None:
+                _col = ' |' if _box.line_cnt[BOTTOM_IDX] == 1 else '||'
+        elif isinstance(_box, HorizonLine):
+            if _c < _last:
+                _padding_col = '==' if _box.is_double else '--'
+        else:
+            if _c < _last:
+                _padding_col = '  '
+            if isinstance(_box, VerticalLine):
+                _col = '||' if _box.is_double else ' |'
+        _part_ls.append(_padding_col)
+        _pad_ls.append(_col)
+        if _c < _last:
+            _pad_ls.append('  ')
+    _part_ls.append(f'{Fore.CYAN}#{Fore.WHITE}{"0" if r_idx < 10 else ""}{r_idx}')
+    _pad_ls.append(f'{Fore.CYAN}#{Style.RESET_ALL}')
+    return (''.join(_part_ls), None if is_last else ''.join(_pad_ls))
+
+def frame_lines(board, col_start:int=0, col_end:int=None, row_start:int=0, row_end:int=None) -> list[str]:
+    """
+        Render the board, or the boxes in a viewport of it, as a list of lines without line breaks
+        Args:
+            `col_start`, `col_end`: the columns to render, all by default
+            `row_start`, `row_end`: the rows to render, all by default
+    """
+    if col_end is None:
+        col_end = board.width
+    if row_end is None:
+        row_end = board.height
+
+    _header = _col_number_line(col_start, col_end)
+    _border = _horizon_line(col_end - col_start)
+    _line_ls = [_header, _border]
+    for _r in range(row_start, row_end):
+        _row = [board._box_at(_r, _c) for _c in range(col_start, col_end)]
+        (_line, _padding) = _box_lines(_row, _r, _r == row_end - 1)
+        _line_ls.append(_line)
+        if _padding is not None:
+            _line_ls.append(_padding)
+    _line_ls.append(_border)
+    _line_ls.append(_header)
+    return _line_ls
+
+def frame(board) -> str:
+    """Render the whole board as one string, the same text as `Board.print_board`"""
+    return '\n'.join(frame_lines(board)) + '\n'
+
+class Renderer:
+    """
+        Draw a board to a terminal, redrawing only the lines changed since the last frame.\n
+        Boards larger than the terminal are drawn through a viewport that can be scrolled
+    """
+    def __init__(self, board, file=None, term_size:tuple[int, int]=None):
+        """
+            Args:
+                `file`: the terminal to write to, stdout by default
+                `term_size`: (columns, lines) of the terminal, the size of the real terminal by default
+        """
+        self.board = board
+        self.file = file
+        self.term_size = term_size
+        self.col_start = 0
+        self.row_start = 0
+        # lines of the last frame on the screen, None if the screen has to be redrawn
+        self.last_line_ls : list[str] = None
+
+    def viewport(self) -> tuple[int, int, int, int]:
+        """(col_start, col_end, row_start, row_end) of the boxes shown in the terminal"""
+        (_cols, _lines) = self.term_size or shutil.get_terminal_size()
+        _col_cnt = max(1, min(self.board.width, (_cols - _BORDER_WIDTH) // _BOX_WIDTH))
+        _row_cnt = max(1, min(self.board.height, (_lines - _BORDER_HEIGHT - _PROMPT_HEIGHT + 1) // 2))
+        self.col_start = max(0, min(self.col_start, self.board.width - _col_cnt))
+        self.row_start = max(0, min(self.row_start, self.board.height - _row_cnt))
+        return (self.col_start, self.col_start + _col_cnt, self.row_start, self.row_start + _row_cnt)
+
+    def scroll(self, d_col:int, d_row:int):
+        """Move the viewport by `d_col` columns and `d_row` rows, it stays inside the board"""
+        self.col_start += d_col
+        self.row_start += d_row
+        self.viewport()
+
+    def invalidate(self):
+        """Redraw the whole screen at the next `render`"""
+        self.last_line_ls = None
+
+    def render(self) -> int:
+        """
+            Draw the board in one write, leaving the cursor below the frame
+            Return:
+                number of characters written
+        """
+        _line_ls = frame_lines(self.board, *self.viewport())
+        _last_ls = self.last_line_ls
+        _part_ls = []
+        if _last_ls is None or len(_last_ls) != len(_line_ls):
+            # clear the screen and draw all lines
+            _part_ls.append('\x1b[H\x1b[2J')
+            _part_ls.append('\n'.join(_line_ls))
+        else:
+            for (_idx, _line) in enumerate(_line_ls):
+                if _line != _last_ls[_idx]:
+                    _part_ls.append('\x1b[{};1H{}\x1b[K'.format(_idx + 1, _line))
+        # below the frame, clear what was written there after the last frame
+        _part_ls.append('\x1b[{};1H\x1b[J'.format(len(_line_ls) + 1))
+        self.last_line_ls = _line_ls
+
+        _text = ''.join(_part_ls)
+        _file = self.file or sys.stdout
+        _file.write(_text)
+        _file.flush()
+        return len(_text)
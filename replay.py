@@ -0,0 +1,251 @@
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import struct
+import sys
+from array import array
+from time import perf_counter
+from typing import Iterator
+
+from structs import *
+from board import Board
+from game import Game, MOVE_NO_NODE, MOVE_INVALID, pack_move
+from puzzle_io import encode, decode
+
+# replay log: header, the puzzle as a binary record with the lines on the board when the log started,
+# then one u32 per move packed by `pack_move`, appended as the moves are made,
+# a finished game ends with `LOG_END` and the u64 `state_hash` of the board
+LOG_MAGIC = b'HASHIRPL'
+LOG_VERSION = 1
+_LOG_HEADER = struct.Struct('<8sII')
+_HASH = struct.Struct('<Q')
+LOG_END = 0xFFFFFFFF
+# bytes read at once by the verifier
+_CHUNK_SIZE = 1 << 16
+
+# result of verifying a log
+VERIFY_OK = 'ok'
+VERIFY_UNFINISHED = 'unfinished'
+VERIFY_CHEATER = 'cheater'
+VERIFY_CORRUPTED = 'corrupted'
+
+class ReplayWriter:
+    """
+        Append the moves of a game to a replay log, each move is written as it is added,
+        the log can be read back by `verify_log` even if the game never ends
+    """
+    def __init__(self, path:str, board:Board, flush:bool=True):
+        """
+            Args:
+                `path`: file of the log, an existing file is never overwritten,
+                    a number is added to the name instead (`game.log` becomes `game.1.log`), see `path` of the writer
+                `board`: the board the moves are made on, written as it is now
+                `flush`: flush the file after each `add` so a crash loses no move, slower for batches
+        """
+        if (board.width * board.height * 4 + 3) * 8 + 7 >= LOG_END:
+            raise Exception('Board of {}x{} is too large for a replay log'.format(board.width, board.height))
+        self.width = board.width
+        self.auto_flush = flush
+        _record = encode(board, lines=True)
+        (self.path, self.file) = _open_new(path)
+        self.file.write(_LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, len(_record)))
+        self.file.write(_record)
+        self.file.flush()
+
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, move:int):
+        """Append a move packed by `pack_move`"""
+        self.file.write(struct.pack('<I', move))
+        if self.auto_flush:
+            self.file.flush()
+
+    def add_moves(self, move_ls:array):
+        """Append many packed moves at once"""
+        _move_ls = array('I', move_ls)
+        if sys.byteorder == 'big':
+            _move_ls.byteswap()
+        self.file.write(_move_ls.tobytes())
+        if self.auto_flush:
+            self.file.flush()
+
+    def add_action(self, from_node:Node, direction:Direction, action:str):
+        """Append a move as `Game.handle_action` takes it"""
+        if action == 'r':
+            self.add(pack_move(self.width, 0, 0, 0, 'r'))
+        else:
+            self.add(pack_move(self.width, from_node.position.row, from_node.position.col, direction.idx, action))
+
+    def finish(self, board:Board):
+        """Mark the game as finished on `board` and close the log"""
+        self.file.write(struct.pack('<I', LOG_END) + _HASH.pack(board.state_hash()))
+        self.close()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+def _open_new(path:str) -> tuple[str, object]:
+    """Create `path` for writing, or the first of `{name}.1{ext}`, `{name}.2{ext}` ... that does not exist"""
+    (_root, _ext) = os.path.splitext(path)
+    _path = path
+    _idx = 0
+    while True:
+        try:
+            return (_path, open(_path, 'xb'))
+        except FileExistsError:
+            _idx += 1
+            _path = '{}.{}{}'.format(_root, _idx, _ext)
+
+def _read_header(file) -> Board:
+    """Read the header and the puzzle of a log, raise if the log is corrupted"""
+    _header = file.read(_LOG_HEADER.size)
+    if len(_header) < _LOG_HEADER.size:
+        raise Exception('Truncated header')
+    (_magic, _version, _record_size) = _LOG_HEADER.unpack(_header)
+    if _magic != LOG_MAGIC:
+        raise Exception('Not a replay log')
+    if _version != LOG_VERSION:
+        raise Exception('Unsupported log version {}'.format(_version))
+    _record = file.read(_record_size)
+    if len(_record) < _record_size:
+        raise Exception('Truncated puzzle')
+    return decode(_record)
+
+def _read_moves(file) -> Iterator[tuple[array, int]]:
+    """
+        Read the moves of a log in chunks, without holding the whole log in memory
+        Return:
+            iterator of (packed moves, None) then (moves before the end, state hash) if the game is finished,
+            raise if the log is corrupted
+    """
+    _rest = b''
+    while True:
+        _data = file.read(_CHUNK_SIZE)
+        if len(_data) == 0:
+            if len(_rest) > 0:
+                raise Exception('Truncated move')
+            return
+        _data = _rest + _data
+        _cut = len(_data) - len(_data) % 4
+        _move_ls = array('I')
+        _move_ls.frombytes(_data[:_cut])
+        if sys.byteorder == 'big':
+            _move_ls.byteswap()
+        _rest = _data[_cut:]
+        try:
+            _end = _move_ls.index(LOG_END)
+        except ValueError:
+            yield (_move_ls, None)
+            continue
+        # the hash follows the end mark, nothing else may follow it
+        _tail = _data[(_end + 1) * 4:] + file.read(_HASH.size + 1)
+        if len(_tail) != _HASH.size:
+            raise Exception('Data after the end of the game' if len(_tail) > _HASH.size else 'Truncated end')
+        yield (_move_ls[:_end], _HASH.unpack(_tail)[0])
+        return
+
+def verify_log(path:str) -> dict:
+    """
+        Rebuild the game of a log and check each move and the claimed end
+        Return:
+            dict of path, result, moves (number of moves checked) and seconds,
+            with the index of the bad move and an error message if the log is not ok.\n
+            The result is `VERIFY_OK` for a finished game,
+            `VERIFY_UNFINISHED` for a valid game without end,
+            `VERIFY_CHEATER` for an illegal move or an end on an unfinished board,
+            `VERIFY_CORRUPTED` for a log that cannot be read, a move that cannot exist or a wrong end hash
+    """
+    _start = perf_counter()
+    _report = {'path': path, 'result': VERIFY_UNFINISHED, 'moves': 0}
+    try:
+        with open(path, 'rb') as _file:
+            _game = Game(board=_read_header(_file))
+            for (_move_ls, _hash) in _read_moves(_file):
+                _result = _game.apply_moves(_move_ls, stop_on_error=True)
+                _report['moves'] += len(_result['status'])
+                if _result['applied'] != len(_move_ls):
+                    _status = _result['status'][-1]
+                    _corrupted = _status == MOVE_NO_NODE or _status == MOVE_INVALID
+                    _report['result'] = VERIFY_CORRUPTED if _corrupted else VERIFY_CHEATER
+                    _report['move'] = _report['moves'] - 1
+                    _report['error'] = 'Illegal move {}: status {}'.format(_move_ls[len(_result['status']) - 1], _status)
+                    break
+                if _hash is None:
+                    continue
+                if _hash != _result['hash']:
+                    _report['result'] = VERIFY_CORRUPTED
+                    _report['error'] = 'End hash does not match the board'
+                elif not _result['finished']:
+                    _report['result'] = VERIFY_CHEATER
+                    _report['error'] = 'Ended on an unfinished board'
+                else:
+                    _report['result'] = VERIFY_OK
+    except Exception as e:
+        _report['result'] = VERIFY_CORRUPTED
+        _report['error'] = str(e)
+    _report['seconds'] = perf_counter() - _start
+    return _report
+
+def iter_log_paths(path_ls:list[str]) -> Iterator[str]:
+    """Paths of the logs in files and directories, directories are walked as they are read"""
+    for _path in path_ls:
+        if not os.path.isdir(_path):
+            yield _path
+            continue
+        for (_root, _, _file_ls) in os.walk(_path):
+            for _name in _file_ls:
+                yield os.path.join(_root, _name)
+
+def verify_logs(paths, workers:int=None, chunksize:int=16) -> Iterator[dict]:
+    """
+        Verify logs on a process pool, reports are yielded as soon as they finish
+        Args:
+            `paths`: iterable of paths of logs, it is consumed lazily
+            `workers`: number of processes, all cores by default, 1 verifies in this process
+            `chunksize`: number of logs sent to a worker at once
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for _path in paths:
+            yield verify_log(_path)
+        return
+
+    with multiprocessing.Pool(workers) as _pool:
+        for _report in _pool.imap_unordered(verify_log, paths, chunksize):
+            yield _report
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser(description='Verify replay logs in parallel, reports are written as JSON lines')
+    _parser.add_argument('paths', nargs='+', help='log files or directories of logs')
+    _parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes, all cores by default')
+    _parser.add_argument('--chunksize', type=int, default=16)
+    _parser.add_argument('-o', '--output', help='file to write to, stdout by default')
+    _parser.add_argument('--bad-only', action='store_true', help='only write the reports of cheaters and corrupted logs')
+    _args = _parser.parse_args()
+
+    _file = sys.stdout if _args.output is None else open(_args.output, 'w')
+    _start = perf_counter()
+    _count = {VERIFY_OK: 0, VERIFY_UNFINISHED: 0, VERIFY_CHEATER: 0, VERIFY_CORRUPTED: 0}
+    _moves = 0
+    try:
+        for _report in verify_logs(iter_log_paths(_args.paths), _args.workers, _args.chunksize):
+            _count[_report['result']] += 1
+            _moves += _report['moves']
+            if _args.bad_only and _report['result'] in (VERIFY_OK, VERIFY_UNFINISHED):
+                continue
+            _file.write(json.dumps(_report) + '\n')
+    finally:
+        if _file is not sys.stdout:
+            _file.close()
+    _seconds = perf_counter() - _start
+    print('{} logs, {} ok, {} unfinished, {} cheater, {} corrupted, {} moves, {:.2f}s'.format(
+        sum(_count.values()), _count[VERIFY_OK], _count[VERIFY_UNFINISHED],
+        _count[VERIFY_CHEATER], _count[VERIFY_CORRUPTED], _moves, _seconds
+    ), file=sys.stderr)
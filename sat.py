@@ -0,0 +1,576 @@
+from __future__ import annotations
+import argparse
+import heapq
+import json
+import sys
+from itertools import combinations
+from time import perf_counter
+
+from structs import *
+from board import Board
+from solver import Solver, _luby
+
+# pysat is optional, the bundled `CDCL` solver is used without it
+try:
+    from pysat.solvers import Solver as _PySatSolver
+except ImportError:
+    _PySatSolver = None
+
+BACKEND_AUTO = 'auto'
+BACKEND_CDCL = 'cdcl'
+BACKEND_PYSAT = 'pysat'
+
+# conflicts between restarts of `CDCL` are this times the luby sequence
+_RESTART_BASE = 64
+
+class CDCL:
+    """
+        Conflict driven clause learning SAT solver in pure python.\n
+        Clauses are lists of DIMACS literals (v or -v for variable v >= 1), they can be added between calls of `solve`,
+        the clauses learnt before are kept since they follow from the clauses before them.
+        Two watched literals, first UIP learning, activity based decisions with phase saving, luby restarts
+    """
+    def __init__(self, var_cnt:int=0):
+        # a literal is stored as `v * 2` for v and `v * 2 + 1` for -v, so `lit ^ 1` is its negation
+        self.var_cnt = 0
+        # 1 true, -1 false, 0 unassigned, by literal
+        self.value : list[int] = [0, 0]
+        self.level : list[int] = [0]
+        # clause idx that implied each variable, -1 for decisions
+        self.reason : list[int] = [-1]
+        self.activity : list[float] = [0.0]
+        self.phase : list[int] = [1]
+        self.seen : list[bool] = [False]
+        # clause idx watching each literal, the watched literals of a clause are its first two
+        self.watch : list[list[int]] = [[], []]
+        self.clause_ls : list[list[int]] = []
+        self.learnt_ls : list[int] = []
+        self.trail : list[int] = []
+        # trail length at the start of each decision level
+        self.trail_lim : list[int] = []
+        self.head = 0
+        # (-activity, variable) of the variables to decide, entries of assigned variables are skipped
+        self.heap : list[tuple[float, int]] = []
+        self.var_inc = 1.0
+        # False once the clauses cannot be satisfied
+        self.ok = True
+        self.conflicts = 0
+        self.decisions = 0
+        self.propagations = 0
+        self.max_learnts = 4096
+        self.new_vars(var_cnt)
+
+    def new_vars(self, var_cnt:int):
+        """Make sure variables 1 to `var_cnt` exist"""
+        while self.var_cnt < var_cnt:
+            self.var_cnt += 1
+            self.value += [0, 0]
+            self.level.append(0)
+            self.reason.append(-1)
+            self.activity.append(0.0)
+            self.phase.append(1)
+            self.seen.append(False)
+            self.watch += [[], []]
+            heapq.heappush(self.heap, (0.0, self.var_cnt))
+
+    def _enqueue(self, lit:int, reason:int):
+        self.value[lit] = 1
+        self.value[lit ^ 1] = -1
+        _v = lit >> 1
+        self.level[_v] = len(self.trail_lim)
+        self.reason[_v] = reason
+        self.trail.append(lit)
+
+    def _backtrack(self, level:int):
+        if len(self.trail_lim) <= level:
+            return
+        _trail = self.trail
+        _value = self.value
+        _mark = self.trail_lim[level]
+        for _lit in _trail[_mark:]:
+            _v = _lit >> 1
+            _value[_lit] = 0
+            _value[_lit ^ 1] = 0
+            self.reason[_v] = -1
+            self.phase[_v] = _lit & 1
+            heapq.heappush(self.heap, (-self.activity[_v], _v))
+        del _trail[_mark:]
+        del self.trail_lim[level:]
+        self.head = _mark
+        # drop the entries left by older assignments
+        if len(self.heap) > self.var_cnt * 8:
+            self.heap = [(-self.activity[_u], _u) for _u in range(1, self.var_cnt + 1) if _value[_u * 2] == 0]
+            heapq.heapify(self.heap)
+
+    def add_clause(self, clause:list[int]) -> bool:
+        """
+            Add a clause of DIMACS literals, the search restarts from the top
+            Return:
+                False if the clauses cannot be satisfied anymore
+        """
+        if not self.ok:
+            return False
+        self._backtrack(0)
+        self.new_vars(max((abs(_l) for _l in clause), default=0))
+        _value = self.value
+        _lit_ls = []
+        for _l in clause:
+            _lit = _l * 2 if _l > 0 else -_l * 2 + 1
+            if _value[_lit] == 1 or (_lit ^ 1) in _lit_ls:
+                return True
+            if _value[_lit] == 0 and _lit not in _lit_ls:
+                _lit_ls.append(_lit)
+        if len(_lit_ls) == 0:
+            self.ok = False
+        elif len(_lit_ls) == 1:
+            self._enqueue(_lit_ls[0], -1)
+            self.ok = self._propagate() == -1
+        else:
+            self._attach(_lit_ls)
+        return self.ok
+
+    def _attach(self, lit_ls:list[int]) -> int:
+        _c = len(self.clause_ls)
+        self.clause_ls.append(lit_ls)
+        self.watch[lit_ls[0]].append(_c)
+        self.watch[lit_ls[1]].append(_c)
+        return _c
+
+    def _propagate(self) -> int:
+        """Assign the literals implied by the trail, return the idx of a conflicting clause or -1"""
+        _trail = self.trail
+        _value = self.value
+        _watch = self.watch
+        _clause_ls = self.clause_ls
+        while self.head < len(_trail):
+            _false = _trail[self.head] ^ 1
+            self.head += 1
+            self.propagations += 1
+            _ws = _watch[_false]
+            _keep = []
+            _i = 0
+            _n = len(_ws)
+            while _i < _n:
+                _c = _ws[_i]
+                _i += 1
+                _clause = _clause_ls[_c]
+                # deleted learnt clause
+                if _clause is None:
+                    continue
+                if _clause[0] == _false:
+                    _clause[0] = _clause[1]
+                    _clause[1] = _false
+                _first = _clause[0]
+                if _value[_first] == 1:
+                    _keep.append(_c)
+                    continue
+                for _k in range(2, len(_clause)):
+                    _lit = _clause[_k]
+                    if _value[_lit] != -1:
+                        _clause[1] = _lit
+                        _clause[_k] = _false
+                        _watch[_lit].append(_c)
+                        break
+                else:
+                    _keep.append(_c)
+                    if _value[_first] == -1:
+                        _keep.extend(_ws[_i:])
+                        _watch[_false] = _keep
+                        self.head = len(_trail)
+                        return _c
+                    self._enqueue(_first, _c)
+            _watch[_false] = _keep
+        return -1
+
+    def _bump(self, v:int):
+        _activity = self.activity
+        _activity[v] += self.var_inc
+        if _activity[v] > 1e100:
+            for _u in range(1, self.var_cnt + 1):
+                _activity[_u] *= 1e-100
+            self.var_inc *= 1e-100
+            self.heap = [(-_activity[_u], _u) for _u in range(1, self.var_cnt + 1) if self.value[_u * 2] == 0]
+            heapq.heapify(self.heap)
+        elif self.value[v * 2] == 0:
+            heapq.heappush(self.heap, (-_activity[v], v))
+
+    def _analyze(self, conflict:int) -> tuple[list[int], int]:
+        """
+            Learn a clause from a conflict, by resolving the literals of the current level up to the first UIP
+            Return:
+                (learnt clause with the UIP first and a literal of the backjump level second, backjump level)
+        """
+        _seen = self.seen
+        _level = self.level
+        _trail = self.trail
+        _cur = len(self.trail_lim)
+        _learnt = [0]
+        _cnt = 0
+        _lit = -1
+        _idx = len(_trail) - 1
+        _c = conflict
+        while True:
+            _clause = self.clause_ls[_c]
+            for _q in (_clause if _lit == -1 else _clause[1:]):
+                _v = _q >> 1
+                if not _seen[_v] and _level[_v] > 0:
+                    _seen[_v] = True
+                    self._bump(_v)
+                    if _level[_v] == _cur:
+                        _cnt += 1
+                    else:
+                        _learnt.append(_q)
+            while not _seen[_trail[_idx] >> 1]:
+                _idx -= 1
+            _lit = _trail[_idx]
+            _idx -= 1
+            _c = self.reason[_lit >> 1]
+            _seen[_lit >> 1] = False
+            _cnt -= 1
+            if _cnt == 0:
+                break
+        _learnt[0] = _lit ^ 1
+        for _q in _learnt[1:]:
+            _seen[_q >> 1] = False
+
+        _back = 0
+        if len(_learnt) > 1:
+            _best = 1
+            for _k in range(2, len(_learnt)):
+                if _level[_learnt[_k] >> 1] > _level[_learnt[_best] >> 1]:
+                    _best = _k
+            (_learnt[1], _learnt[_best]) = (_learnt[_best], _learnt[1])
+            _back = _level[_learnt[1] >> 1]
+        self.var_inc /= 0.95
+        return (_learnt, _back)
+
+    def _reduce(self):
+        """Delete the longer half of the learnt clauses, except the reasons of assigned literals"""
+        _clause_ls = self.clause_ls
+        _locked = set(self.reason[_lit >> 1] for _lit in self.trail)
+        self.learnt_ls.sort(key=lambda c: len(_clause_ls[c]))
+        _keep = len(self.learnt_ls) // 2
+        _learnt_ls = self.learnt_ls[:_keep]
+        for _c in self.learnt_ls[_keep:]:
+            if _c in _locked or len(_clause_ls[_c]) <= 2:
+                _learnt_ls.append(_c)
+            else:
+                _clause_ls[_c] = None
+        self.learnt_ls = _learnt_ls
+        self.max_learnts += self.max_learnts // 10
+
+    def _decide(self) -> int:
+        """Literal of the most active unassigned variable, -1 if all variables are assigned"""
+        _heap = self.heap
+        _value = self.value
+        while len(_heap) > 0:
+            _v = heapq.heappop(_heap)[1]
+            if _value[_v * 2] == 0:
+                return _v * 2 + self.phase[_v]
+        return -1
+
+    def solve(self, conflict_limit:int=None) -> bool:
+        """
+            Search for an assignment of the clauses
+            Args:
+                `conflict_limit`: give up after this many conflicts, unlimited by default
+            Return:
+                True if satisfiable, see `model`, False if not, None if the limit is reached
+        """
+        if not self.ok:
+            return False
+        self._backtrack(0)
+        if self._propagate() != -1:
+            self.ok = False
+            return False
+        _restart = 1
+        _budget = _luby(_restart) * _RESTART_BASE
+        _conflicts = 0
+        while True:
+            _conflict = self._propagate()
+            if _conflict != -1:
+                self.conflicts += 1
+                _conflicts += 1
+                _budget -= 1
+                if len(self.trail_lim) == 0:
+                    self.ok = False
+                    return False
+                (_learnt, _back) = self._analyze(_conflict)
+                self._backtrack(_back)
+                if len(_learnt) == 1:
+                    self._enqueue(_learnt[0], -1)
+                else:
+                    _c = self._attach(_learnt)
+                    self.learnt_ls.append(_c)
+                    self._enqueue(_learnt[0], _c)
+                continue
+
+            if conflict_limit is not None and _conflicts >= conflict_limit:
+                self._backtrack(0)
+                return None
+            if _budget <= 0:
+                _restart += 1
+                _budget = _luby(_restart) * _RESTART_BASE
+                self._backtrack(0)
+                continue
+            if len(self.learnt_ls) - len(self.trail) >= self.max_learnts:
+                self._reduce()
+            _lit = self._decide()
+            if _lit == -1:
+                return True
+            self.decisions += 1
+            self.trail_lim.append(len(self.trail))
+            self._enqueue(_lit, -1)
+
+    def model(self) -> list[int]:
+        """Value of each variable after a satisfiable `solve`, as DIMACS literals"""
+        return [_v if self.value[_v * 2] == 1 else -_v for _v in range(1, self.var_cnt + 1)]
+
+    def stats(self) -> dict:
+        return {
+            'conflicts': self.conflicts,
+            'decisions': self.decisions,
+            'propagations': self.propagations,
+            'learnts': len(self.learnt_ls),
+        }
+
+class _PySatBackend:
+    """A solver of pysat behind the interface of `CDCL`"""
+    def __init__(self, name:str='cadical153'):
+        if _PySatSolver is None:
+            raise Exception('pysat is not installed, install python-sat or use the cdcl backend')
+        self.solver = _PySatSolver(name=name)
+        self.ok = True
+
+    def add_clause(self, clause:list[int]) -> bool:
+        self.solver.add_clause(clause)
+        return True
+
+    def solve(self, conflict_limit:int=None) -> bool:
+        if conflict_limit is None:
+            return self.solver.solve()
+        self.solver.conf_budget(conflict_limit)
+        return self.solver.solve_limited()
+
+    def model(self) -> list[int]:
+        return self.solver.get_model()
+
+    def stats(self) -> dict:
+        return dict(self.solver.accum_stats())
+
+    def delete(self):
+        self.solver.delete()
+
+def new_sat_solver(backend:str=BACKEND_AUTO):
+    """A SAT solver of `backend`, `BACKEND_AUTO` is pysat if it is installed, else the bundled `CDCL`"""
+    if backend == BACKEND_AUTO:
+        backend = BACKEND_CDCL if _PySatSolver is None else BACKEND_PYSAT
+    if backend == BACKEND_CDCL:
+        return CDCL()
+    if backend == BACKEND_PYSAT:
+        return _PySatBackend()
+    raise Exception('Unknown SAT backend {}'.format(backend))
+
+class HashiCNF:
+    """
+        CNF encoding of a board, on the edges of `Solver`.\n
+        Each edge has 2 variables, `one(e)` for at least one line and `two(e)` for two lines, `two(e)` implies `one(e)`.
+        The lines of a node are a cardinality constraint on these variables, encoded as every clause
+        "at most n of any n+1 of them" and "at least one of any k-n+1 of them" so unit propagation
+        finds what the bounds of `Solver` find. Crossing edges cannot both have lines.\n
+        Connectivity has no small encoding, it is added lazily by `cut_clauses`:
+        a component of the lines found needs a line to the rest of the nodes
+    """
+    def __init__(self, board):
+        self.board = board
+        self.solver = Solver(board)
+        _solver = self.solver
+        self.clause_ls : list[list[int]] = []
+        # number of clauses of `clause_ls` added by `cut_clauses`
+        self.cut_cnt = 0
+        if len(_solver.node_ls) == 0:
+            return
+        # the bounds of an edge before any search, without propagation so the clauses stay the whole puzzle
+        _solver._init_domain()
+
+        for (_e, (_a, _b, _)) in enumerate(_solver.edge_ls):
+            _hi = _solver.hi[_e]
+            self.clause_ls.append([-self.two(_e), self.one(_e)])
+            if _hi < 2:
+                self.clause_ls.append([-self.two(_e)])
+            if _hi < 1:
+                self.clause_ls.append([-self.one(_e)])
+            for _c in _solver.cross_ls[_e]:
+                if _c > _e:
+                    self.clause_ls.append([-self.one(_e), -self.one(_c)])
+
+        for (_i, _edge_ls) in enumerate(_solver.node_edge_ls):
+            _var_ls = [self.one(_e) for _e in _edge_ls if _solver.hi[_e] > 0]
+            _var_ls += [self.two(_e) for _e in _edge_ls if _solver.hi[_e] > 1]
+            _need = _solver.need[_i]
+            if _need < len(_var_ls):
+                for _subset in combinations(_var_ls, _need + 1):
+                    self.clause_ls.append([-_v for _v in _subset])
+            if _need > len(_var_ls):
+                self.clause_ls.append([])
+            elif _need > 0:
+                for _subset in combinations(_var_ls, len(_var_ls) - _need + 1):
+                    self.clause_ls.append(list(_subset))
+
+    @property
+    def var_cnt(self) -> int:
+        return len(self.solver.edge_ls) * 2
+
+    def one(self, e:int) -> int:
+        """Variable of at least one line in edge `e`"""
+        return e * 2 + 1
+
+    def two(self, e:int) -> int:
+        """Variable of two lines in edge `e`"""
+        return e * 2 + 2
+
+    def decode(self, model:list[int]) -> list[int]:
+        """Number of lines of each edge in a model"""
+        _true = set(_l for _l in model if _l > 0)
+        return [
+            2 if self.two(_e) in _true else 1 if self.one(_e) in _true else 0
+            for _e in range(len(self.solver.edge_ls))
+        ]
+
+    def cut_clauses(self, lines:list[int]) -> list[list[int]]:
+        """
+            Clauses that cut off `lines` if they leave the nodes in more than one component,
+            one per component: some edge from the component to a node outside it has a line.
+            The clauses are added to `clause_ls`, an empty list is returned when the lines are connected
+        """
+        _solver = self.solver
+        _set = UnionFind(range(len(_solver.node_ls)))
+        for (_e, (_a, _b, _)) in enumerate(_solver.edge_ls):
+            if lines[_e] > 0:
+                _set.union(_a, _b)
+        if _set.set_cnt <= 1:
+            return []
+        _cut_map : dict[int, list[int]] = {}
+        for (_e, (_a, _b, _)) in enumerate(_solver.edge_ls):
+            (_root_a, _root_b) = (_set.find(_a), _set.find(_b))
+            if _root_a != _root_b and _solver.hi[_e] > 0:
+                _cut_map.setdefault(_root_a, []).append(self.one(_e))
+                _cut_map.setdefault(_root_b, []).append(self.one(_e))
+        _root_set = set(_set.find(_i) for _i in range(len(_solver.node_ls)))
+        _cut_ls = [_cut_map.get(_root, []) for _root in sorted(_root_set)]
+        self.clause_ls += _cut_ls
+        self.cut_cnt += len(_cut_ls)
+        return _cut_ls
+
+    def solve_lines(self, backend:str=BACKEND_AUTO, conflict_limit:int=None, stats:dict=None) -> list[int]:
+        """
+            Solve the clauses, adding cut clauses until the lines found are connected
+            Args:
+                `conflict_limit`: conflicts allowed for each call of the SAT solver, unlimited by default
+                `stats`: dict to fill with the rounds, the cuts and the counters of the SAT solver
+            Return:
+                number of lines of each edge, None if the board has no solution,
+                raise if the conflict limit is reached
+        """
+        if len(self.solver.node_ls) == 0:
+            return None
+        _sat = new_sat_solver(backend)
+        try:
+            for _clause in self.clause_ls:
+                _sat.add_clause(_clause)
+            _rounds = 0
+            _lines = None
+            while True:
+                _rounds += 1
+                _res = _sat.solve(conflict_limit)
+                if _res is None:
+                    raise Exception('Conflict limit reached')
+                if not _res:
+                    break
+                _lines = self.decode(_sat.model())
+                _cut_ls = self.cut_clauses(_lines)
+                if len(_cut_ls) == 0:
+                    break
+                _lines = None
+                for _clause in _cut_ls:
+                    _sat.add_clause(_clause)
+            if stats is not None:
+                stats.update(_sat.stats())
+                stats['rounds'] = _rounds
+                stats['cuts'] = self.cut_cnt
+            return _lines
+        finally:
+            if hasattr(_sat, 'delete'):
+                _sat.delete()
+
+    def write_dimacs(self, file):
+        """Write the clauses in DIMACS format to a text file, with the cut clauses found so far"""
+        _board = self.board
+        file.write('c hashi {}x{} with {} nodes\n'.format(_board.width, _board.height, len(self.solver.node_ls)))
+        file.write('c variable 2e+1: edge e has a line, 2e+2: edge e has two lines\n')
+        for (_e, (_a, _b, _dir)) in enumerate(self.solver.edge_ls):
+            _pos_a = self.solver.node_ls[_a].position
+            _pos_b = self.solver.node_ls[_b].position
+            file.write('c edge {} ({}, {}) ({}, {})\n'.format(_e, _pos_a.row, _pos_a.col, _pos_b.row, _pos_b.col))
+        file.write('c {} connectivity cut clauses\n'.format(self.cut_cnt))
+        file.write('p cnf {} {}\n'.format(self.var_cnt, len(self.clause_ls)))
+        for _clause in self.clause_ls:
+            file.write(' '.join(map(str, _clause)) + ' 0\n')
+
+def solve_sat(board:Board, apply:bool=False, backend:str=BACKEND_AUTO, conflict_limit:int=None,
+              stats:dict=None) -> list[tuple[Node, Node, int]]:
+    """
+        Solve the board with a SAT solver, lines drawn by the player are ignored
+        Args:
+            `apply`: replace the lines in the board with the solution
+            `backend`: `BACKEND_CDCL`, `BACKEND_PYSAT` or `BACKEND_AUTO`
+            `conflict_limit`, `stats`: see `HashiCNF.solve_lines`
+        Return:
+            list of (node, node, number of lines), None if the board has no solution
+    """
+    _cnf = HashiCNF(board)
+    _lines = _cnf.solve_lines(backend, conflict_limit, stats)
+    if _lines is None:
+        return None
+    _solution = _cnf.solver._to_solution(_lines)
+    if apply:
+        board.draw_solution(_solution)
+    return _solution
+
+def write_dimacs(board:Board, path:str, cuts:bool=True, backend:str=BACKEND_AUTO):
+    """
+        Write the CNF of a board to a DIMACS file
+        Args:
+            `cuts`: solve first, so the file has the cut clauses needed for its models to be connected
+    """
+    _cnf = HashiCNF(board)
+    if cuts:
+        _cnf.solve_lines(backend)
+    with open(path, 'w') as _file:
+        _cnf.write_dimacs(_file)
+
+if __name__ == '__main__':
+    import puzzle_io
+    _parser = argparse.ArgumentParser(description='Solve a puzzle with a SAT solver, or export it as DIMACS')
+    _parser.add_argument('path', help='puzzle text file or library')
+    _parser.add_argument('index', type=int, nargs='?', default=0, help='index of the puzzle in a library')
+    _parser.add_argument('-b', '--backend', default=BACKEND_AUTO, choices=(BACKEND_AUTO, BACKEND_CDCL, BACKEND_PYSAT))
+    _parser.add_argument('--dimacs', help='write the CNF with the cut clauses found to this file')
+    _parser.add_argument('--conflicts', type=int, default=None, help='conflicts allowed for each SAT call')
+    _args = _parser.parse_args()
+
+    _board = puzzle_io.load(_args.path, _args.index)
+    _cnf = HashiCNF(_board)
+    _stats = {'variables': _cnf.var_cnt, 'clauses': len(_cnf.clause_ls)}
+    _start = perf_counter()
+    _lines = _cnf.solve_lines(_args.backend, _args.conflicts, _stats)
+    _stats['seconds'] = perf_counter() - _start
+    if _args.dimacs is not None:
+        with open(_args.dimacs, 'w') as _file:
+            _cnf.write_dimacs(_file)
+    if _lines is None:
+        print('No solution')
+    else:
+        _board.draw_solution(_cnf.solver._to_solution(_lines))
+        print(puzzle_io.to_text(_board, lines=True), end='')
+    print(json.dumps(_stats), file=sys.stderr)
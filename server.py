@@ -0,0 +1,381 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
+from board import Board
+from game import Game, MOVE_OK, MOVE_MESSAGE
+from batch import regenerate, task_seed
+from puzzle_io import to_text
+
+# latencies kept by each session for the percentiles
+_LATENCY_WINDOW = 1024
+
+# an error reply is 'error {code} {message}', the code is one of these and the message is the text for it
+ERROR_SYNTAX = 'syntax'
+ERROR_MOVE = 'move'
+ERROR_GAME_OVER = 'game_over'
+ERROR_NO_PUZZLE = 'no_puzzle'
+_ERROR_MESSAGE = {
+    ERROR_SYNTAX: 'Not a move from a node, send {col:02}{row:02}{direction}{action} or r',
+    ERROR_GAME_OVER: 'Game over, send new for another game',
+    ERROR_NO_PUZZLE: 'No puzzle can be generated now',
+}
+
+def error_reply(code:str, message:str=None) -> str:
+    return 'error {} {}\n'.format(code, _ERROR_MESSAGE[code] if message is None else message)
+
+def _generate_islands(task:tuple[list[int], int, int, int]) -> list[list[tuple[int, int, int]]]:
+    """Generate puzzles in a worker, return (row, col, number) of the nodes of each puzzle, None if it failed"""
+    (_seed_ls, _width, _height, _n) = task
+    _puzzle_ls = []
+    for _seed in _seed_ls:
+        try:
+            _board = regenerate(_seed, _width, _height, _n)
+        except Exception:
+            _puzzle_ls.append(None)
+            continue
+        _puzzle_ls.append([(_node.position.row, _node.position.col, _node.n) for _node in _board.node_ls])
+    return _puzzle_ls
+
+class PuzzlePool:
+    """
+        Puzzles generated ahead in the background, so getting a board only places its nodes.\n
+        Puzzles are generated on an executor, a process pool by default, and the pool is refilled
+        as soon as a puzzle is taken.
+        The pool stops when the executor breaks or the generation fails too many times in a row,
+        then `get` raises instead of waiting
+    """
+    def __init__(self, width:int, height:int, node_cnt:int, size:int=64, seed:int=0,
+                 workers:int=None, executor:Executor=None, chunksize:int=8, max_failures:int=None):
+        """
+            Args:
+                `size`: number of puzzles kept ready
+                `seed`: base seed, the i-th puzzle generated uses `task_seed(seed, i)`
+                `workers`: number of generations at once, all cores by default
+                `executor`: executor to generate on, a process pool of `workers` by default
+                `chunksize`: most puzzles generated by one call on the executor
+                `max_failures`: failed puzzles in a row before the pool stops, 4 * `size` by default
+        """
+        self.width = width
+        self.height = height
+        self.node_cnt = node_cnt
+        self.size = size
+        self.seed = seed
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        self.chunksize = chunksize
+        self.own_executor = executor is None
+        self.ready : deque[list[tuple[int, int, int]]] = deque()
+        self.generated = 0
+        self.failed = 0
+        # number of puzzles taken when the pool was empty
+        self.misses = 0
+        # puzzles being generated and calls on the executor running
+        self.pending = 0
+        self.call_cnt = 0
+        self.changed : asyncio.Event = None
+        self.max_failures = 4 * size if max_failures is None else max_failures
+        self.failure_streak = 0
+        # why the pool stopped, None while it works
+        self.error : Exception = None
+
+    async def start(self):
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers)
+        self.changed = asyncio.Event()
+        self._refill()
+
+    def close(self):
+        if self.own_executor and self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+
+    def _refill(self):
+        """Start generations until the ready and pending puzzles fill the pool"""
+        _loop = asyncio.get_running_loop()
+        while self.executor is not None and self.error is None and self.call_cnt < self.workers:
+            _cnt = min(self.chunksize, self.size - len(self.ready) - self.pending)
+            if _cnt <= 0:
+                break
+            _start = self.generated + self.failed + self.pending
+            _task = ([task_seed(self.seed, _i) for _i in range(_start, _start + _cnt)], self.width, self.height, self.node_cnt)
+            try:
+                _future = _loop.run_in_executor(self.executor, _generate_islands, _task)
+            except BrokenExecutor as e:
+                self.error = Exception('Puzzle generation stopped: {}'.format(type(e).__name__))
+                self.changed.set()
+                break
+            self.pending += _cnt
+            self.call_cnt += 1
+            _future.add_done_callback(lambda future, cnt=_cnt: self._on_generated(future, cnt))
+
+    def _on_generated(self, future:asyncio.Future, cnt:int):
+        self.pending -= cnt
+        self.call_cnt -= 1
+        if future.cancelled():
+            return
+        _error = future.exception()
+        if _error is not None:
+            self.failed += cnt
+            self.failure_streak += cnt
+            if isinstance(_error, BrokenExecutor):
+                self.error = Exception('Puzzle generation stopped: {}'.format(type(_error).__name__))
+        else:
+            for _island_ls in future.result():
+                if _island_ls is None:
+                    self.failed += 1
+                    self.failure_streak += 1
+                else:
+                    self.generated += 1
+                    self.failure_streak = 0
+                    self.ready.append(_island_ls)
+        if self.error is None and self.failure_streak >= self.max_failures:
+            self.error = Exception('Puzzle generation failed {} times in a row'.format(self.failure_streak))
+        # waiters check for a puzzle or an error
+        self.changed.set()
+        self._refill()
+
+    async def get(self, timeout:float=None) -> Board:
+        """
+            A new board from the pool, waits for a puzzle only when the pool is empty.\n
+            Raise if the pool has stopped or is closed, or no puzzle is ready within `timeout` seconds
+        """
+        if len(self.ready) == 0:
+            self.misses += 1
+        while len(self.ready) == 0:
+            if self.error is not None:
+                raise self.error
+            if self.executor is None:
+                raise Exception('Puzzle pool is closed')
+            self.changed.clear()
+            self._refill()
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                raise Exception('No puzzle within {}s'.format(timeout))
+        _island_ls = self.ready.popleft()
+        self._refill()
+        _board = Board(self.width, self.height)
+        _board.place_nodes(_island_ls)
+        return _board
+
+class Session:
+    """A player connected to the server, with the latency of its commands"""
+    def __init__(self, session_id:int, game:Game):
+        self.id = session_id
+        self.game = game
+        self.commands = 0
+        self.moves = 0
+        self.games = 1
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_ls : deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    def add_latency(self, seconds:float):
+        self.commands += 1
+        self.latency_sum += seconds
+        if seconds > self.latency_max:
+            self.latency_max = seconds
+        self.latency_ls.append(seconds)
+
+    def metrics(self) -> dict:
+        """Number of commands and moves, and the latency of the commands in milliseconds"""
+        _sorted = sorted(self.latency_ls)
+        def percentile(p:float) -> float:
+            return _sorted[min(len(_sorted) - 1, int(len(_sorted) * p))] * 1000 if len(_sorted) > 0 else 0.0
+        return {
+            'session': self.id,
+            'games': self.games,
+            'commands': self.commands,
+            'moves': self.moves,
+            'latency_mean_ms': self.latency_sum / self.commands * 1000 if self.commands > 0 else 0.0,
+            'latency_p50_ms': percentile(0.5),
+            'latency_p99_ms': percentile(0.99),
+            'latency_max_ms': self.latency_max * 1000,
+        }
+
+class GameServer:
+    """
+        Game sessions over a TCP line protocol, one session per connection, all in one event loop.\n
+        Commands, one per line:
+            a move in the syntax of `Game.parse_input`, answered 'ok', 'won' or 'error {code} {message}'
+            with a code `ERROR_SYNTAX`, `ERROR_MOVE` or `ERROR_GAME_OVER`\n
+            'board': the board as `puzzle_io.to_text` with lines, answered 'board {number of lines}' and the lines\n
+            'new': start a new game, answered like 'board', or 'error no_puzzle {message}' and the game goes on\n
+            'stats': metrics of the session as JSON, answered 'stats {json}'\n
+            'server': metrics of the server as JSON, answered 'server {json}'\n
+            'quit': close the connection\n
+        A new connection gets the board of its first game, or 'error no_puzzle {message}' and is closed
+    """
+    def __init__(self, pool:PuzzlePool, replay_dir:str=None, game_timeout:float=30.0):
+        """
+            Args:
+                `replay_dir`: directory to write a replay log of each game to, see replay.py
+                `game_timeout`: seconds to wait for a puzzle of a new game before an error is replied
+        """
+        self.pool = pool
+        self.replay_dir = replay_dir
+        self.game_timeout = game_timeout
+        self.session_map : dict[int, Session] = {}
+        self.session_cnt = 0
+        self.game_cnt = 0
+        self.server : asyncio.AbstractServer = None
+
+    async def start(self, host:str='127.0.0.1', port:int=0, backlog:int=1024) -> int:
+        """Start listening, return the port, `backlog` is the number of connections waiting to be accepted"""
+        await self.pool.start()
+        self.server = await asyncio.start_server(self._handle, host, port, backlog=backlog)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.pool.close()
+
+    async def _new_game(self) -> Game:
+        _game = Game(board=await self.pool.get(self.game_timeout))
+        self.game_cnt += 1
+        if self.replay_dir is not None:
+            _game.record(os.path.join(self.replay_dir, '{}.hrpl'.format(self.game_cnt)))
+        return _game
+
+    def _board_text(self, game:Game) -> str:
+        _text = to_text(game.board, lines=True)
+        return 'board {}\n{}'.format(_text.count('\n'), _text)
+
+    def _move(self, session:Session, command:str) -> str:
+        _game = session.game
+        if _game.board.is_finish():
+            return error_reply(ERROR_GAME_OVER)
+        try:
+            _move = _game.parse_input(command)
+        except (ValueError, IndexError):
+            return error_reply(ERROR_SYNTAX)
+        _status = _game.apply_moves([_move])['status'][0]
+        if _status != MOVE_OK:
+            return error_reply(ERROR_MOVE, MOVE_MESSAGE[_status])
+        session.moves += 1
+        if _game.board.is_finish():
+            if _game.replay_log is not None:
+                _game.replay_log.finish(_game.board)
+                _game.replay_log = None
+            return 'won\n'
+        return 'ok\n'
+
+    def metrics(self) -> dict:
+        """Metrics of the server and the latency of all sessions connected"""
+        _latency_ls = sorted(_l for _session in self.session_map.values() for _l in _session.latency_ls)
+        def percentile(p:float) -> float:
+            return _latency_ls[min(len(_latency_ls) - 1, int(len(_latency_ls) * p))] * 1000 if len(_latency_ls) > 0 else 0.0
+        return {
+            'sessions': len(self.session_map),
+            'sessions_total': self.session_cnt,
+            'games_total': self.game_cnt,
+            'pool_ready': len(self.pool.ready),
+            'pool_misses': self.pool.misses,
+            'pool_generated': self.pool.generated,
+            'pool_failed': self.pool.failed,
+            'pool_error': None if self.pool.error is None else str(self.pool.error),
+            'latency_p50_ms': percentile(0.5),
+            'latency_p99_ms': percentile(0.99),
+        }
+
+    async def _handle(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        self.session_cnt += 1
+        try:
+            _game = await self._new_game()
+        except Exception as e:
+            print('No game for session {}: {}'.format(self.session_cnt, e), file=sys.stderr)
+            try:
+                writer.write(error_reply(ERROR_NO_PUZZLE).encode())
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+            return
+        _session = Session(self.session_cnt, _game)
+        self.session_map[_session.id] = _session
+        try:
+            writer.write(self._board_text(_session.game).encode())
+            await writer.drain()
+            while True:
+                _line = await reader.readline()
+                if len(_line) == 0:
+                    break
+                _start = perf_counter()
+                _command = _line.decode(errors='replace').strip()
+                if _command == 'quit':
+                    break
+                if _command == 'board':
+                    _reply = self._board_text(_session.game)
+                elif _command == 'new':
+                    try:
+                        _game = await self._new_game()
+                    except Exception as e:
+                        print('No game for session {}: {}'.format(_session.id, e), file=sys.stderr)
+                        _reply = error_reply(ERROR_NO_PUZZLE)
+                    else:
+                        if _session.game.replay_log is not None:
+                            _session.game.replay_log.close()
+                        _session.game = _game
+                        _session.games += 1
+                        _reply = self._board_text(_session.game)
+                elif _command == 'stats':
+                    _reply = 'stats {}\n'.format(json.dumps(_session.metrics()))
+                elif _command == 'server':
+                    _reply = 'server {}\n'.format(json.dumps(self.metrics()))
+                else:
+                    _reply = self._move(_session, _command)
+                writer.write(_reply.encode())
+                _session.add_latency(perf_counter() - _start)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if _session.game.replay_log is not None:
+                _session.game.replay_log.close()
+            del self.session_map[_session.id]
+            writer.close()
+
+async def _main(args):
+    if args.workers == 0:
+        _pool = PuzzlePool(args.width, args.height, args.nodes, args.pool, args.seed, 1, ThreadPoolExecutor(1))
+    else:
+        _pool = PuzzlePool(args.width, args.height, args.nodes, args.pool, args.seed, args.workers)
+    _server = GameServer(_pool, args.replay_dir)
+    _port = await _server.start(args.host, args.port, args.backlog)
+    print('Serving on {}:{}'.format(args.host, _port), file=sys.stderr)
+    try:
+        await _server.serve_forever()
+    finally:
+        await _server.close()
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser(description='Serve hashi games over a TCP line protocol')
+    _parser.add_argument('--host', default='127.0.0.1')
+    _parser.add_argument('-p', '--port', type=int, default=7777)
+    _parser.add_argument('-W', '--width', type=int, default=9)
+    _parser.add_argument('-H', '--height', type=int, default=6)
+    _parser.add_argument('-n', '--nodes', type=int, default=15, help='number of node in each puzzle')
+    _parser.add_argument('--pool', type=int, default=64, help='number of puzzles generated ahead')
+    _parser.add_argument('--seed', type=int, default=0, help='base seed of the puzzles')
+    _parser.add_argument('-j', '--workers', type=int, default=None,
+                         help='processes generating puzzles, all cores by default, 0 for a thread in this process')
+    _parser.add_argument('--backlog', type=int, default=1024, help='connections waiting to be accepted')
+    _parser.add_argument('--replay-dir', default=None, help='directory to write a replay log of each game to')
+    _args = _parser.parse_args()
+    try:
+        asyncio.run(_main(_args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,402 @@
+from __future__ import annotations
+
+from structs import *
+
+def _luby(i:int) -> int:
+    """i-th element of the luby sequence 1, 1, 2, 1, 1, 2, 4, 1, ..."""
+    _k = 1
+    while (1 << _k) - 1 < i:
+        _k += 1
+    while i != (1 << _k) - 1:
+        i -= (1 << (_k-1)) - 1
+        _k = 1
+        while (1 << _k) - 1 < i:
+            _k += 1
+    return 1 << (_k-1)
+
+class Solver:
+    """
+        Constraint propagation + backtracking solver for a board.\n
+        Only the islands (`Node.position` and `Node.n`) are read, lines
+        already drawn on the board are ignored.
+    """
+    def __init__(self, board):
+        self.board = board
+        self.node_ls : list[Node] = list(board.node_ls)
+        self.need : list[int] = [_node.n for _node in self.node_ls]
+
+        # edges between visible islands, each element is (node idx, node idx, direction from first to second)
+        self.edge_ls : list[tuple[int, int, Direction]] = []
+        # edge idx connected to each node
+        self.node_edge_ls : list[list[int]] = [[] for _ in self.node_ls]
+        # edge idx crossing each edge
+        self.cross_ls : list[list[int]] = []
+        # (edge idx, node idx at the other end) of each node
+        self.adj_ls : list[list[tuple[int, int]]] = [[] for _ in self.node_ls]
+
+        self._build_edges()
+        # event that ends `_search` early when it is set, checked every 1024 decisions
+        self.stop = None
+        # object with `wanted()` and `put(prefix_ls, keep)` that takes subtrees away from `_search`, checked with `stop`
+        self.share = None
+
+    def _build_edges(self):
+        """Connect each island to the nearest island on its right and below, and find the crossing edges"""
+        _idx_of = {id(_node): i for i, _node in enumerate(self.node_ls)}
+        (_horizon_ls, _vertical_ls) = pair_nearest_nodes(self.node_ls)
+        for (_a, _b) in _horizon_ls:
+            self._add_edge(_idx_of[id(_a)], _idx_of[id(_b)], Direction.RIGHT())
+        for (_a, _b) in _vertical_ls:
+            self._add_edge(_idx_of[id(_a)], _idx_of[id(_b)], Direction.BOTTOM())
+
+        for (_h, _v) in find_crossings(_horizon_ls, _vertical_ls):
+            _v += len(_horizon_ls)
+            self.cross_ls[_h].append(_v)
+            self.cross_ls[_v].append(_h)
+
+    def _add_edge(self, a:int, b:int, dir:Direction):
+        _e = len(self.edge_ls)
+        self.edge_ls.append((a, b, dir))
+        self.node_edge_ls[a].append(_e)
+        self.node_edge_ls[b].append(_e)
+        self.adj_ls[a].append((_e, b))
+        self.adj_ls[b].append((_e, a))
+        self.cross_ls.append([])
+
+    def _init_domain(self):
+        """Lower and upper bound of the number of lines of each edge"""
+        self.lo = [0] * len(self.edge_ls)
+        self.hi = [min(2, self.need[_a], self.need[_b]) for (_a, _b, _) in self.edge_ls]
+        # two nodes satisfied by the lines between them only would be isolated from the others
+        if len(self.node_ls) > 2:
+            for _e, (_a, _b, _) in enumerate(self.edge_ls):
+                if self.need[_a] == self.need[_b] == self.hi[_e]:
+                    self.hi[_e] -= 1
+        # (edge idx, lo, hi) before each change, to undo the changes when backtracking
+        self.trail : list[tuple[int, int, int]] = []
+        # edges closed since the last connectivity check
+        self.closed : list[int] = []
+        # number of undecided edges of each node
+        self.open_cnt = [0] * len(self.node_ls)
+        for _e, (_a, _b, _) in enumerate(self.edge_ls):
+            if self.lo[_e] < self.hi[_e]:
+                self.open_cnt[_a] += 1
+                self.open_cnt[_b] += 1
+        # visit marks of `_is_linked`
+        self.mark = [0] * len(self.node_ls)
+        self.stamp = 0
+        # number of contradictions found at each node, and the last working number of lines of each edge
+        self.weight = [1] * len(self.node_ls)
+        self.phase = [2] * len(self.edge_ls)
+
+    def _set(self, e:int, lo:int, hi:int):
+        _old_lo = self.lo[e]
+        _old_hi = self.hi[e]
+        self.trail.append((e, _old_lo, _old_hi))
+        if hi == 0 and _old_hi > 0:
+            self.closed.append(e)
+        if lo == hi and _old_lo < _old_hi:
+            (_a, _b, _) = self.edge_ls[e]
+            self.open_cnt[_a] -= 1
+            self.open_cnt[_b] -= 1
+        self.lo[e] = lo
+        self.hi[e] = hi
+
+    def _undo(self, mark:int):
+        """Undo the changes until the trail has `mark` elements"""
+        _trail = self.trail
+        while len(_trail) > mark:
+            (_e, _lo, _hi) = _trail.pop()
+            if _lo < _hi and self.lo[_e] == self.hi[_e]:
+                (_a, _b, _) = self.edge_ls[_e]
+                self.open_cnt[_a] += 1
+                self.open_cnt[_b] += 1
+            self.lo[_e] = _lo
+            self.hi[_e] = _hi
+        self.closed.clear()
+
+    def _propagate(self, queue:list[int]) -> bool:
+        """
+            Tighten the bounds until nothing changes
+            Args:
+                `queue`: idx of nodes to be checked
+            Return:
+                False if contradiction is found
+        """
+        _lo_ls = self.lo
+        _hi_ls = self.hi
+        _need = self.need
+        _edge_ls = self.edge_ls
+        _node_edge_ls = self.node_edge_ls
+        _cross_ls = self.cross_ls
+        _queued = set(queue)
+        while len(queue) > 0:
+            _i = queue.pop()
+            _queued.discard(_i)
+
+            _edges = _node_edge_ls[_i]
+            _sum_lo = 0
+            _sum_hi = 0
+            for _e in _edges:
+                _sum_lo += _lo_ls[_e]
+                _sum_hi += _hi_ls[_e]
+            if _sum_lo > _need[_i] or _sum_hi < _need[_i]:
+                self.weight[_i] += 1
+                return False
+
+            for _e in _edges:
+                _lo = max(_lo_ls[_e], _need[_i] - (_sum_hi - _hi_ls[_e]))
+                _hi = min(_hi_ls[_e], _need[_i] - (_sum_lo - _lo_ls[_e]))
+                if _lo > _hi:
+                    self.weight[_i] += 1
+                    return False
+                if _lo == _lo_ls[_e] and _hi == _hi_ls[_e]:
+                    continue
+
+                # lines in this edge now block every crossing edge
+                if _lo_ls[_e] == 0 and _lo > 0:
+                    for _c in _cross_ls[_e]:
+                        if _lo_ls[_c] > 0:
+                            self.weight[_i] += 1
+                            return False
+                        if _hi_ls[_c] > 0:
+                            self._set(_c, 0, 0)
+                            for _j in _edge_ls[_c][:2]:
+                                if _j not in _queued:
+                                    _queued.add(_j)
+                                    queue.append(_j)
+
+                _sum_lo += _lo - _lo_ls[_e]
+                _sum_hi += _hi - _hi_ls[_e]
+                self._set(_e, _lo, _hi)
+                # both ends are checked again, the edges of `_i` before `_e` were tightened with the old sums
+                for _j in _edge_ls[_e][:2]:
+                    if _j not in _queued:
+                        _queued.add(_j)
+                        queue.append(_j)
+        return True
+
+    def _is_linked(self, a:int, b:int) -> bool:
+        """
+            Check if node `a` and `b` can still be connected, by searching from both side at the same time.\n
+            It stops as soon as either side runs out of nodes, so it is cheap when an alternative path is nearby
+        """
+        _hi_ls = self.hi
+        _adj_ls = self.adj_ls
+        _mark = self.mark
+        # the marks of this search are stamp (from a) and stamp+1 (from b)
+        self.stamp += 2
+        _stamp = self.stamp
+        _mark[a] = _stamp
+        _mark[b] = _stamp + 1
+        _queue = ([a], [b])
+        _head = [0, 0]
+        _turn = 0
+        while _head[0] < len(_queue[0]) and _head[1] < len(_queue[1]):
+            _q = _queue[_turn]
+            _i = _q[_head[_turn]]
+            _head[_turn] += 1
+            _own = _stamp + _turn
+            _other = _stamp + 1 - _turn
+            for (_e, _j) in _adj_ls[_i]:
+                if _hi_ls[_e] == 0:
+                    continue
+                _m = _mark[_j]
+                if _m == _other:
+                    return True
+                if _m != _own:
+                    _mark[_j] = _own
+                    _q.append(_j)
+            _turn = 1 - _turn
+        return False
+
+    def _check_closed(self) -> bool:
+        """
+            Check if the nodes are still connectable after closing edges.\n
+            The nodes were connectable before, so it is enough to check the two ends of each closed edge
+        """
+        _closed = self.closed
+        _ok = True
+        if len(self.node_ls) > 2:
+            for _e in _closed:
+                (_a, _b, _) = self.edge_ls[_e]
+                if not self._is_linked(_a, _b):
+                    self.weight[_a] += 1
+                    self.weight[_b] += 1
+                    _ok = False
+                    break
+        _closed.clear()
+        return _ok
+
+    def _assign(self, e:int, v:int) -> bool:
+        """
+            Set `v` lines to edge `e` and propagate
+            Return:
+                False if contradiction is found
+        """
+        self._set(e, v, v)
+        _queue = list(self.edge_ls[e][:2])
+        if v > 0:
+            for _c in self.cross_ls[e]:
+                if self.lo[_c] > 0:
+                    return False
+                if self.hi[_c] > 0:
+                    self._set(_c, 0, 0)
+                    _queue.extend(self.edge_ls[_c][:2])
+        return self._propagate(_queue) and self._check_closed()
+
+    def _choose_edge(self) -> int:
+        """
+            Choose an undecided edge of the node that failed most often per undecided edge,
+            -1 if all edges are decided
+        """
+        _open_cnt = self.open_cnt
+        _weight = self.weight
+        _best_i = -1
+        _best_score = 0
+        for _i in range(len(_open_cnt)):
+            _cnt = _open_cnt[_i]
+            if _cnt > 0 and _weight[_i] > _best_score * _cnt:
+                _best_score = _weight[_i] / _cnt
+                _best_i = _i
+        if _best_i == -1:
+            return -1
+        for (_e, _) in self.adj_ls[_best_i]:
+            if self.lo[_e] < self.hi[_e]:
+                return _e
+
+    def _search(self, res:list[list[int]], limit:int, budget:int) -> bool:
+        """
+            Depth first search from the current bounds, solutions are appended to `res`
+            Args:
+                `budget`: maximum number of decisions
+            Return:
+                False if the budget is used up or `stop` is set before the search ends
+        """
+        _found = set(tuple(_lines) for _lines in res)
+        # each frame is [edge idx, remaining values, trail length before the edge is decided]
+        _frame_ls = []
+        _descend = True
+        _ok = True
+        while True:
+            if _descend:
+                _e = self._choose_edge()
+                if _e == -1:
+                    if tuple(self.lo) not in _found:
+                        _found.add(tuple(self.lo))
+                        res.append(list(self.lo))
+                        if len(res) >= limit:
+                            break
+                else:
+                    # the value that worked last time is tried first, more lines first at the beginning
+                    _values = list(range(self.lo[_e], self.hi[_e]+1))
+                    if self.phase[_e] in _values:
+                        _values.remove(self.phase[_e])
+                        _values.append(self.phase[_e])
+                    _frame_ls.append([_e, _values, len(self.trail)])
+
+            if len(_frame_ls) == 0:
+                break
+            _frame = _frame_ls[-1]
+            self._undo(_frame[2])
+            if len(_frame[1]) == 0:
+                _frame_ls.pop()
+                _descend = False
+                continue
+            budget -= 1
+            if budget < 0 or (budget & 1023 == 0 and self.stop is not None and self.stop.is_set()):
+                _ok = False
+                break
+            if budget & 1023 == 0 and self.share is not None and self.share.wanted():
+                # the search ends and goes on from the subtree it keeps, a restart from the current bounds
+                # would search the subtrees given away again
+                self._share(_frame_ls)
+                _ok = False
+                break
+            _v = _frame[1].pop()
+            _descend = self._assign(_frame[0], _v)
+            if _descend:
+                self.phase[_frame[0]] = _v
+
+        if len(_frame_ls) > 0:
+            self._undo(_frame_ls[0][2])
+        return _ok
+
+    def _share(self, frame_ls:list[list]):
+        """
+            Give the values left of the shallowest decision of `_search` that has some to `share`,
+            the deepest decision keeps the value it tries next.\n
+            `share.put` gets the (edge idx, number of lines) decided from the bounds at the start of the search
+            before each subtree given away and before the subtree kept, the rest of the tree is searched already
+        """
+        _path = []
+        for (_i, _frame) in enumerate(frame_ls):
+            # the values are tried from the end of the list
+            _last = _i == len(frame_ls) - 1
+            _give = _frame[1][:-1] if _last else _frame[1]
+            if len(_give) > 0 or _last:
+                _keep = _path + [(_frame[0], _frame[1][-1] if _last else self.lo[_frame[0]])]
+                self.share.put([_path + [(_frame[0], _v)] for _v in _give], _keep)
+                return
+            # every decision above the deepest one is still assigned
+            _path.append((_frame[0], self.lo[_frame[0]]))
+
+    def _solve_lines(self, limit:int) -> list[list[int]]:
+        """Return at most `limit` solutions, each is the number of lines of every edge"""
+        if len(self.node_ls) == 0:
+            return []
+        self._init_domain()
+        if not self._propagate(list(range(len(self.node_ls)))):
+            return []
+        # the graph of possible edges itself may be disconnected
+        self.closed.clear()
+        if not self._is_connectable():
+            return []
+        # the search restarts with a larger budget (luby sequence) whenever the budget is used up,
+        # the failure count of each node and the last working values guide the next try
+        _res = []
+        _restart = 1
+        while not self._search(_res, limit, _luby(_restart) * 64):
+            _restart += 1
+        return _res
+
+    def _is_connectable(self) -> bool:
+        """Check if all nodes can be reached from the first node"""
+        _visited = {0}
+        _stack = [0]
+        while len(_stack) > 0:
+            _i = _stack.pop()
+            for _e in self.node_edge_ls[_i]:
+                if self.hi[_e] == 0:
+                    continue
+                (_a, _b, _) = self.edge_ls[_e]
+                _j = _b if _a == _i else _a
+                if _j not in _visited:
+                    _visited.add(_j)
+                    _stack.append(_j)
+        return len(_visited) == len(self.node_ls)
+
+    def _to_solution(self, lines:list[int]) -> list[tuple[Node, Node, int]]:
+        return [
+            (self.node_ls[_a], self.node_ls[_b], lines[_e])
+            for _e, (_a, _b, _) in enumerate(self.edge_ls) if lines[_e] > 0
+        ]
+
+    def solve(self) -> list[tuple[Node, Node, int]]:
+        """
+            Find a solution of the board
+            Return:
+                list of (node, node, number of lines), None if the board has no solution
+        """
+        _res = self._solve_lines(1)
+        if len(_res) == 0:
+            return None
+        return self._to_solution(_res[0])
+
+    def solve_all(self, limit:int=2) -> list[list[tuple[Node, Node, int]]]:
+        """Find at most `limit` different solutions of the board"""
+        return [self._to_solution(_lines) for _lines in self._solve_lines(limit)]
+
+    def count_solutions(self, limit:int=2) -> int:
+        """Count the solutions of the board, stop counting at `limit`"""
+        return len(self._solve_lines(limit))
@@ -0,0 +1,294 @@
+from __future__ import annotations
+from bisect import bisect_left, bisect_right, insort
+
+from structs import *
+from board import Board
+
+class _SpanIndex:
+    """
+        Spans of lines across an axis of `size` positions, each span is a range of positions with a key,
+        like the rows covered by a vertical line and its column.\n
+        Spans are stored in a segment tree over the positions, each tree node keeps the sorted keys
+        of the spans covering it, so adding, removing and the queries are O(log² n)
+    """
+    def __init__(self, size:int):
+        self.size = 1
+        while self.size < size:
+            self.size *= 2
+        # tree node -> sorted keys, only tree nodes with a span are stored
+        self.key_map : dict[int, list[int]] = {}
+
+    def _nodes(self, lo:int, hi:int):
+        """Tree nodes exactly covering positions `lo` to `hi` inclusive"""
+        lo += self.size
+        hi += self.size + 1
+        while lo < hi:
+            if lo & 1:
+                yield lo
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                yield hi
+            lo >>= 1
+            hi >>= 1
+
+    def copy(self) -> _SpanIndex:
+        _index = object.__new__(_SpanIndex)
+        _index.size = self.size
+        _index.key_map = {_node: list(_key_ls) for (_node, _key_ls) in self.key_map.items()}
+        return _index
+
+    def add(self, lo:int, hi:int, key:int):
+        for _node in self._nodes(lo, hi):
+            _key_ls = self.key_map.get(_node)
+            if _key_ls is None:
+                self.key_map[_node] = [key]
+            else:
+                insort(_key_ls, key)
+
+    def remove(self, lo:int, hi:int, key:int):
+        for _node in self._nodes(lo, hi):
+            _key_ls = self.key_map[_node]
+            del _key_ls[bisect_left(_key_ls, key)]
+            if len(_key_ls) == 0:
+                del self.key_map[_node]
+
+    def first_after(self, pos:int, key:int) -> int:
+        """Smallest key greater than `key` of the spans covering `pos`, None if there is none"""
+        _best = None
+        _node = pos + self.size
+        while _node > 0:
+            _key_ls = self.key_map.get(_node)
+            if _key_ls is not None:
+                _i = bisect_right(_key_ls, key)
+                if _i < len(_key_ls) and (_best is None or _key_ls[_i] < _best):
+                    _best = _key_ls[_i]
+            _node >>= 1
+        return _best
+
+    def last_before(self, pos:int, key:int) -> int:
+        """Largest key smaller than `key` of the spans covering `pos`, None if there is none"""
+        _best = None
+        _node = pos + self.size
+        while _node > 0:
+            _key_ls = self.key_map.get(_node)
+            if _key_ls is not None:
+                _i = bisect_left(_key_ls, key)
+                if _i > 0 and (_best is None or _key_ls[_i-1] > _best):
+                    _best = _key_ls[_i-1]
+            _node >>= 1
+        return _best
+
+class SparseBoard(Board):
+    """
+        Board that only stores its nodes and the spans of its lines, memory grows with the number of nodes
+        instead of the area, so very large boards with few nodes fit in memory.\n
+        Nodes are kept in sorted lists per row and per column, and boxes of lines are made from the links of
+        the nodes when asked, so finding a box or the nearest non empty box is O(log n) or O(log² n)
+    """
+    def _init_cells(self):
+        self.board = None
+        self.node_map : dict[int, Node] = {}
+        # row -> sorted columns of the nodes in the row, and column -> sorted rows
+        self.row_map : dict[int, list[int]] = {}
+        self.col_map : dict[int, list[int]] = {}
+        # columns covered by horizontal lines across each column, rows covered by vertical lines across each row
+        self.horizon_span = _SpanIndex(self.width)
+        self.vertical_span = _SpanIndex(self.height)
+        # if the maps and span indexes are shared with a fork
+        self.cells_shared = False
+
+    def _fork_cells(self, board:SparseBoard):
+        # the maps are copied as a whole by the first change of either board, O(number of nodes and lines)
+        self.cells_shared = True
+        board.cells_shared = True
+
+    def _own_cells(self):
+        """Copy the maps and span indexes shared with a fork before changing them"""
+        self.node_map = dict(self.node_map)
+        self.row_map = {_key: list(_value_ls) for (_key, _value_ls) in self.row_map.items()}
+        self.col_map = {_key: list(_value_ls) for (_key, _value_ls) in self.col_map.items()}
+        self.horizon_span = self.horizon_span.copy()
+        self.vertical_span = self.vertical_span.copy()
+        self.cells_shared = False
+
+    def _set_box(self, box:Box):
+        if self.cells_shared:
+            self._own_cells()
+        if isinstance(box, Node):
+            (_row, _col) = (box.position.row, box.position.col)
+            self._clear_box(_row, _col)
+            self.node_map[_row * self.width + _col] = box
+            insort(self.row_map.setdefault(_row, []), _col)
+            insort(self.col_map.setdefault(_col, []), _row)
+        elif not isinstance(box, Line):
+            # boxes of lines are not stored, they come from the links of the nodes
+            self._clear_box(box.position.row, box.position.col)
+
+    def _clear_box(self, row:int, col:int):
+        if self.cells_shared:
+            self._own_cells()
+        if self.node_map.pop(row * self.width + col, None) is None:
+            return
+        for (_map, _key, _value) in ((self.row_map, row, col), (self.col_map, col, row)):
+            _value_ls = _map[_key]
+            del _value_ls[bisect_left(_value_ls, _value)]
+            if len(_value_ls) == 0:
+                del _map[_key]
+
+    def _line_from(self, row:int, col:int, dir:Direction) -> Node:
+        """
+            The nearest node before (`row`, `col`) on the left or above, if it has lines covering (`row`, `col`),
+            None otherwise
+        """
+        _is_horizon = dir.idx == RIGHT_IDX
+        if _is_horizon:
+            _value_ls = self.row_map.get(row)
+            _value = col
+        else:
+            _value_ls = self.col_map.get(col)
+            _value = row
+        if _value_ls is None:
+            return None
+        _i = bisect_left(_value_ls, _value)
+        if _i == 0:
+            return None
+        _prev = _value_ls[_i-1]
+        _node = self.node_map[row * self.width + _prev if _is_horizon else _prev * self.width + col]
+        _to_node = _node.link[dir.idx]
+        if _to_node is None:
+            return None
+        _to_pos = _to_node.position
+        return _node if (_to_pos.col if _is_horizon else _to_pos.row) > _value else None
+
+    def _box_at(self, row:int, col:int) -> Box:
+        _node = self.node_map.get(row * self.width + col)
+        if _node is not None:
+            return _node
+        _from_node = self._line_from(row, col, Direction.RIGHT())
+        if _from_node is not None:
+            _box = HorizonLine(row, col)
+            _box.is_double = _from_node.line_cnt[RIGHT_IDX] == 2
+            return _box
+        _from_node = self._line_from(row, col, Direction.BOTTOM())
+        if _from_node is not None:
+            _box = VerticalLine(row, col)
+            _box.is_double = _from_node.line_cnt[BOTTOM_IDX] == 2
+            return _box
+        return Box(row, col)
+
+    def get_row(self, row:int) -> list[Box]:
+        return [self._box_at(row, _col) for _col in range(self.width)]
+
+    def _span(self, node:Node, to_node:Node, dir:Direction) -> tuple[_SpanIndex, int, int, int]:
+        """(index, first, last, key) of the span of the boxes between two nodes, None if there is no box"""
+        (_a, _b) = (node.position, to_node.position)
+        if dir.is_horizontal():
+            (_lo, _hi) = sorted((_a.col, _b.col))
+            (_index, _key) = (self.horizon_span, _a.row)
+        else:
+            (_lo, _hi) = sorted((_a.row, _b.row))
+            (_index, _key) = (self.vertical_span, _a.col)
+        if _hi - _lo < 2:
+            return None
+        return (_index, _lo + 1, _hi - 1, _key)
+
+    def _mark_line(self, from_node:Node, to_node:Node, dir:Direction, line_class:type):
+        # only the first line adds the span, a second line only changes the line count of the nodes
+        if from_node.line_cnt[dir.idx] != 1:
+            return
+        _span = self._span(from_node, to_node, dir)
+        if _span is not None:
+            if self.cells_shared:
+                self._own_cells()
+                _span = self._span(from_node, to_node, dir)
+            (_index, _lo, _hi, _key) = _span
+            _index.add(_lo, _hi, _key)
+
+    def _unmark_line(self, node:Node, to_node:Node, dir:Direction):
+        if node.line_cnt[dir.idx] != 0:
+            return
+        self._clear_line(node, to_node, dir)
+
+    def _clear_line(self, node:Node, to_node:Node, dir:Direction):
+        _span = self._span(node, to_node, dir)
+        if _span is not None:
+            if self.cells_shared:
+                self._own_cells()
+                _span = self._span(node, to_node, dir)
+            (_index, _lo, _hi, _key) = _span
+            _index.remove(_lo, _hi, _key)
+
+    # the pairs crossing each pair can be many more than the nodes on a sparse board,
+    # so they are not indexed, a pair is checked against the spans of the lines instead
+    def _index_crossings(self, horizon_ls:list[tuple[Node, Node]], vertical_ls:list[tuple[Node, Node]]):
+        pass
+
+    def _update_block(self, node:Node, dir:Direction, delta:int):
+        pass
+
+    def get_neighbour(self, node:Node, dir:Direction) -> Node:
+        if not self.indexed:
+            return super().get_neighbour(node, dir)
+        _near = node.near[dir.idx]
+        if _near is None:
+            return None
+        (_pos, _near_pos) = (node.position, _near.position)
+        if dir.idx == RIGHT_IDX:
+            _line = self.vertical_span.first_after(_pos.row, _pos.col)
+            _blocked = _line is not None and _line < _near_pos.col
+        elif dir.idx == LEFT_IDX:
+            _line = self.vertical_span.last_before(_pos.row, _pos.col)
+            _blocked = _line is not None and _line > _near_pos.col
+        elif dir.idx == BOTTOM_IDX:
+            _line = self.horizon_span.first_after(_pos.col, _pos.row)
+            _blocked = _line is not None and _line < _near_pos.row
+        else:
+            _line = self.horizon_span.last_before(_pos.col, _pos.row)
+            _blocked = _line is not None and _line > _near_pos.row
+        if _blocked:
+            return None
+        return self.node_ls[_near.id] if self.forked else _near
+
+    def _nearest_distance(self, row:int, col:int, dir:Direction) -> int:
+        """
+            Distance from (`row`, `col`) to the nearest non empty box in `dir`,
+            distance to the box just out of bound if there is none
+        """
+        if dir.is_horizontal():
+            (_pos, _across, _size) = (col, row, self.width)
+            _value_ls = self.row_map.get(row, ())
+            # a line along the row starts from a node, so it can only be next to (row, col)
+            _next_is_line = 0 <= col + dir.h < self.width and self._line_from(row, col + dir.h, Direction.RIGHT()) is not None
+            _span = self.vertical_span
+        else:
+            (_pos, _across, _size) = (row, col, self.height)
+            _value_ls = self.col_map.get(col, ())
+            _next_is_line = 0 <= row + dir.v < self.height and self._line_from(row + dir.v, col, Direction.BOTTOM()) is not None
+            _span = self.horizon_span
+        if _next_is_line:
+            return 1
+
+        # nearest node and nearest line across the row or column
+        if dir.idx == RIGHT_IDX or dir.idx == BOTTOM_IDX:
+            _i = bisect_right(_value_ls, _pos)
+            _node = _value_ls[_i] if _i < len(_value_ls) else _size
+            _line = _span.first_after(_across, _pos)
+            _nearest = _node if _line is None else min(_node, _line)
+            return _nearest - _pos
+        _i = bisect_left(_value_ls, _pos)
+        _node = _value_ls[_i-1] if _i > 0 else -1
+        _line = _span.last_before(_across, _pos)
+        _nearest = _node if _line is None else max(_node, _line)
+        return _pos - _nearest
+
+    def get_nearest_non_empty(self, box:Box, dir:Direction) -> Box:
+        (_row, _col) = (box.position.row, box.position.col)
+        _dist = self._nearest_distance(_row, _col, dir)
+        (_r, _c) = (_row + dir.v * _dist, _col + dir.h * _dist)
+        if 0 <= _r < self.height and 0 <= _c < self.width:
+            return self._box_at(_r, _c)
+        return None
+
+    def _free_run(self, node:Node, dir:Direction) -> int:
+        return self._nearest_distance(node.position.row, node.position.col, dir) - 1
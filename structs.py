@@ -1,32 +1,51 @@
 from __future__ import annotations
+from bisect import bisect_left, bisect_right, insort
+from functools import lru_cache
 from colorama import Fore, Style
 
+# index of each direction in the four-slot lists of `Node`, opposite directions differ in the last bit
+UP_IDX = 0
+BOTTOM_IDX = 1
+LEFT_IDX = 2
+RIGHT_IDX = 3
+
 class Direction:
-    """Vector that represent a direction"""
+    """
+        Vector that represent a direction.\n
+        The four unit directions are shared objects, `Direction.UP()` etc. never allocate
+    """
+    __slots__ = ('v', 'h', 'idx')
+
     @staticmethod
     def UP() -> Direction:
-        return Direction(-1, 0)
+        return _UP
     @staticmethod
     def BOTTOM() -> Direction:
-        return Direction(1, 0)
+        return _BOTTOM
     @staticmethod
     def LEFT() -> Direction:
-        return Direction(0, -1)
+        return _LEFT
     @staticmethod
     def RIGHT() -> Direction:
-        return Direction(0, 1)
+        return _RIGHT
 
-    def __init__(self, v, h):
+    def __init__(self, v, h, idx:int=-1):
         """
             Args:
                 v (number): vertical scalar, negative means up
                 h (number): horizontal scalar, negative means left
+                idx (int): index of the unit direction, -1 for other directions
         """
         self.v = v
         self.h = h
+        self.idx = idx
     def __eq__(self, _v):
+        if self is _v:
+            return True
         assert isinstance(_v, Direction)        
         return self.v == _v.v and self.h == _v.h
+    def __hash__(self):
+        return hash((self.v, self.h))
 
     def is_horizontal(self) -> bool:
         return self.v == 0 and self.h != 0
@@ -35,13 +54,28 @@ class Direction:
 
     def add(self, _dir) -> Direction:
         assert isinstance(_dir, Direction)
-        return Direction(self.v+_dir.v, self.h+_dir.h)
+        return _unit_or_new(self.v+_dir.v, self.h+_dir.h)
     def opposite(self) -> Direction:
-        assert isinstance(self, Direction)
+        if self.idx != -1:
+            return DIRECTIONS[self.idx ^ 1]
         return Direction(-self.v, -self.h)
 
+_UP = Direction(-1, 0, UP_IDX)
+_BOTTOM = Direction(1, 0, BOTTOM_IDX)
+_LEFT = Direction(0, -1, LEFT_IDX)
+_RIGHT = Direction(0, 1, RIGHT_IDX)
+# unit directions, in index order
+DIRECTIONS = (_UP, _BOTTOM, _LEFT, _RIGHT)
+_UNIT_MAP = {(_d.v, _d.h): _d for _d in DIRECTIONS}
+
+def _unit_or_new(v, h) -> Direction:
+    _dir = _UNIT_MAP.get((v, h))
+    return _dir if _dir is not None else Direction(v, h)
+
 class Position:
-    """Position in the game board"""
+    """Position in the game board, ordered by row then column"""
+    __slots__ = ('row', 'col')
+
     def __init__(self, row, col):
         self.row = row
         self.col = col
@@ -50,48 +84,106 @@ class Position:
     def __eq__(self, _value):
         assert isinstance(_value, Position)
         return self.row == _value.row and self.col == _value.col
+    def __lt__(self, _value):
+        return (self.row, self.col) < (_value.row, _value.col)
+    def __hash__(self):
+        return hash((self.row, self.col))
     
     def move_to(self, dir) -> Position:
-        assert isinstance(dir, Direction)
         return Position(self.row+dir.v, self.col+dir.h)
     
     def dir_to(self, _pos) -> Direction:
-        assert isinstance(_pos, Position)
-        _dv = _pos.row - self.row
-        _dh = _pos.col - self.col
-        
-        _v = int(_dv / abs(_dv)) if _dv != 0 else 0
-        _h = int(_dh / abs(_dh)) if _dh != 0 else 0
-        return Direction(_v, _h)
+        _v = (_pos.row > self.row) - (_pos.row < self.row)
+        _h = (_pos.col > self.col) - (_pos.col < self.col)
+        return _unit_or_new(_v, _h)
 
 # an empty box in the game board
 class Box:
+    __slots__ = ('position',)
+
     def __init__(self, row:int, col:int):
         self.position = Position(row, col)
 
+    @classmethod
+    def at(cls, position:Position) -> Box:
+        """Empty box sharing `position`, positions are never changed so the boxes of a cell can share one"""
+        _box = object.__new__(cls)
+        _box.position = position
+        return _box
+
     def __str__(self):
         return '  '
     
     def is_empty(self) -> bool:
         return True
+
+def _item_property(name:str, idx:int) -> property:
+    """Property for an item of the four-slot list `name`"""
+    def _get(self):
+        return getattr(self, name)[idx]
+    def _set(self, value):
+        getattr(self, name)[idx] = value
+    return property(_get, _set)
     
 # Node
 class Node(Box):
+    """
+        Node with four-slot lists indexed by `Direction.idx`,
+        the named attributes like `node_up` and `up_line_cnt` are views of the lists
+    """
+    __slots__ = ('n', 'link', 'line_cnt', 'near', 'block', 'cross_right', 'cross_bottom', 'id', 'owner')
+
     def __init__(self, row, col):
         super().__init__(row, col)
         
         # number of this node
         self.n : int = 0 
         
-        # variables related to linked node
-        self.node_up : Node = None
-        self.node_bottom : Node = None
-        self.node_left : Node = None
-        self.node_right : Node = None
-        self.up_line_cnt : int = 0
-        self.bottom_line_cnt : int = 0
-        self.left_line_cnt : int = 0
-        self.right_line_cnt : int = 0
+        # linked node and number of lines in each direction
+        self.link : list[Node] = [None, None, None, None]
+        self.line_cnt : list[int] = [0, 0, 0, 0]
+
+        # neighbour index, filled by `Board.build_neighbour_index`
+        # nearest node in each direction, lines are ignored
+        self.near : list[Node] = [None, None, None, None]
+        # number of crossing lines between this node and the nearest node in each direction
+        self.block : list[int] = [0, 0, 0, 0]
+        # upper nodes of the vertical pairs crossing the pair on the right,
+        # and left nodes of the horizontal pairs crossing the pair below, most nodes share the empty tuple
+        self.cross_right : list[Node] = ()
+        self.cross_bottom : list[Node] = ()
+        # index in `node_ls` of the board and the version of the board owning this object,
+        # forks of a board share nodes until one of them changes a node, see `Board.fork`
+        self.id : int = -1
+        self.owner : object = None
+
+    node_up = _item_property('link', UP_IDX)
+    node_bottom = _item_property('link', BOTTOM_IDX)
+    node_left = _item_property('link', LEFT_IDX)
+    node_right = _item_property('link', RIGHT_IDX)
+    up_line_cnt = _item_property('line_cnt', UP_IDX)
+    bottom_line_cnt = _item_property('line_cnt', BOTTOM_IDX)
+    left_line_cnt = _item_property('line_cnt', LEFT_IDX)
+    right_line_cnt = _item_property('line_cnt', RIGHT_IDX)
+    near_up = _item_property('near', UP_IDX)
+    near_bottom = _item_property('near', BOTTOM_IDX)
+    near_left = _item_property('near', LEFT_IDX)
+    near_right = _item_property('near', RIGHT_IDX)
+    block_up = _item_property('block', UP_IDX)
+    block_bottom = _item_property('block', BOTTOM_IDX)
+    block_left = _item_property('block', LEFT_IDX)
+    block_right = _item_property('block', RIGHT_IDX)
+
+    def clone(self) -> Node:
+        """Copy of the node with its own lines, the neighbour index is shared"""
+        _node = object.__new__(type(self))
+        for _cls in type(self).__mro__:
+            for _name in getattr(_cls, '__slots__', ()):
+                setattr(_node, _name, getattr(self, _name))
+        _node.link = self.link.copy()
+        _node.line_cnt = self.line_cnt.copy()
+        _node.block = self.block.copy()
+        return _node
 
     def __str__(self):
         line_cnt = self.get_line_cnt()
@@ -107,106 +199,50 @@ class Node(Box):
         return False
     
     def get_line_cnt(self) -> int:
-        return self.up_line_cnt + self.bottom_line_cnt + self.left_line_cnt + self.right_line_cnt
+        _cnt = self.line_cnt
+        return _cnt[0] + _cnt[1] + _cnt[2] + _cnt[3]
     
     def get_line_cnt_in_dir(self, _dir:Direction) -> int:
-        if _dir == Direction.UP():
-            return self.up_line_cnt
-        elif _dir == Direction.BOTTOM():
-            return self.bottom_line_cnt
-        elif _dir == Direction.LEFT():
-            return self.left_line_cnt
-        elif _dir == Direction.RIGHT():
-            return self.right_line_cnt
+        return self.line_cnt[_dir.idx]
     
     def get_node_in_dir(self, _dir:Direction) -> Node:
-        if _dir == Direction.UP():
-            return self.node_up
-        elif _dir == Direction.BOTTOM():
-            return self.node_bottom
-        elif _dir == Direction.LEFT():
-            return self.node_left
-        elif _dir == Direction.RIGHT():
-            return self.node_right
+        return self.link[_dir.idx]
+
+    def get_visible_node(self, _dir:Direction) -> Node:
+        """Get the nearest node in `_dir` if no line is crossing between them, need the neighbour index"""
+        _i = _dir.idx
+        return self.near[_i] if self.block[_i] == 0 else None
     
     def get_unlinked_dir(self) -> list[Direction]:
-        res = []
-        if self.up_line_cnt == 0:
-            res.append(Direction.UP())
-        if self.bottom_line_cnt == 0:
-            res.append(Direction.BOTTOM())
-        if self.left_line_cnt == 0:
-            res.append(Direction.LEFT())
-        if self.right_line_cnt == 0:
-            res.append(Direction.RIGHT())
-        return res
+        _cnt = self.line_cnt
+        return [_dir for _dir in DIRECTIONS if _cnt[_dir.idx] == 0]
     
     def get_linked_dir(self) -> list[Direction]:
-        res = []
-        if self.up_line_cnt > 0:
-            res.append(Direction.UP())
-        if self.bottom_line_cnt > 0:
-            res.append(Direction.BOTTOM())
-        if self.left_line_cnt > 0:
-            res.append(Direction.LEFT())
-        if self.right_line_cnt > 0:
-            res.append(Direction.RIGHT())
-        return res
+        _cnt = self.line_cnt
+        return [_dir for _dir in DIRECTIONS if _cnt[_dir.idx] > 0]
     
     def link_node(self, _node:Node):
         _dir = self.position.dir_to(_node.position)
         
         assert _dir.is_horizontal() or _dir.is_vertical()
         
-        if _dir == Direction.UP():
-            assert self.node_up is None or self.node_up == _node
-            self.node_up = _node
-            self.up_line_cnt += 1
-        elif _dir == Direction.BOTTOM():
-            assert self.node_bottom is None or self.node_bottom == _node
-            self.node_bottom = _node
-            self.bottom_line_cnt += 1
-        elif _dir == Direction.LEFT():
-            assert self.node_left is None or self.node_left == _node
-            self.node_left = _node
-            self.left_line_cnt += 1
-        elif _dir == Direction.RIGHT():
-            assert self.node_right is None or self.node_right == _node
-            self.node_right = _node
-            self.right_line_cnt += 1
+        _i = _dir.idx
+        assert self.link[_i] is None or self.link[_i] is _node
+        self.link[_i] = _node
+        self.line_cnt[_i] += 1
             
     def unlink_dir(self, _dir:Direction):
         """
             Erase a line in a direction
         """
-        if _dir == Direction.UP():
-            assert self.up_line_cnt > 0
-            self.node_up.bottom_line_cnt -= 1
-            self.up_line_cnt -= 1
-            if self.node_up.bottom_line_cnt == 0:
-                self.node_up.node_bottom = None
-                self.node_up = None
-        elif _dir == Direction.BOTTOM():
-            assert self.bottom_line_cnt > 0
-            self.node_bottom.up_line_cnt -= 1
-            self.bottom_line_cnt -= 1
-            if self.node_bottom.up_line_cnt == 0:
-                self.node_bottom.node_up = None
-                self.node_bottom = None
-        elif _dir == Direction.LEFT():
-            assert self.left_line_cnt > 0
-            self.node_left.right_line_cnt -= 1
-            self.left_line_cnt -= 1
-            if self.node_left.right_line_cnt == 0:
-                self.node_left.node_right = None
-                self.node_left = None
-        elif _dir == Direction.RIGHT():
-            assert self.right_line_cnt > 0
-            self.node_right.left_line_cnt -= 1
-            self.right_line_cnt -= 1
-            if self.node_right.left_line_cnt == 0:
-                self.node_right.node_left = None
-                self.node_right = None
+        _i = _dir.idx
+        assert self.line_cnt[_i] > 0
+        _node = self.link[_i]
+        _node.line_cnt[_i ^ 1] -= 1
+        self.line_cnt[_i] -= 1
+        if _node.line_cnt[_i ^ 1] == 0:
+            _node.link[_i ^ 1] = None
+            self.link[_i] = None
             
     def clear_link(self):
         for dir in self.get_linked_dir():
@@ -215,6 +251,8 @@ class Node(Box):
                     
 # Line 
 class Line(Box):
+    __slots__ = ('dir', 'is_double')
+
     def __init__(self, dir:Direction, row, col):
         super().__init__(row, col)
         
@@ -224,14 +262,209 @@ class Line(Box):
     def is_empty(self) -> bool:
         return False
 
+    @classmethod
+    def at(cls, position:Position) -> Line:
+        """Single line of a subclass sharing `position`, see `Box.at`"""
+        _line = object.__new__(cls)
+        _line.position = position
+        _line.dir = cls.DIR
+        _line.is_double = False
+        return _line
+
 class HorizonLine(Line):
+    __slots__ = ()
+    DIR = _RIGHT
+
     def __init__(self, row, col):
         super().__init__(Direction.RIGHT(), row, col)
     def __str__(self):
         return '==' if self.is_double else '--'
 
 class VerticalLine(Line):
+    __slots__ = ()
+    DIR = _UP
+
     def __init__(self, row, col):
         super().__init__(Direction.UP(), row, col)
     def __str__(self):
         return '||' if self.is_double else ' |'
+
+class UnionFind:
+    """Disjoint sets, with path halving and union by size"""
+    __slots__ = ('parent', 'size', 'set_cnt')
+
+    def __init__(self, items:list=()):
+        self.parent : dict = {}
+        self.size : dict = {}
+        # number of disjoint sets
+        self.set_cnt : int = 0
+        for _item in items:
+            self.add(_item)
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+            self.set_cnt += 1
+
+    def find(self, item):
+        _parent = self.parent
+        while _parent[item] != item:
+            _parent[item] = _parent[_parent[item]]
+            item = _parent[item]
+        return item
+
+    def union(self, a, b) -> bool:
+        """Merge the sets of `a` and `b`, return False if they are in the same set already"""
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            (a, b) = (b, a)
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        self.set_cnt -= 1
+        return True
+
+class RollbackUnionFind:
+    """
+        Disjoint sets of 0 to n-1, with union by size and no path compression so finding is O(log n)
+        and the latest unions can be undone in O(1)
+    """
+    __slots__ = ('parent', 'size', 'set_cnt', 'history')
+
+    def __init__(self, n:int):
+        self.parent : list[int] = list(range(n))
+        self.size : list[int] = [1] * n
+        # number of disjoint sets
+        self.set_cnt : int = n
+        # root merged into another root by each union, -1 if the union merged nothing
+        self.history : list[int] = []
+
+    def find(self, item:int) -> int:
+        _parent = self.parent
+        while _parent[item] != item:
+            item = _parent[item]
+        return item
+
+    def union(self, a:int, b:int) -> bool:
+        """Merge the sets of `a` and `b`, return False if they are in the same set already"""
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            self.history.append(-1)
+            return False
+        if self.size[a] < self.size[b]:
+            (a, b) = (b, a)
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        self.set_cnt -= 1
+        self.history.append(b)
+        return True
+
+    def rollback(self):
+        """Undo the latest union not undone yet"""
+        _b = self.history.pop()
+        if _b == -1:
+            return
+        _a = self.parent[_b]
+        self.parent[_b] = _b
+        self.size[_a] -= self.size[_b]
+        self.set_cnt += 1
+
+def pair_nearest_nodes(node_ls:list[Node]) -> tuple[list[tuple[Node, Node]], list[tuple[Node, Node]]]:
+    """
+        Pair each node with the nearest node on its right and below, lines are ignored
+        Return:
+            (horizontal pairs as (left, right), vertical pairs as (up, bottom))
+    """
+    _row_map : dict[int, list[Node]] = {}
+    _col_map : dict[int, list[Node]] = {}
+    for _node in node_ls:
+        _row_map.setdefault(_node.position.row, []).append(_node)
+        _col_map.setdefault(_node.position.col, []).append(_node)
+
+    _horizon_ls = []
+    for _ls in _row_map.values():
+        _ls.sort(key=lambda _n: _n.position.col)
+        _horizon_ls.extend(zip(_ls, _ls[1:]))
+    _vertical_ls = []
+    for _ls in _col_map.values():
+        _ls.sort(key=lambda _n: _n.position.row)
+        _vertical_ls.extend(zip(_ls, _ls[1:]))
+    return (_horizon_ls, _vertical_ls)
+
+def find_crossings(horizon_ls:list[tuple[Node, Node]], vertical_ls:list[tuple[Node, Node]]) -> list[tuple[int, int]]:
+    """
+        Find the horizontal and vertical pairs whose lines would cross,
+        by sweeping the rows from top to bottom and keeping the vertical pairs passing through the current row
+        Return:
+            list of (idx in `horizon_ls`, idx in `vertical_ls`)
+    """
+    _start : dict[int, list[int]] = {}
+    _end : dict[int, list[int]] = {}
+    _horizon : dict[int, list[int]] = {}
+    for _i, (_a, _) in enumerate(horizon_ls):
+        _horizon.setdefault(_a.position.row, []).append(_i)
+    for _i, (_a, _b) in enumerate(vertical_ls):
+        _start.setdefault(_a.position.row, []).append(_i)
+        _end.setdefault(_b.position.row, []).append(_i)
+
+    # column of active vertical pairs, and the pair in that column
+    _res = []
+    _active_col : list[int] = []
+    _active_pair : dict[int, int] = {}
+    for _row in sorted(set(_start) | set(_end) | set(_horizon)):
+        for _i in _end.get(_row, []):
+            _col = vertical_ls[_i][0].position.col
+            _active_col.pop(bisect_left(_active_col, _col))
+            del _active_pair[_col]
+        for _i in _horizon.get(_row, []):
+            _c1 = horizon_ls[_i][0].position.col
+            _c2 = horizon_ls[_i][1].position.col
+            for _k in range(bisect_right(_active_col, _c1), bisect_left(_active_col, _c2)):
+                _res.append((_i, _active_pair[_active_col[_k]]))
+        for _i in _start.get(_row, []):
+            _col = vertical_ls[_i][0].position.col
+            insort(_active_col, _col)
+            _active_pair[_col] = _i
+    return _res
+
+MASK64 = (1 << 64) - 1
+
+def splitmix64(x:int) -> int:
+    """Mix `x` into a well spread 64-bit integer"""
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+# zobrist keys are made from the index of the box (row * width + col) when needed, so no table is stored.
+# the lowest 4 bits tell the kind of key: 1 to 8 for a node number, 9 to 12 for the lines from a node
+def zobrist_node_key(idx:int, n:int) -> int:
+    """Key of a node with number `n` at box `idx`"""
+    return splitmix64((idx << 4) | n)
+
+def zobrist_line_key(idx:int, is_vertical:bool, cnt:int) -> int:
+    """Key of `cnt` lines from the node at box `idx` to the right or below, 0 for no line"""
+    if cnt == 0:
+        return 0
+    return splitmix64((idx << 4) | (8 + is_vertical * 2 + cnt))
+
+# asked by every draw and erase, the changes of the pairs played recently are kept
+@lru_cache(maxsize=1 << 16)
+def zobrist_line_change(idx:int, is_vertical:bool, cnt:int) -> int:
+    """Change of the hash when `cnt` lines from the node at box `idx` become `cnt` + 1 or the other way"""
+    return zobrist_line_key(idx, is_vertical, cnt) ^ zobrist_line_key(idx, is_vertical, cnt + 1)
+
+def zobrist_size_key(width:int, height:int) -> int:
+    """Key of the size of the board"""
+    return splitmix64(splitmix64(width) ^ height)
+
+def zobrist_layout_hash(width:int, height:int, island_ls:list[tuple[int, int, int]]) -> int:
+    """`Board.layout_hash` of a puzzle given as (row, col, number) of its nodes, without a board"""
+    _hash = zobrist_size_key(width, height)
+    for (_row, _col, _n) in island_ls:
+        _hash ^= zobrist_node_key(_row * width + _col, _n)
+    return _hash
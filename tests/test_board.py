@@ -0,0 +1,197 @@
+import random
+
+import pytest
+
+from board import Board
+from compact import CompactBoard
+from puzzle_io import _islands
+from sparse import SparseBoard
+from structs import BOTTOM_IDX, DIRECTIONS, RIGHT_IDX, Line, Position, RollbackUnionFind
+
+def _is_finish(board:Board) -> bool:
+    """Every node has its lines and all nodes are linked, checked by a search over the nodes"""
+    if any(_node.n != _node.get_line_cnt() for _node in board.node_ls):
+        return False
+    _visited = {board.node_ls[0].position}
+    _stack = [board.node_ls[0]]
+    while len(_stack) > 0:
+        _node = _stack.pop()
+        for _dir in _node.get_linked_dir():
+            _to_node = _node.get_node_in_dir(_dir)
+            if _to_node.position not in _visited:
+                _visited.add(_to_node.position)
+                _stack.append(_to_node)
+    return len(_visited) == len(board.node_ls)
+
+def _count_rebuilds(monkeypatch) -> list[int]:
+    _cnt = [0]
+    _build = Board._build_link_set
+    def _counted(self):
+        _cnt[0] += 1
+        _build(self)
+    monkeypatch.setattr(Board, '_build_link_set', _counted)
+    return _cnt
+
+def test_rollback_union_find():
+    _set = RollbackUnionFind(4)
+    assert _set.union(0, 1)
+    assert _set.union(2, 3)
+    assert not _set.union(1, 0)
+    assert _set.union(1, 3)
+    assert _set.set_cnt == 1
+    _set.rollback()
+    assert _set.set_cnt == 2
+    assert _set.find(0) == _set.find(1) and _set.find(2) == _set.find(3) and _set.find(0) != _set.find(2)
+    _set.rollback()
+    _set.rollback()
+    assert _set.set_cnt == 3
+    assert _set.find(2) != _set.find(3)
+
+@pytest.mark.parametrize('seed', range(6))
+def test_finish_matches_search(seed):
+    _rng = random.Random(seed)
+    _board = Board(10, 10)
+    _board.generate(20, seed=seed)
+    _solution = _board.solve(apply=True)
+    assert _board.is_finish()
+    for _ in range(300):
+        _node = _rng.choice(_board.node_ls)
+        _dir = _rng.choice(DIRECTIONS)
+        if _rng.random() < 0.5 and _node.get_line_cnt_in_dir(_dir) > 0:
+            _board.erase_line(_node, _dir)
+        elif _board.can_draw(_node, _dir):
+            _board.draw_line(_node, _board.get_neighbour(_node, _dir))
+        assert _board.is_finish() == _is_finish(_board)
+    _board.draw_solution(_solution)
+    assert _board.is_finish()
+
+@pytest.mark.parametrize('seed', range(4))
+def test_erase_redraw_does_not_rebuild(seed, monkeypatch):
+    _board = Board(12, 12)
+    _board.generate(30, seed=seed)
+    _board.solve(apply=True)
+    _rebuild_cnt = _count_rebuilds(monkeypatch)
+    for _node in list(_board.node_ls):
+        for _dir in _node.get_linked_dir():
+            _to_node = _node.get_node_in_dir(_dir)
+            _line_cnt = _node.get_line_cnt_in_dir(_dir)
+            _before = _rebuild_cnt[0]
+            for _ in range(20):
+                for _ in range(_line_cnt):
+                    _board.erase_line(_node, _dir)
+                assert not _board.is_finish()
+                for _ in range(_line_cnt):
+                    _board.draw_line(_node, _to_node)
+                assert _board.is_finish()
+            # only the first erase of a pair older than the latest one rebuilds the union find
+            assert _rebuild_cnt[0] - _before <= 1
+
+def _lines(board:Board) -> set[tuple]:
+    """(position, position, number of lines) of each pair with lines, the links may point to nodes of a fork"""
+    _line_set = set()
+    for _node in board.node_ls:
+        for _i in (RIGHT_IDX, BOTTOM_IDX):
+            if _node.line_cnt[_i] > 0:
+                _to_node = board.resolve(_node.link[_i])
+                assert _to_node.line_cnt[_i ^ 1] == _node.line_cnt[_i]
+                _line_set.add((_node.position, _to_node.position, _node.line_cnt[_i]))
+    return _line_set
+
+def _rebuilt(board:Board) -> Board:
+    """Board of the same class made from scratch with the islands and the lines of `board`"""
+    _board = type(board)(board.width, board.height)
+    _board.place_nodes(_islands(board))
+    for (_a, _b, _cnt) in _lines(board):
+        for _ in range(_cnt):
+            _board.draw_line(_board.get(_a), _board.get(_b))
+    return _board
+
+def _assert_rebuilt(board:Board):
+    _fresh = _rebuilt(board)
+    assert _lines(board) == _lines(_fresh)
+    assert board.state_hash() == _fresh.state_hash()
+    assert board.is_finish() == _fresh.is_finish() == _is_finish(board)
+    for _row in range(board.height):
+        for _col in range(board.width):
+            (_box, _fresh_box) = (board.get(Position(_row, _col)), _fresh.get(Position(_row, _col)))
+            assert type(_box).__name__ == type(_fresh_box).__name__
+            assert not isinstance(_box, Line) or _box.is_double == _fresh_box.is_double
+    for _node in board.node_ls:
+        assert board.get(_node.position) is _node
+        for _dir in DIRECTIONS:
+            _near = board.get_neighbour(_node, _dir)
+            _fresh_near = _fresh.get_neighbour(_fresh.get(_node.position), _dir)
+            assert (_near is None) == (_fresh_near is None)
+            assert _near is None or _near.position == _fresh_near.position
+
+def _play(board:Board, rng:random.Random, cnt:int):
+    """Draw and erase `cnt` random lines"""
+    for _ in range(cnt):
+        _node = rng.choice(board.node_ls)
+        _dir = rng.choice(DIRECTIONS)
+        if rng.random() < 0.4 and _node.get_line_cnt_in_dir(_dir) > 0:
+            board.erase_line(_node, _dir)
+        elif board.can_draw(_node, _dir):
+            board.draw_line(_node, board.get_neighbour(_node, _dir))
+
+@pytest.mark.parametrize('cls', [Board, CompactBoard, SparseBoard])
+@pytest.mark.parametrize('seed', range(4))
+def test_fork_sides_are_independent(cls, seed):
+    _rng = random.Random(seed)
+    _source = Board(11, 9)
+    _source.generate(24, seed=seed)
+    _board = cls(11, 9)
+    _board.place_nodes(_islands(_source))
+    _play(_board, _rng, 40)
+
+    _fork = _board.fork()
+    _before = (_lines(_board), _board.state_hash())
+    _play(_fork, _rng, 60)
+    # the fork's changes are not seen by the board
+    assert (_lines(_board), _board.state_hash()) == _before
+    _assert_rebuilt(_board)
+    _fork_before = (_lines(_fork), _fork.state_hash())
+    _play(_board, _rng, 60)
+    assert (_lines(_fork), _fork.state_hash()) == _fork_before
+    _assert_rebuilt(_fork)
+    _assert_rebuilt(_board)
+
+    # a fork of a fork, all three change
+    _fork_fork = _fork.fork()
+    _state_ls = [(_lines(_b), _b.state_hash()) for _b in (_board, _fork)]
+    _play(_fork_fork, _rng, 60)
+    assert [(_lines(_b), _b.state_hash()) for _b in (_board, _fork)] == _state_ls
+    _play(_fork, _rng, 30)
+    _play(_board, _rng, 30)
+    for _b in (_board, _fork, _fork_fork):
+        _assert_rebuilt(_b)
+        _b.clear_lines()
+        assert _b.state_hash() == _b.layout_hash
+
+@pytest.mark.parametrize('cls', [Board, CompactBoard, SparseBoard])
+def test_fork_solves_like_board(cls):
+    _source = Board(12, 12)
+    _source.generate(30, unique=True, seed=3)
+    _board = cls(12, 12)
+    _board.place_nodes(_islands(_source))
+    _fork = _board.fork()
+    _fork.solve(apply=True)
+    assert _fork.is_finish()
+    assert not _board.is_finish()
+    assert _lines(_board) == set()
+    _assert_rebuilt(_fork)
+    _board.solve(apply=True)
+    assert _lines(_board) == _lines(_fork)
+
+def test_compact_fork_copies_only_changed_rows():
+    _board = CompactBoard(40, 40)
+    _board.generate(60, seed=2)
+    _fork = _board.fork()
+    _node = next(_node for _node in _fork.node_ls if _node.get_unlinked_dir()
+                 and any(_fork.can_draw(_node, _dir) and _dir.is_horizontal() for _dir in DIRECTIONS))
+    _dir = next(_dir for _dir in DIRECTIONS if _dir.is_horizontal() and _fork.can_draw(_node, _dir))
+    _fork.draw_line(_node, _fork.get_neighbour(_node, _dir))
+    # a horizontal line changes one row, the other rows are still shared
+    _row = _node.position.row
+    assert [_r for _r in range(40) if _fork.kind[_r] is not _board.kind[_r]] == [_row]
+    assert _fork.row_shared.count(0) == 1
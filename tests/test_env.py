@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from batch import task_seed
+from env import HashiEnv, VecHashiEnv
+
+@pytest.mark.parametrize('kwargs', [{}, {'strict': True, 'max_steps': 40}])
+def test_vec_step_matches_single_envs(kwargs):
+    _vec = VecHashiEnv(8, 6, 6, 8, seed=2, **kwargs)
+    _env_ls = [HashiEnv(width=6, height=6, node_cnt=8, seed=task_seed(2, _i), **kwargs) for _i in range(8)]
+    _vec.reset()
+    for _env in _env_ls:
+        _env.reset()
+
+    _rng = np.random.default_rng(0)
+    for _step in range(600):
+        _actions = _rng.integers(-1, 40, 8) if _step % 4 == 0 else _vec.sample_actions(_rng)
+        (_obs, _reward_ls, _done_ls, _info) = _vec.step(_actions)
+        for (_i, _env) in enumerate(_env_ls):
+            (_, _reward, _done, _env_info) = _env.step(int(_actions[_i]))
+            if _done:
+                _env.reset()
+            assert (_reward_ls[_i], _done_ls[_i]) == (np.float32(_reward), _done)
+            assert (_info['finished'][_i], _info['illegal'][_i]) == (_env_info['finished'], _env_info['illegal'])
+            assert (_obs[_i] == _env.obs).all()
+            assert (_vec.mask[_i] == _env.mask).all()
+
+def test_solution_finishes_the_episode():
+    _env = HashiEnv(width=6, height=6, node_cnt=8, seed=1)
+    _env.reset()
+    _pair_of = {(id(_a), id(_b)): _p for (_p, (_a, _b)) in enumerate(_env.pair_ls)}
+    _solution = _env.board.solve()
+    for (_k, (_a, _b, _cnt)) in enumerate(_solution):
+        _pair = _pair_of.get((id(_a), id(_b)), _pair_of.get((id(_b), id(_a))))
+        for _c in range(_cnt):
+            assert _env.mask[_pair * 2]
+            (_, _reward, _done, _info) = _env.step(_pair * 2)
+        assert _done == (_k == len(_solution) - 1)
+    assert _reward == 1.0 and _info['finished']
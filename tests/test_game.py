@@ -0,0 +1,103 @@
+from board import Board
+from game import (ACTIONS, MOVE_FULL, MOVE_INVALID, MOVE_MESSAGE, MOVE_NO_LINE, MOVE_NO_NEIGHBOUR, MOVE_NO_NODE,
+                  MOVE_NO_UNDO, MOVE_OK, Game, pack_move, unpack_move)
+from structs import BOTTOM_IDX, DIRECTIONS, LEFT_IDX, RIGHT_IDX, UP_IDX, Position
+
+def _new_game() -> Game:
+    # two pairs across the board, and a vertical pair crossing the horizontal pair in the middle row
+    #   A . X . B
+    #   C . . . D
+    #   . . Y . .
+    _board = Board(5, 3)
+    _board.place_nodes([(0, 0, 3), (0, 4, 2), (1, 0, 1), (1, 4, 1), (0, 2, 4), (2, 2, 1)])
+    return Game(board=_board)
+
+def _status(game:Game, move_ls:list) -> list[int]:
+    return list(game.apply_moves(move_ls)['status'])
+
+def test_pack_roundtrip():
+    for _action in ACTIONS:
+        assert unpack_move(7, pack_move(7, 3, 5, LEFT_IDX, _action)) == (3, 5, LEFT_IDX, _action)
+
+def test_each_status():
+    _game = _new_game()
+    _width = _game.board.width
+    _hash = _game.board.state_hash()
+    _move_ls = [
+        pack_move(_width, 0, 0, RIGHT_IDX, 'd'),     # A-X
+        pack_move(_width, 0, 0, RIGHT_IDX, 'dd'),    # a double line on a line
+        pack_move(_width, 0, 0, RIGHT_IDX, 'd'),     # A=X
+        pack_move(_width, 0, 0, RIGHT_IDX, 'd'),     # a third line
+        pack_move(_width, 0, 0, UP_IDX, 'd'),        # nothing above A
+        pack_move(_width, 0, 1, RIGHT_IDX, 'd'),     # not a node
+        pack_move(_width, 3, 0, RIGHT_IDX, 'd'),     # out of the board
+        pack_move(_width, 1, 0, RIGHT_IDX, 'e'),     # C has no line
+        ((1 * _width + 0) * 4 + RIGHT_IDX) * 8 + 6,  # no action of code 6
+        pack_move(_width, 0, 2, BOTTOM_IDX, 'd'),    # X-Y
+        pack_move(_width, 1, 0, RIGHT_IDX, 'd'),     # C-D is crossed by X-Y
+        pack_move(_width, 0, 2, BOTTOM_IDX, 'ee'),   # 'ee' on a single line erases it
+        pack_move(_width, 1, 0, RIGHT_IDX, 'd'),     # C-D
+        pack_move(_width, 0, 0, 0, 'r'),
+        pack_move(_width, 0, 0, 0, 'r'),
+        pack_move(_width, 0, 0, 0, 'r'),
+        pack_move(_width, 0, 0, 0, 'r'),
+        pack_move(_width, 0, 0, 0, 'r'),
+        pack_move(_width, 0, 0, 0, 'r'),
+    ]
+    assert _status(_game, _move_ls) == [
+        MOVE_OK, MOVE_FULL, MOVE_OK, MOVE_FULL, MOVE_NO_NEIGHBOUR, MOVE_NO_NODE, MOVE_NO_NODE, MOVE_NO_LINE,
+        MOVE_INVALID, MOVE_OK, MOVE_NO_NEIGHBOUR, MOVE_OK, MOVE_OK,
+        MOVE_OK, MOVE_OK, MOVE_OK, MOVE_OK, MOVE_OK, MOVE_NO_UNDO,
+    ]
+    # every move done was undone
+    assert _game.move_history == []
+    assert _game.board.state_hash() == _hash
+    assert all(_node.get_line_cnt() == 0 for _node in _game.board.node_ls)
+
+def test_tuple_moves():
+    _game = _new_game()
+    _board = _game.board
+    (_a, _c) = (_board.get(Position(0, 0)), _board.get(Position(1, 0)))
+    _result = _game.apply_moves([
+        (_a, DIRECTIONS[RIGHT_IDX], 'dd'),
+        (_a, DIRECTIONS[RIGHT_IDX], 'ee'),
+        (_a, DIRECTIONS[RIGHT_IDX], 'e'),
+        (_c, DIRECTIONS[BOTTOM_IDX], 'd'),
+        (_board.get(Position(0, 1)), DIRECTIONS[RIGHT_IDX], 'd'),
+        (_a, DIRECTIONS[RIGHT_IDX], 'x'),
+        (None, None, 'r'),
+        (None, None, 'r'),
+        (None, None, 'r'),
+    ])
+    assert list(_result['status']) == [
+        MOVE_OK, MOVE_OK, MOVE_NO_LINE, MOVE_NO_NEIGHBOUR, MOVE_NO_NODE, MOVE_INVALID, MOVE_OK, MOVE_OK, MOVE_NO_UNDO,
+    ]
+    assert _result['applied'] == 4
+    assert _a.get_line_cnt() == 0
+
+def test_stop_on_error_and_result():
+    _game = _new_game()
+    _width = _game.board.width
+    _result = _game.apply_moves([
+        pack_move(_width, 0, 0, RIGHT_IDX, 'd'),
+        pack_move(_width, 0, 0, UP_IDX, 'd'),
+        pack_move(_width, 0, 0, RIGHT_IDX, 'd'),
+    ], stop_on_error=True)
+    assert list(_result['status']) == [MOVE_OK, MOVE_NO_NEIGHBOUR]
+    assert _result['applied'] == 1
+    assert not _result['finished']
+    assert _result['hash'] == _game.board.state_hash()
+
+def test_finished_and_messages():
+    _game = _new_game()
+    _width = _game.board.width
+    # A=X, X-Y, X-B, A-C and B-D
+    _solution = _game.board.solve()
+    _move_ls = []
+    for (_a, _b, _cnt) in _solution:
+        _dir = _a.position.dir_to(_b.position)
+        _move_ls.append(pack_move(_width, _a.position.row, _a.position.col, _dir.idx, 'dd' if _cnt == 2 else 'd'))
+    _result = _game.apply_moves(_move_ls)
+    assert _result['applied'] == len(_move_ls)
+    assert _result['finished']
+    assert all(MOVE_MESSAGE[_status] for _status in range(1, len(MOVE_MESSAGE)))
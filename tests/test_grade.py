@@ -0,0 +1,47 @@
+import pytest
+
+from board import Board
+from grade import LEVEL_EASY, RULE_ISOLATION, GradeCache, grade, grade_pack
+from puzzle_io import _islands
+
+def _puzzles(cnt:int) -> list[tuple[int, int, list[tuple[int, int, int]]]]:
+    _puzzle_ls = []
+    for _seed in range(cnt):
+        _board = Board(10, 10)
+        _board.generate(20, seed=_seed)
+        _puzzle_ls.append((10, 10, _islands(_board)))
+    return _puzzle_ls
+
+def test_isolation_is_not_counted_before_easy_rules():
+    # a puzzle the easy rules solve is graded easy, whatever isolation could also have found
+    _grade_ls = [_grade for _grade in grade_pack(_puzzles(60), workers=1)]
+    _easy_ls = [_grade for _grade in _grade_ls if _grade['level'] == LEVEL_EASY]
+    assert len(_easy_ls) > 0
+    for _grade in _easy_ls:
+        assert _grade['rules'][RULE_ISOLATION] == 0
+        assert _grade['decisions'] == 0
+
+def test_two_nodes_need_no_isolation():
+    # the only edge of two nodes of 2 is full, no line has to be taken from it
+    _board = Board(3, 1)
+    _board.place_nodes([(0, 0, 2), (0, 2, 2)])
+    _grade = grade(_board)
+    assert _grade['level'] == LEVEL_EASY
+    assert _grade['rules'][RULE_ISOLATION] == 0
+
+@pytest.mark.parametrize('max_pending', [1, None])
+def test_pack_matches_serial(max_pending):
+    _puzzle_ls = _puzzles(12)
+    _serial = {_grade['index']: _grade for _grade in grade_pack(_puzzle_ls, workers=1)}
+    _parallel = {_grade['index']: _grade
+                 for _grade in grade_pack(_puzzle_ls, workers=2, chunksize=2, max_pending=max_pending)}
+    assert _parallel == _serial
+
+def test_pack_yields_cached_grades():
+    _puzzle_ls = _puzzles(6)
+    _cache = GradeCache()
+    _first = [_grade for _grade in grade_pack(_puzzle_ls[:3], workers=2, cache=_cache, chunksize=2)]
+    assert not any(_grade['cached'] for _grade in _first)
+    _second = {_grade['index']: _grade for _grade in grade_pack(_puzzle_ls, workers=2, cache=_cache, chunksize=2)}
+    assert sorted(_second) == list(range(6))
+    assert [_second[_idx]['cached'] for _idx in range(6)] == [True] * 3 + [False] * 3
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from board import Board
+from compact import CompactBoard
+from puzzle_io import _islands
+from sparse import SparseBoard
+from structs import DIRECTIONS, RIGHT_IDX, BOTTOM_IDX, zobrist_layout_hash
+
+_BOARD_CLASSES = [Board, CompactBoard, SparseBoard]
+
+def _rebuilt(board:Board) -> Board:
+    """Board of the same class made from the islands and the lines of `board`"""
+    _board = type(board)(board.width, board.height)
+    _board.place_nodes(_islands(board))
+    for _node in board.node_ls:
+        for _i in (RIGHT_IDX, BOTTOM_IDX):
+            for _ in range(_node.line_cnt[_i]):
+                _board.draw_line(_board.get(_node.position), _board.get(_node.link[_i].position))
+    return _board
+
+def _assert_fresh(board:Board):
+    (_layout_hash, _line_hash) = (board.layout_hash, board.line_hash)
+    board._build_hash()
+    assert (board.layout_hash, board.line_hash) == (_layout_hash, _line_hash)
+    assert _layout_hash == zobrist_layout_hash(board.width, board.height, _islands(board))
+    assert board.state_hash() == _rebuilt(board).state_hash()
+
+@pytest.mark.parametrize('cls', _BOARD_CLASSES)
+@pytest.mark.parametrize('seed', range(4))
+def test_incremental_hash_is_fresh(cls, seed):
+    _rng = random.Random(seed)
+    _source = Board(10, 9)
+    _source.generate(24, seed=seed)
+    _board = cls(10, 9)
+    _board.place_nodes(_islands(_source))
+    _empty_hash = _board.state_hash()
+    _assert_fresh(_board)
+
+    # (node, direction, drawn) of the moves, popped by an undo
+    _move_ls = []
+    for _ in range(150):
+        _r = _rng.random()
+        _node = _rng.choice(_board.node_ls)
+        _dir = _rng.choice(DIRECTIONS)
+        if _r < 0.2 and len(_move_ls) > 0:
+            (_node, _dir, _drawn) = _move_ls.pop()
+            if _drawn:
+                _board.erase_line(_node, _dir)
+            else:
+                _board.draw_line(_node, _board.get_neighbour(_node, _dir))
+        elif _r < 0.35 and _node.get_line_cnt_in_dir(_dir) == 2:
+            # both lines of a double line
+            _board.erase_line(_node, _dir)
+            _board.erase_line(_node, _dir)
+            _move_ls.clear()
+        elif _r < 0.6 and _node.get_line_cnt_in_dir(_dir) > 0:
+            _board.erase_line(_node, _dir)
+            _move_ls.append((_node, _dir, False))
+        elif _board.can_draw(_node, _dir):
+            _board.draw_line(_node, _board.get_neighbour(_node, _dir))
+            _move_ls.append((_node, _dir, True))
+        _assert_fresh(_board)
+
+    _board.clear_lines()
+    assert _board.state_hash() == _empty_hash
+
+@pytest.mark.parametrize('seed', range(4))
+def test_backends_hash_equal(seed):
+    _source = Board(10, 9)
+    _source.generate(24, unique=True, seed=seed)
+    _board_ls = []
+    for _cls in _BOARD_CLASSES:
+        _board = _cls(10, 9)
+        _board.place_nodes(_islands(_source))
+        _board_ls.append(_board)
+    assert len({_board.layout_hash for _board in _board_ls}) == 1
+    assert len({_board.state_hash() for _board in _board_ls}) == 1
+    for _board in _board_ls:
+        _board.solve(apply=True)
+    assert len({_board.state_hash() for _board in _board_ls}) == 1
+    assert _board_ls[0].state_hash() != _board_ls[0].layout_hash
+
+def test_layouts_hash_differently():
+    _board = Board(5, 5)
+    _board.place_nodes([(0, 0, 1), (0, 2, 1)])
+    _other = Board(5, 5)
+    _other.place_nodes([(0, 0, 1), (0, 3, 1)])
+    _larger = Board(6, 5)
+    _larger.place_nodes([(0, 0, 1), (0, 2, 1)])
+    assert len({_board.layout_hash, _other.layout_hash, _larger.layout_hash}) == 3
+
+@pytest.mark.parametrize('cls', _BOARD_CLASSES)
+def test_generated_hash_is_fresh(cls):
+    _board = cls(12, 12)
+    _board.generate(30, seed=5)
+    _assert_fresh(_board)
+    _board.solve(apply=True)
+    _assert_fresh(_board)
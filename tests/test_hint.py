@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from board import Board
+from game import Game, pack_move
+from hint import HintEngine
+from structs import DIRECTIONS
+
+def _assert_fresh(engine:HintEngine, board:Board):
+    """The engine kept up to date move by move is the same as one made from the board now"""
+    _fresh = HintEngine(board)
+    assert engine.consistent == _fresh.consistent
+    if _fresh.consistent:
+        assert engine.solver.lo == _fresh.solver.lo
+        assert engine.solver.hi == _fresh.solver.hi
+        assert set(engine.forced) == set(_fresh.forced)
+        assert engine.line_cnt == _fresh.line_cnt
+
+@pytest.mark.parametrize('seed', range(8))
+def test_erase_keeps_lines_of_later_moves(seed):
+    # a line is drawn on an edge that an earlier line forced already, then the earlier line is erased
+    _board = Board(12, 10)
+    _board.generate(30, seed=seed)
+    _engine = HintEngine(_board)
+    _solver = _engine.solver
+    _root_lo = list(_solver.lo)
+    for (_e, (_a, _b, _dir)) in enumerate(_solver.edge_ls):
+        if _solver.lo[_e] > 0 or _solver.hi[_e] == 0:
+            continue
+        (_node, _to_node) = (_board.node_ls[_a], _board.node_ls[_b])
+        _board.draw_line(_node, _to_node)
+        _engine.update(_node, _dir)
+        _forced_ls = [_f for _f in range(len(_solver.lo)) if _f != _e and _solver.lo[_f] > _root_lo[_f]]
+        if _engine.consistent and len(_forced_ls) > 0:
+            (_fa, _fb, _fdir) = _solver.edge_ls[_forced_ls[0]]
+            _board.draw_line(_board.node_ls[_fa], _board.node_ls[_fb])
+            _engine.update(_board.node_ls[_fa], _fdir)
+            _board.erase_line(_node, _dir)
+            _engine.update(_node, _dir)
+            assert _solver.lo[_forced_ls[0]] >= 1
+            _assert_fresh(_engine, _board)
+            return
+        _board.erase_line(_node, _dir)
+        _engine.update(_node, _dir)
+    pytest.skip('No line forces another edge')
+
+@pytest.mark.parametrize('seed', range(6))
+def test_random_moves_match_fresh_engine(seed):
+    _board = Board(12, 10)
+    _board.generate(30, seed=seed)
+    _game = Game(board=_board)
+    _game.hint()
+    _rng = random.Random(seed)
+    for _ in range(150):
+        _node = _board.resolve(_rng.choice(_board.node_ls))
+        _dir_ls = [
+            _d for _d in range(4)
+            if _node.line_cnt[_d] > 0 or _board.get_neighbour(_node, DIRECTIONS[_d]) is not None
+        ]
+        if len(_dir_ls) == 0:
+            continue
+        _d = _rng.choice(_dir_ls)
+        _erase = _node.line_cnt[_d] > 0 and _rng.random() < 0.45
+        _action = _rng.choice(('e', 'ee') if _erase else ('d', 'dd'))
+        _game.apply_moves([pack_move(_board.width, _node.position.row, _node.position.col, _d, _action)])
+        _assert_fresh(_game.hint_engine, _board)
+
+def test_hint_follows_the_solution():
+    _board = Board(9, 9)
+    _board.generate(16, seed=4)
+    _game = Game(board=_board)
+    # drawing the hinted bridges again and again finishes the puzzle
+    for _ in range(100):
+        _hint = _game.hint()
+        if _hint is None:
+            break
+        (_a, _b, _cnt) = _hint
+        _dir = _a.position.dir_to(_b.position)
+        while _board.resolve(_a).line_cnt[_dir.idx] < _cnt:
+            _game.apply_moves([pack_move(_board.width, _a.position.row, _a.position.col, _dir.idx, 'd')])
+    _assert_fresh(_game.hint_engine, _board)
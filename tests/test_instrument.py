@@ -0,0 +1,47 @@
+import tracemalloc
+
+import pytest
+
+import instrument
+from board import Board
+
+@pytest.fixture(autouse=True)
+def _clean():
+    instrument.reset()
+    yield
+    instrument.disable()
+    instrument.reset()
+
+def _play():
+    _board = Board(10, 10)
+    _board.generate(20, seed=1)
+    _board.solve(apply=True)
+    assert _board.is_finish()
+
+def test_calls_without_allocations():
+    instrument.enable()
+    _play()
+    _stat_map = instrument.stats()
+    assert _stat_map['Board.generate']['calls'] == 1
+    assert _stat_map['Board.draw_line']['calls'] > 0
+    assert 'allocations' not in _stat_map['Board.draw_line']
+    assert not tracemalloc.is_tracing()
+    assert '-' in instrument.report()
+
+def test_allocations():
+    instrument.enable(allocations=True)
+    assert tracemalloc.is_tracing()
+    _play()
+    _stat_map = instrument.stats()
+    # the nodes and the boxes of the new board are kept after generate returns
+    assert _stat_map['Board.generate']['allocations'] >= 20
+    assert _stat_map['Board.is_finish']['allocations_per_call'] >= 0
+    instrument.disable()
+    assert not tracemalloc.is_tracing()
+
+def test_disable_restores_methods():
+    _draw_line = Board.draw_line
+    instrument.enable()
+    assert Board.draw_line is not _draw_line
+    instrument.disable()
+    assert Board.draw_line is _draw_line
@@ -0,0 +1,50 @@
+import pytest
+
+from board import Board
+from parallel import ParallelSolver
+from solver import Solver
+
+@pytest.fixture(scope='module')
+def parallel():
+    with ParallelSolver(workers=3, min_nodes=0) as _parallel:
+        yield _parallel
+
+@pytest.mark.parametrize('seed', range(6))
+def test_solutions_of_solver(parallel, seed):
+    _board = Board(14, 14)
+    _board.generate(40, seed=seed)
+    _all = set(tuple(_lines) for _lines in Solver(_board)._solve_lines(1000))
+    for _limit in (1, 3, 1000):
+        _found = parallel._solve_lines(_board, _limit)
+        assert len(_found) == len(set(_found)) == min(_limit, len(_all))
+        assert set(_found) <= _all
+    assert parallel.count_solutions(_board, 3) == min(3, len(_all))
+
+def test_search_is_split_for_idle_workers(parallel):
+    _board = Board(30, 30)
+    _board.generate(200, seed=4)
+    _cnt = Solver(_board).count_solutions(2)
+    assert parallel.count_solutions(_board, 2) == _cnt
+    assert parallel.stats['parallel']
+    assert parallel.stats['splits'] > 0
+    assert parallel.stats['tasks'] > 1
+
+def test_uniqueness_checks_reach_the_pool(parallel):
+    _board = Board(14, 14)
+    _board.generate(30, unique=True, seed=1, solver=parallel)
+    assert Solver(_board).count_solutions(2) == 1
+    assert parallel.stats['parallel']
+
+def test_small_puzzle_stays_in_this_process():
+    _board = Board(14, 14)
+    _board.generate(40, unique=True, seed=1)
+    with ParallelSolver(workers=2) as _parallel:
+        assert _parallel.count_solutions(_board) == 1
+        assert not _parallel.stats['parallel']
+        assert _parallel.pool is None
+
+def test_solution_is_valid(parallel):
+    _board = Board(10, 10)
+    _board.generate(25, seed=9)
+    _board.draw_solution(parallel.solve(_board))
+    assert _board.is_finish()
@@ -0,0 +1,74 @@
+import pytest
+
+import puzzle_io
+from board import Board
+from compact import CompactBoard
+from sparse import SparseBoard
+
+def _puzzle(seed:int, solved:bool=False) -> Board:
+    _board = Board(9, 7)
+    _board.generate(12, seed=seed)
+    if solved:
+        _board.solve(apply=True)
+    return _board
+
+def _same(a:Board, b:Board):
+    assert (a.width, a.height) == (b.width, b.height)
+    assert a.state_hash() == b.state_hash()
+    assert puzzle_io.to_text(a, lines=True) == puzzle_io.to_text(b, lines=True)
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('lines', [False, True])
+def test_text_round_trip(seed, lines):
+    _board = _puzzle(seed, solved=lines)
+    _read = puzzle_io.from_text(puzzle_io.to_text(_board, lines=lines))
+    _same(_board, _read)
+    assert _read.is_finish() == lines
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('lines', [False, True])
+def test_binary_round_trip(seed, lines):
+    _board = _puzzle(seed, solved=lines)
+    _record = puzzle_io.encode(_board, lines=lines)
+    assert puzzle_io.record_size(_record) == len(_record)
+    _same(_board, puzzle_io.decode(_record))
+    (_width, _height, _island_ls) = puzzle_io.decode_islands(_record)
+    assert (_width, _height) == (_board.width, _board.height)
+    assert _island_ls == sorted((_n.position.row, _n.position.col, _n.n) for _n in _board.node_ls)
+
+@pytest.mark.parametrize('cls', [CompactBoard, SparseBoard])
+def test_decode_into_other_boards(cls):
+    _board = _puzzle(7, solved=True)
+    _read = puzzle_io.decode(puzzle_io.encode(_board, lines=True), cls)
+    assert isinstance(_read, cls)
+    _same(_board, _read)
+
+def test_library_round_trip(tmp_path):
+    _path = str(tmp_path / 'pack.lib')
+    _board_ls = [_puzzle(_seed, solved=_seed % 2 == 1) for _seed in range(6)]
+    with puzzle_io.LibraryWriter(_path) as _writer:
+        for _board in _board_ls:
+            _writer.add(_board, lines=True)
+
+    with puzzle_io.Library(_path) as _library:
+        assert len(_library) == len(_board_ls)
+        for (_idx, _board) in enumerate(_board_ls):
+            _same(_board, _library[_idx])
+            assert _library.record(_idx) == puzzle_io.encode(_board, lines=True)
+        with pytest.raises(IndexError):
+            _library.load(len(_board_ls))
+    _same(_board_ls[3], puzzle_io.load(_path, 3))
+    assert [_p[2] for _p in puzzle_io.iter_puzzles(_path)] == [puzzle_io._islands(_b) for _b in _board_ls]
+
+def test_text_file(tmp_path):
+    _board = _puzzle(2)
+    _path = tmp_path / 'puzzle.txt'
+    _path.write_text(puzzle_io.to_text(_board))
+    _same(_board, puzzle_io.load(str(_path)))
+    [(_width, _height, _island_ls)] = list(puzzle_io.iter_puzzles(str(_path)))
+    assert (_width, _height, sorted(_island_ls)) == (_board.width, _board.height, puzzle_io._islands(_board))
+
+@pytest.mark.parametrize('text', ['', '# lines\n', '1.x\n', '# lines\n.1\n'])
+def test_invalid_text(text):
+    with pytest.raises(Exception):
+        puzzle_io.from_text(text)
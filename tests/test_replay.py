@@ -0,0 +1,123 @@
+import struct
+
+import pytest
+
+import replay
+from board import Board
+from game import Game, pack_move
+from replay import LOG_END, ReplayWriter, verify_log
+
+def _new_game(path:str, seed:int=1) -> tuple[Game, list[int]]:
+    """Game recording to `path`, and the packed moves solving its puzzle"""
+    _board = Board(8, 8)
+    _board.generate(10, seed=seed)
+    _move_ls = []
+    for (_a, _b, _cnt) in _board.solve():
+        _dir = _a.position.dir_to(_b.position)
+        _move_ls.append(pack_move(_board.width, _a.position.row, _a.position.col, _dir.idx, 'dd' if _cnt == 2 else 'd'))
+    _game = Game(board=_board)
+    _game.record(path)
+    return (_game, _move_ls)
+
+def _finished_log(tmp_path) -> str:
+    _path = str(tmp_path / 'game.log')
+    (_game, _move_ls) = _new_game(_path)
+    _game.apply_moves(_move_ls)
+    _game.replay_log.finish(_game.board)
+    return _path
+
+def _edit(path:str, func):
+    with open(path, 'rb') as _file:
+        _data = _file.read()
+    with open(path, 'wb') as _file:
+        _file.write(func(_data))
+
+def test_finished_log(tmp_path):
+    _report = verify_log(_finished_log(tmp_path))
+    assert _report['result'] == replay.VERIFY_OK
+    assert _report['moves'] > 0
+
+def test_log_without_end(tmp_path):
+    _path = str(tmp_path / 'game.log')
+    (_game, _move_ls) = _new_game(_path)
+    _game.apply_moves(_move_ls[:-1])
+    _game.replay_log.close()
+    _report = verify_log(_path)
+    assert _report['result'] == replay.VERIFY_UNFINISHED
+    assert _report['moves'] == len(_move_ls) - 1
+
+@pytest.mark.parametrize('edit', [
+    # truncated header
+    lambda data: data[:10],
+    # not a replay log
+    lambda data: b'NOTALOG!' + data[8:],
+    # unsupported version
+    lambda data: data[:8] + struct.pack('<I', 99) + data[12:],
+    # half of the end hash
+    lambda data: data[:-4],
+    # a move cut in the middle, before the end mark
+    lambda data: data[:data.rindex(struct.pack('<I', LOG_END))] + b'\x01\x02',
+    # a changed end hash
+    lambda data: data[:-8] + bytes(_b ^ 0xFF for _b in data[-8:]),
+    # data after the end of the game
+    lambda data: data + b'\x00\x00\x00\x00',
+])
+def test_corrupted_log(tmp_path, edit):
+    _path = _finished_log(tmp_path)
+    _edit(_path, edit)
+    _report = verify_log(_path)
+    assert _report['result'] == replay.VERIFY_CORRUPTED
+    assert 'error' in _report
+
+def test_move_from_empty_box(tmp_path):
+    _path = str(tmp_path / 'game.log')
+    (_game, _) = _new_game(_path)
+    _empty = next(
+        (_r, _c) for _r in range(_game.board.height) for _c in range(_game.board.width)
+        if _game.board._box_at(_r, _c).is_empty()
+    )
+    _game.replay_log.add(pack_move(_game.board.width, _empty[0], _empty[1], 0, 'd'))
+    _game.replay_log.close()
+    _report = verify_log(_path)
+    assert _report['result'] == replay.VERIFY_CORRUPTED
+    assert _report['move'] == 0
+
+def test_illegal_move(tmp_path):
+    _path = str(tmp_path / 'game.log')
+    (_game, _move_ls) = _new_game(_path)
+    _game.apply_moves(_move_ls[:2])
+    # erase a line that was never drawn
+    _node = _game.board.node_ls[0]
+    _dir = _node.get_unlinked_dir()[0]
+    _game.replay_log.add(pack_move(_game.board.width, _node.position.row, _node.position.col, _dir.idx, 'e'))
+    _game.replay_log.close()
+    _report = verify_log(_path)
+    assert _report['result'] == replay.VERIFY_CHEATER
+    assert _report['move'] == 2
+
+def test_end_on_unfinished_board(tmp_path):
+    _path = str(tmp_path / 'game.log')
+    (_game, _move_ls) = _new_game(_path)
+    _game.apply_moves(_move_ls[:-1])
+    # the hash matches the board, but the board is not finished
+    _game.replay_log.finish(_game.board)
+    assert verify_log(_path)['result'] == replay.VERIFY_CHEATER
+
+def test_existing_log_is_kept(tmp_path):
+    _path = _finished_log(tmp_path)
+    _writer = ReplayWriter(_path, Board(3, 3))
+    _writer.close()
+    assert _writer.path == str(tmp_path / 'game.1.log')
+    assert verify_log(_path)['result'] == replay.VERIFY_OK
+
+def test_verify_logs_in_parallel(tmp_path):
+    _path_ls = []
+    for _seed in range(4):
+        _path = str(tmp_path / 'game{}.log'.format(_seed))
+        (_game, _move_ls) = _new_game(_path, _seed)
+        _game.apply_moves(_move_ls)
+        _game.replay_log.finish(_game.board)
+        _path_ls.append(_path)
+    _report_ls = list(replay.verify_logs(replay.iter_log_paths([str(tmp_path)]), workers=2))
+    assert sorted(_r['path'] for _r in _report_ls) == sorted(_path_ls)
+    assert all(_r['result'] == replay.VERIFY_OK for _r in _report_ls)
@@ -0,0 +1,147 @@
+import io
+import random
+from itertools import product
+
+import pytest
+
+from board import Board
+from sat import BACKEND_CDCL, CDCL, HashiCNF, solve_sat, write_dimacs
+from solver import Solver
+
+def _solution_set(solution) -> set[tuple]:
+    return set((_a.position, _b.position, _cnt) for (_a, _b, _cnt) in solution)
+
+def _unsolvable(seed:int) -> Board:
+    """A generated board with one more line needed by one node, so the total of the numbers is odd"""
+    _board = Board(8, 8)
+    _board.generate(14, seed=seed)
+    _board.node_ls[seed % len(_board.node_ls)].n += 1
+    _board.build_neighbour_index()
+    return _board
+
+def _parse_dimacs(text:str) -> tuple[int, int, list[list[int]]]:
+    """(variables, clauses) of the header and the clauses of a DIMACS text"""
+    _header = None
+    _clause_ls = []
+    for _line in text.splitlines():
+        if _line.startswith('c'):
+            continue
+        if _line.startswith('p cnf '):
+            _header = tuple(int(_v) for _v in _line.split()[2:])
+            continue
+        _lit_ls = [int(_v) for _v in _line.split()]
+        assert _lit_ls[-1] == 0
+        _clause_ls.append(_lit_ls[:-1])
+    return (*_header, _clause_ls)
+
+def _brute_force(var_cnt:int, clause_ls:list[list[int]]) -> int:
+    """Number of assignments satisfying the clauses"""
+    return sum(
+        all(any((_l > 0) == _values[abs(_l) - 1] for _l in _clause) for _clause in clause_ls)
+        for _values in product((False, True), repeat=var_cnt)
+    )
+
+@pytest.mark.parametrize('seed', range(12))
+def test_solvable_matches_solver(seed):
+    _board = Board(8, 8)
+    _board.generate(14, seed=seed)
+    _cnt = Solver(_board).count_solutions(2)
+    assert _cnt > 0
+    _solution = solve_sat(_board, apply=True, backend=BACKEND_CDCL)
+    assert _solution is not None
+    assert _board.is_finish()
+    if _cnt == 1:
+        assert _solution_set(_solution) == _solution_set(Solver(_board).solve())
+
+@pytest.mark.parametrize('seed', range(6))
+def test_unsolvable_matches_solver(seed):
+    _board = _unsolvable(seed)
+    assert Solver(_board).count_solutions(1) == 0
+    assert solve_sat(_board, backend=BACKEND_CDCL) is None
+
+def test_disconnected_pairs_are_cut():
+    # the numbers fit two chains of three nodes, but 4 lines cannot join 6 nodes
+    _board = Board(5, 3)
+    _board.place_nodes([(0, 0, 1), (0, 2, 2), (0, 4, 1), (2, 0, 1), (2, 2, 2), (2, 4, 1)])
+    _stats = {}
+    assert solve_sat(_board, backend=BACKEND_CDCL, stats=_stats) is None
+    assert _stats['cuts'] > 0
+    assert Solver(_board).count_solutions(1) == 0
+
+def test_solution_needs_cuts():
+    # the first model of this board has two components, a cut clause joins them
+    _board = Board(8, 8)
+    _board.generate(14, seed=16)
+    _stats = {}
+    _solution = solve_sat(_board, apply=True, backend=BACKEND_CDCL, stats=_stats)
+    assert _stats['cuts'] > 0 and _stats['rounds'] > 1
+    assert _board.is_finish()
+    assert _solution_set(_solution) == _solution_set(Solver(_board).solve())
+
+def test_dimacs_roundtrip(tmp_path):
+    _board = Board(8, 8)
+    _board.generate(14, seed=16)
+    _cnf = HashiCNF(_board)
+    _cnf.solve_lines(BACKEND_CDCL)
+    _file = io.StringIO()
+    _cnf.write_dimacs(_file)
+    (_var_cnt, _clause_cnt, _clause_ls) = _parse_dimacs(_file.getvalue())
+    assert _var_cnt == _cnf.var_cnt == len(_cnf.solver.edge_ls) * 2
+    assert _clause_cnt == len(_clause_ls) == len(_cnf.clause_ls)
+    assert _clause_ls == _cnf.clause_ls
+    assert all(1 <= abs(_l) <= _var_cnt for _clause in _clause_ls for _l in _clause)
+    assert '{} connectivity cut clauses'.format(_cnf.cut_cnt) in _file.getvalue()
+
+    # the file has the cuts, so any model of it is a connected solution
+    _path = tmp_path / 'board.cnf'
+    write_dimacs(_board, str(_path), backend=BACKEND_CDCL)
+    (_, _, _clause_ls) = _parse_dimacs(_path.read_text())
+    _sat = CDCL()
+    for _clause in _clause_ls:
+        _sat.add_clause(_clause)
+    assert _sat.solve()
+    _lines = _cnf.decode(_sat.model())
+    assert _cnf.cut_clauses(_lines) == []
+    _board.draw_solution(_cnf.solver._to_solution(_lines))
+    assert _board.is_finish()
+
+def test_cdcl_unsat():
+    _sat = CDCL()
+    # three pigeons in two holes, variable 2p+h+1: pigeon p in hole h
+    for _p in range(3):
+        _sat.add_clause([2 * _p + 1, 2 * _p + 2])
+    for _h in (1, 2):
+        for _p in range(3):
+            for _q in range(_p + 1, 3):
+                _sat.add_clause([-(2 * _p + _h), -(2 * _q + _h)])
+    assert _sat.solve() is False
+    # once unsatisfiable it stays so
+    assert _sat.add_clause([1]) is False
+    assert _sat.solve() is False
+
+def test_cdcl_empty_clause():
+    _sat = CDCL()
+    assert _sat.add_clause([1, -1])
+    assert not _sat.add_clause([])
+    assert _sat.solve() is False
+
+@pytest.mark.parametrize('seed', range(5))
+def test_cdcl_incremental_counts_models(seed):
+    # every model is blocked by a new clause between solves, until none is left
+    _rng = random.Random(seed)
+    _var_cnt = 7
+    _clause_ls = []
+    for _ in range(12):
+        _clause_ls.append([_rng.choice((1, -1)) * _v for _v in _rng.sample(range(1, _var_cnt + 1), 3)])
+    _sat = CDCL()
+    for _clause in _clause_ls:
+        _sat.add_clause(_clause)
+    _model_set = set()
+    while _sat.solve():
+        _model = tuple(_sat.model())
+        assert len(_model) == _var_cnt
+        assert all(any(_l in _model for _l in _clause) for _clause in _clause_ls)
+        assert _model not in _model_set
+        _model_set.add(_model)
+        _sat.add_clause([-_l for _l in _model])
+    assert len(_model_set) == _brute_force(_var_cnt, _clause_ls)
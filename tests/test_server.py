@@ -0,0 +1,78 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pytest
+
+import server
+from server import GameServer, PuzzlePool
+
+async def _connect(port:int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, str]:
+    """Open a connection, return it with the first reply"""
+    (_reader, _writer) = await asyncio.open_connection('127.0.0.1', port)
+    _line = (await _reader.readline()).decode()
+    if _line.startswith('board '):
+        for _ in range(int(_line.split()[1])):
+            _line += (await _reader.readline()).decode()
+    return (_reader, _writer, _line)
+
+async def _ask(reader:asyncio.StreamReader, writer:asyncio.StreamWriter, command:str) -> str:
+    writer.write((command + '\n').encode())
+    await writer.drain()
+    return (await reader.readline()).decode()
+
+def _run(pool:PuzzlePool, func):
+    async def main():
+        _server = GameServer(pool, game_timeout=10)
+        _port = await _server.start()
+        try:
+            return await func(_port)
+        finally:
+            await _server.close()
+    return asyncio.run(main())
+
+def test_moves_get_error_codes():
+    async def play(port):
+        (_reader, _writer, _first) = await _connect(port)
+        _reply_ls = [await _ask(_reader, _writer, _command) for _command in ('zz', '', '9999 6d', 'r')]
+        _writer.close()
+        return (_first, _reply_ls)
+
+    _pool = PuzzlePool(6, 6, 6, size=2, seed=1, workers=1, executor=ThreadPoolExecutor(1))
+    (_first, _reply_ls) = _run(_pool, play)
+    assert _first.startswith('board ')
+    assert [_r.split()[:2] for _r in _reply_ls] == [
+        ['error', server.ERROR_SYNTAX], ['error', server.ERROR_SYNTAX],
+        ['error', server.ERROR_SYNTAX], ['error', server.ERROR_MOVE],
+    ]
+    assert all('int()' not in _r for _r in _reply_ls)
+
+def test_failing_generation_is_reported():
+    async def connect(port):
+        (_reader, _writer, _first) = await _connect(port)
+        _rest = await _reader.read()
+        _writer.close()
+        return (_first, _rest)
+
+    # 10 nodes do not fit on a 2x2 board, every generation fails
+    _pool = PuzzlePool(2, 2, 10, size=2, workers=1, executor=ThreadPoolExecutor(1), max_failures=4)
+    (_first, _rest) = _run(_pool, connect)
+    assert _first.startswith('error {} '.format(server.ERROR_NO_PUZZLE))
+    assert _rest == b''
+    assert _pool.error is not None
+
+def test_broken_executor_is_reported():
+    _executor = ProcessPoolExecutor(1)
+    with pytest.raises(Exception):
+        _executor.submit(os._exit, 1).result()
+
+    async def get():
+        _pool = PuzzlePool(6, 6, 6, size=2, workers=1, executor=_executor)
+        await _pool.start()
+        try:
+            with pytest.raises(Exception, match='stopped'):
+                await asyncio.wait_for(_pool.get(), 10)
+        finally:
+            _pool.close()
+    asyncio.run(get())
+    _executor.shutdown()
@@ -0,0 +1,130 @@
+from itertools import product
+
+import pytest
+
+from board import Board
+from solver import Solver
+from structs import find_crossings, pair_nearest_nodes
+
+def _brute_force(board:Board) -> set[frozenset]:
+    """All solutions of the board by trying every number of lines of every pair of visible nodes"""
+    _node_ls = board.node_ls
+    _idx_of = {id(_node): i for i, _node in enumerate(_node_ls)}
+    (_horizon_ls, _vertical_ls) = pair_nearest_nodes(_node_ls)
+    _edge_ls = [(_idx_of[id(_a)], _idx_of[id(_b)]) for (_a, _b) in _horizon_ls + _vertical_ls]
+    _cross_ls = [(_h, _v + len(_horizon_ls)) for (_h, _v) in find_crossings(_horizon_ls, _vertical_ls)]
+
+    _res = set()
+    for _lines in product(range(3), repeat=len(_edge_ls)):
+        if any(_lines[_h] > 0 and _lines[_v] > 0 for (_h, _v) in _cross_ls):
+            continue
+        _cnt = [0] * len(_node_ls)
+        for (_a, _b), _v in zip(_edge_ls, _lines):
+            _cnt[_a] += _v
+            _cnt[_b] += _v
+        if any(_cnt[_i] != _node.n for _i, _node in enumerate(_node_ls)):
+            continue
+        _visited = {0}
+        _stack = [0]
+        while len(_stack) > 0:
+            _i = _stack.pop()
+            for (_a, _b), _v in zip(_edge_ls, _lines):
+                if _v > 0 and _i in (_a, _b):
+                    _j = _b if _a == _i else _a
+                    if _j not in _visited:
+                        _visited.add(_j)
+                        _stack.append(_j)
+        if len(_visited) != len(_node_ls):
+            continue
+        _res.add(frozenset(
+            (_node_ls[_a].position, _node_ls[_b].position, _v)
+            for (_a, _b), _v in zip(_edge_ls, _lines) if _v > 0
+        ))
+    return _res
+
+def _as_set(solution) -> frozenset:
+    return frozenset((_a.position, _b.position, _cnt) for (_a, _b, _cnt) in solution)
+
+@pytest.mark.parametrize('seed', range(40))
+def test_solutions_match_brute_force(seed):
+    _board = Board(5, 5)
+    _board.generate(3 + seed % 5, seed=seed)
+    _expected = _brute_force(_board)
+    assert len(_expected) > 0
+
+    _found = Solver(_board).solve_all(limit=len(_expected) + 1)
+    assert set(_as_set(_s) for _s in _found) == _expected
+    assert Solver(_board).count_solutions(limit=100) == len(_expected)
+
+def test_solve_applies_a_solution():
+    _board = Board(6, 6)
+    _board.generate(6, seed=3)
+    assert _board.solve(apply=True) is not None
+    assert _board.is_finish()
+
+def test_unsolvable_board():
+    _board = Board(3, 1)
+    _board.place_nodes([(0, 0, 1), (0, 2, 2)])
+    assert Solver(_board).solve() is None
+    assert Solver(_board).count_solutions() == 0
+
+@pytest.mark.parametrize('seed', range(10))
+def test_propagation_reaches_a_fixpoint(seed):
+    _board = Board(12, 12)
+    _board.generate(40, seed=seed)
+    _solver = Solver(_board)
+    _solver._init_domain()
+    assert _solver._propagate(list(range(len(_solver.node_ls))))
+    (_lo, _hi) = (list(_solver.lo), list(_solver.hi))
+    # nothing changes when every node is checked again
+    assert _solver._propagate(list(range(len(_solver.node_ls))))
+    assert (_solver.lo, _solver.hi) == (_lo, _hi)
+
+class _ShareAll:
+    """`Solver.share` that takes subtrees at every check, `prefix` is decided before the search"""
+    def __init__(self, res):
+        self.res = res
+        self.prefix = []
+        self.given = []
+        self.keep = None
+
+    def wanted(self) -> bool:
+        return True
+
+    def put(self, prefix_ls, keep):
+        _prefix_ls = [self.prefix + _p for _p in prefix_ls]
+        # a solution found before a restart may be in a subtree given away, it is found there again
+        self.res[:] = [_lines for _lines in self.res if not any(all(_lines[_e] == _v for (_e, _v) in _p) for _p in _prefix_ls)]
+        self.given.extend(_prefix_ls)
+        self.keep = keep
+
+@pytest.mark.parametrize('seed', range(6))
+@pytest.mark.parametrize('budget', [1, 7])
+def test_shared_subtrees_hold_the_other_solutions(seed, budget):
+    _board = Board(14, 14)
+    _board.generate(40, seed=seed)
+    _all = set(tuple(_lines) for _lines in Solver(_board)._solve_lines(1000))
+
+    _solver = Solver(_board)
+    _solver._init_domain()
+    assert _solver._propagate(list(range(len(_solver.node_ls))))
+    _solver.closed.clear()
+    _root = len(_solver.trail)
+    # the search goes on under the subtree kept until it is searched
+    _res = []
+    _share = _solver.share = _ShareAll(_res)
+    while not _solver._search(_res, 1000, budget):
+        # the value kept by the deepest decision may fail at once
+        if not all(_solver._assign(_e, _v) for (_e, _v) in _share.keep):
+            break
+        _share.prefix = _share.prefix + _share.keep
+    _found = [tuple(_lines) for _lines in _res]
+
+    _solver.share = None
+    for _given in _share.given:
+        _solver._undo(_root)
+        if all(_solver._assign(_e, _v) for (_e, _v) in _given):
+            _sub = []
+            assert _solver._search(_sub, 1000, 1 << 30)
+            _found.extend(tuple(_lines) for _lines in _sub)
+    assert sorted(_found) == sorted(_all)
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from board import Board
+from puzzle_io import _islands
+from sparse import SparseBoard, _SpanIndex
+from structs import DIRECTIONS, Line, Node, Position
+
+def _same_box(box, other) -> bool:
+    if box is None or other is None:
+        return box is None and other is None
+    if box.position != other.position or type(box).__name__ != type(other).__name__:
+        return False
+    return not isinstance(box, Line) or box.is_double == other.is_double
+
+def _assert_same(board:Board, sparse:SparseBoard):
+    """Both boards give the same neighbours, nearest boxes, boxes and finish state"""
+    assert board.is_finish() == sparse.is_finish()
+    assert board.state_hash() == sparse.state_hash()
+    for _node in board.node_ls:
+        _sparse_node = sparse.get(_node.position)
+        assert _sparse_node.line_cnt == _node.line_cnt
+        for _dir in DIRECTIONS:
+            _near = board.get_neighbour(_node, _dir)
+            _sparse_near = sparse.get_neighbour(_sparse_node, _dir)
+            assert (_near is None) == (_sparse_near is None)
+            if _near is not None:
+                assert _near.position == _sparse_near.position
+            assert board.can_draw(_node, _dir) == sparse.can_draw(_sparse_node, _dir)
+            assert _same_box(board.get_nearest_non_empty(_node, _dir), sparse.get_nearest_non_empty(_sparse_node, _dir))
+    for _row in range(board.height):
+        for _col in range(board.width):
+            _pos = Position(_row, _col)
+            assert _same_box(board.get(_pos), sparse.get(_pos))
+
+def test_span_index():
+    _index = _SpanIndex(20)
+    _index.add(2, 9, 5)
+    _index.add(4, 6, 1)
+    _index.add(0, 19, 12)
+    assert _index.first_after(5, 0) == 1
+    assert _index.first_after(5, 1) == 5
+    assert _index.first_after(3, 1) == 5
+    assert _index.first_after(10, 5) == 12
+    assert _index.last_before(5, 12) == 5
+    assert _index.last_before(4, 5) == 1
+    assert _index.last_before(1, 12) is None
+    _index.remove(2, 9, 5)
+    assert _index.first_after(5, 1) == 12
+    assert _index.first_after(3, 0) == 12
+
+@pytest.mark.parametrize('seed', range(8))
+def test_random_moves_match_board(seed):
+    _rng = random.Random(seed)
+    _board = Board(12, 10)
+    _board.generate(30, seed=seed)
+    _sparse = SparseBoard(12, 10)
+    _sparse.place_nodes(_islands(_board))
+    _assert_same(_board, _sparse)
+
+    # (node position, direction, drawn) of the moves, popped by an undo
+    _move_ls = []
+    for _ in range(200):
+        _r = _rng.random()
+        if _r < 0.2 and len(_move_ls) > 0:
+            (_pos, _dir, _drawn) = _move_ls.pop()
+            _move = (_pos, _dir, not _drawn)
+        else:
+            _node = _rng.choice(_board.node_ls)
+            _dir = _rng.choice(DIRECTIONS)
+            if _r < 0.5 and _node.get_line_cnt_in_dir(_dir) > 0:
+                _move = (_node.position, _dir, False)
+            elif _board.can_draw(_node, _dir):
+                _move = (_node.position, _dir, True)
+            else:
+                continue
+            _move_ls.append(_move)
+        (_pos, _dir, _drawn) = _move
+        for _b in (_board, _sparse):
+            _node = _b.get(_pos)
+            assert isinstance(_node, Node)
+            if _drawn:
+                _b.draw_line(_node, _b.get_neighbour(_node, _dir))
+            else:
+                _b.erase_line(_node, _dir)
+        _assert_same(_board, _sparse)
+
+@pytest.mark.parametrize('seed', range(3))
+def test_solution_matches_board(seed):
+    _board = Board(15, 15)
+    _board.generate(40, unique=True, seed=seed)
+    _sparse = SparseBoard(15, 15)
+    _sparse.place_nodes(_islands(_board))
+    _board.solve(apply=True)
+    _sparse.solve(apply=True)
+    assert _sparse.is_finish()
+    _assert_same(_board, _sparse)
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import validate
+from validate import INVALID, UNREADABLE, VALID, _iter_readable, validate_pack, validate_puzzle
+
+# a ring of four islands of 3 is solved by 1 and 2 lines in turn, either way round
+_RING = [(0, 0, 3), (0, 2, 3), (2, 2, 3), (2, 0, 3)]
+
+def test_valid():
+    _report = validate_puzzle(3, 1, [(0, 0, 2), (0, 2, 2)])
+    assert _report['result'] == VALID
+    assert _report['errors'] == []
+    assert _report['solutions'] == 1
+
+@pytest.mark.parametrize('width, height', [(0, 3), (3, -1), (3.0, 3), ('3', 3)])
+def test_invalid_size(width, height):
+    _report = validate_puzzle(width, height, [(0, 0, 1)])
+    assert _report['result'] == INVALID
+    assert 'solutions' not in _report
+
+@pytest.mark.parametrize('island_ls, error', [
+    ([(0, 0, 1), (0, 3, 1)], 'out of bounds'),
+    ([(-1, 0, 1), (0, 2, 1)], 'out of bounds'),
+    ([(0, 0, 0), (0, 2, 1)], 'not from 1 to 8'),
+    ([(0, 0, 9), (0, 2, 1)], 'not from 1 to 8'),
+    ([(0, 0, 1), (0, 0, 1)], 'More than one island'),
+    ([(0, 0, 1), (0, 1, 1)], 'adjacent'),
+    ([(0, 0, 1), (0, 2)], 'Invalid island'),
+    ([], 'No island'),
+])
+def test_invalid_islands(island_ls, error):
+    _report = validate_puzzle(3, 3, island_ls)
+    assert _report['result'] == INVALID
+    assert any(error in _error for _error in _report['errors'])
+    assert 'solutions' not in _report
+
+def test_adjacent_allowed():
+    assert validate_puzzle(2, 1, [(0, 0, 1), (0, 1, 1)], allow_adjacent=True)['result'] == VALID
+
+def test_no_solution():
+    _report = validate_puzzle(3, 1, [(0, 0, 1), (0, 2, 2)])
+    assert _report['result'] == INVALID
+    assert _report['solutions'] == 0
+    assert _report['errors'] == ['No solution']
+
+def test_more_than_one_solution():
+    _report = validate_puzzle(3, 3, _RING)
+    assert _report['result'] == INVALID
+    assert _report['solutions'] == 2
+    assert validate_puzzle(3, 3, _RING, unique=False)['result'] == VALID
+
+def test_errors_are_capped():
+    _report = validate_puzzle(3, 3, [(9, _col, 1) for _col in range(50)], allow_adjacent=True)
+    assert len(_report['errors']) == validate._MAX_ERRORS + 1
+    assert _report['errors'][-1] == '{} more errors'.format(50 - validate._MAX_ERRORS)
+
+def test_huge_size_is_sparse():
+    # a dense board of this size would take gigabytes
+    _report = validate_puzzle(65535, 65535, [(0, 0, 1), (0, 65534, 2), (65534, 65534, 1)])
+    assert _report['result'] == VALID
+    assert _report['solutions'] == 1
+
+def test_pack(tmp_path):
+    _path = tmp_path / 'pack.jsonl'
+    _puzzle_ls = [
+        {'width': 3, 'height': 1, 'islands': [[0, 0, 2], [0, 2, 2]]},
+        {'width': 3, 'height': 3, 'islands': _RING},
+        {'error': 'failed'},
+    ]
+    _path.write_text(''.join(json.dumps(_puzzle) + '\n' for _puzzle in _puzzle_ls) + 'not json\n')
+    _error_ls = []
+    _report_ls = list(validate_pack(_iter_readable(str(_path), _error_ls), workers=1, chunksize=2))
+    assert [_report['index'] for _report in _report_ls] == [0, 1, 2, 3]
+    assert [_report['result'] for _report in _report_ls] == [VALID, INVALID, UNREADABLE, UNREADABLE]
+    assert _error_ls == []
+
+def test_unreadable_pack(tmp_path):
+    _error_ls = []
+    assert list(validate_pack(_iter_readable(str(tmp_path / 'missing'), _error_ls), workers=1)) == []
+    assert len(_error_ls) == 1
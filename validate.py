@@ -0,0 +1,223 @@
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from collections import deque
+from time import perf_counter
+from typing import Iterator
+
+from board import Board
+from solver import Solver
+from sparse import SparseBoard
+from puzzle_io import LIBRARY_MAGIC, Library, decode_islands, from_text
+
+# result of validating a puzzle
+VALID = 'valid'
+INVALID = 'invalid'
+UNREADABLE = 'unreadable'
+
+# kind of a raw puzzle, it is parsed by the worker so the reader only moves bytes
+_KIND_JSON = 0
+_KIND_RECORD = 1
+_KIND_TEXT = 2
+# most error messages in a report, the count of the others is added
+_MAX_ERRORS = 20
+# most cells of a puzzle checked on a `Board`, larger ones are checked on a `SparseBoard`
+# so the size read from a pack does not decide how much memory is allocated
+MAX_DENSE_CELLS = 1 << 20
+
+def iter_raw(path:str) -> Iterator[tuple[int, bytes]]:
+    """
+        (kind, raw data) of each puzzle of a pack, read lazily without parsing the puzzles.\n
+        The pack is a library, JSON lines with width, height and islands like batch.py writes, or a text puzzle
+    """
+    with open(path, 'rb') as _file:
+        _head = _file.read(len(LIBRARY_MAGIC))
+        if _head != LIBRARY_MAGIC:
+            _file.seek(0)
+            if not _head.lstrip().startswith(b'{'):
+                yield (_KIND_TEXT, _file.read())
+                return
+            for _line in _file:
+                if _line.strip() != b'':
+                    yield (_KIND_JSON, _line)
+            return
+    with Library(path) as _library:
+        for _idx in range(len(_library)):
+            yield (_KIND_RECORD, _library.record(_idx))
+
+def _iter_readable(path:str, error_ls:list[str]) -> Iterator[tuple[int, bytes]]:
+    """`iter_raw`, an error opening or reading the pack is added to `error_ls` and ends the iteration"""
+    try:
+        yield from iter_raw(path)
+    except Exception as e:
+        error_ls.append(str(e))
+
+def _parse(kind:int, raw:bytes) -> tuple[int, int, list]:
+    """(width, height, islands) of a raw puzzle, raise if it cannot be read"""
+    if kind == _KIND_RECORD:
+        return decode_islands(raw)
+    if kind == _KIND_TEXT:
+        _board = from_text(raw.decode())
+        return (_board.width, _board.height, [(_node.position.row, _node.position.col, _node.n) for _node in _board.node_ls])
+    _puzzle = json.loads(raw)
+    if 'error' in _puzzle:
+        raise Exception('Failed puzzle: {}'.format(_puzzle['error']))
+    return (_puzzle['width'], _puzzle['height'], _puzzle['islands'])
+
+def validate_puzzle(width:int, height:int, island_ls:list, allow_adjacent:bool=False, unique:bool=True) -> dict:
+    """
+        Check a puzzle: the size, each island is in bounds with a number from 1 to 8 and no other island
+        on its box or next to it, then that the puzzle has a solution, and only one if `unique`.\n
+        A puzzle of more than `MAX_DENSE_CELLS` cells is solved on a `SparseBoard`
+        Args:
+            `island_ls`: (row, col, number) of the islands
+            `allow_adjacent`: islands may be next to each other, like the puzzles of `Board.generate`
+        Return:
+            dict of result (`VALID` or `INVALID`), errors (list of messages), width, height, nodes
+            and solutions (0, 1 or 2 for more than one) if the islands are valid
+    """
+    _error_ls = []
+    _report = {'result': VALID, 'errors': _error_ls, 'width': width, 'height': height, 'nodes': len(island_ls)}
+    if type(width) is not int or type(height) is not int or width < 1 or height < 1:
+        _error_ls.append('Invalid size {}x{}'.format(width, height))
+        _report['result'] = INVALID
+        return _report
+    if len(island_ls) == 0:
+        _error_ls.append('No island')
+
+    _position_set : set[tuple[int, int]] = set()
+    for _island in island_ls:
+        if len(_island) != 3 or any(type(_v) is not int for _v in _island):
+            _error_ls.append('Invalid island {}'.format(_island))
+            continue
+        (_row, _col, _n) = _island
+        if not (0 <= _row < height and 0 <= _col < width):
+            _error_ls.append('Island ({}, {}) is out of bounds'.format(_row, _col))
+        if not 1 <= _n <= 8:
+            _error_ls.append('Island ({}, {}) has number {}, not from 1 to 8'.format(_row, _col, _n))
+        if (_row, _col) in _position_set:
+            _error_ls.append('More than one island at ({}, {})'.format(_row, _col))
+        _position_set.add((_row, _col))
+    if not allow_adjacent:
+        for (_row, _col) in sorted(_position_set):
+            for (_r, _c) in ((_row, _col + 1), (_row + 1, _col)):
+                if (_r, _c) in _position_set:
+                    _error_ls.append('Islands ({}, {}) and ({}, {}) are adjacent'.format(_row, _col, _r, _c))
+
+    if len(_error_ls) == 0:
+        _board = (Board if width * height <= MAX_DENSE_CELLS else SparseBoard)(width, height)
+        _board.place_nodes([tuple(_island) for _island in island_ls])
+        _cnt = Solver(_board).count_solutions(2 if unique else 1)
+        _report['solutions'] = _cnt
+        if _cnt == 0:
+            _error_ls.append('No solution')
+        elif _cnt > 1:
+            _error_ls.append('More than one solution')
+    if len(_error_ls) > 0:
+        _report['result'] = INVALID
+    if len(_error_ls) > _MAX_ERRORS:
+        _error_ls[_MAX_ERRORS:] = ['{} more errors'.format(len(_error_ls) - _MAX_ERRORS)]
+    return _report
+
+def _validate_chunk(task:tuple[list[tuple[int, int, bytes]], bool, bool]) -> list[dict]:
+    """Validate a chunk of (index, kind, raw data) in a worker, return the report of each puzzle"""
+    (_chunk, _allow_adjacent, _unique) = task
+    _report_ls = []
+    for (_idx, _kind, _raw) in _chunk:
+        _start = perf_counter()
+        try:
+            (_width, _height, _island_ls) = _parse(_kind, _raw)
+        except Exception as e:
+            _report = {'result': UNREADABLE, 'errors': [str(e)]}
+        else:
+            try:
+                _report = validate_puzzle(_width, _height, _island_ls, _allow_adjacent, _unique)
+            except Exception as e:
+                _report = {'result': INVALID, 'errors': [str(e)]}
+        _report['index'] = _idx
+        _report['seconds'] = perf_counter() - _start
+        _report_ls.append(_report)
+    return _report_ls
+
+def _iter_chunks(raw_ls, chunksize:int, allow_adjacent:bool, unique:bool) -> Iterator[tuple[list, bool, bool]]:
+    _chunk = []
+    for (_idx, (_kind, _raw)) in enumerate(raw_ls):
+        _chunk.append((_idx, _kind, _raw))
+        if len(_chunk) >= chunksize:
+            yield (_chunk, allow_adjacent, unique)
+            _chunk = []
+    if len(_chunk) > 0:
+        yield (_chunk, allow_adjacent, unique)
+
+def validate_pack(raw_ls, workers:int=None, chunksize:int=256, allow_adjacent:bool=False, unique:bool=True,
+                  max_pending:int=None) -> Iterator[dict]:
+    """
+        Validate puzzles on a process pool, reports are yielded in the order of the puzzles
+        Args:
+            `raw_ls`: iterable of (kind, raw data) like `iter_raw`, it is read only as fast as the workers validate
+            `workers`: number of processes, all cores by default, 1 validates in this process
+            `chunksize`: number of puzzles sent to a worker at once
+            `allow_adjacent`, `unique`: see `validate_puzzle`
+            `max_pending`: most chunks read and not reported yet, 4 per worker by default,
+                so memory does not grow with the size of the pack
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    _chunk_ls = _iter_chunks(raw_ls, chunksize, allow_adjacent, unique)
+    if workers <= 1:
+        for _task in _chunk_ls:
+            yield from _validate_chunk(_task)
+        return
+
+    if max_pending is None:
+        max_pending = workers * 4
+    with multiprocessing.Pool(workers) as _pool:
+        _pending : deque[multiprocessing.pool.AsyncResult] = deque()
+        for _task in _chunk_ls:
+            _pending.append(_pool.apply_async(_validate_chunk, (_task,)))
+            if len(_pending) >= max_pending:
+                yield from _pending.popleft().get()
+        while len(_pending) > 0:
+            yield from _pending.popleft().get()
+
+if __name__ == '__main__':
+    _parser = argparse.ArgumentParser(description='Validate puzzle packs in parallel, reports are written as JSON lines')
+    _parser.add_argument('paths', nargs='+', help='libraries, JSON lines with width, height and islands, or text puzzles')
+    _parser.add_argument('-j', '--workers', type=int, default=None, help='number of processes, all cores by default')
+    _parser.add_argument('--chunksize', type=int, default=256, help='number of puzzles sent to a worker at once')
+    _parser.add_argument('--allow-adjacent', action='store_true',
+                         help='islands may be next to each other, like the puzzles of batch.py')
+    _parser.add_argument('--no-unique', action='store_true', help='only check that each puzzle has a solution')
+    _parser.add_argument('-o', '--output', help='file to write to, stdout by default')
+    _parser.add_argument('--bad-only', action='store_true', help='only write the reports of invalid puzzles')
+    _args = _parser.parse_args()
+
+    _file = sys.stdout if _args.output is None else open(_args.output, 'w')
+    _start = perf_counter()
+    _count = {VALID: 0, INVALID: 0, UNREADABLE: 0}
+    try:
+        for _path in _args.paths:
+            # only errors of the pack itself are caught, like a missing file or a library with a broken header,
+            # an error writing the reports or of the pool stops the run
+            _read_error_ls : list[str] = []
+            for _report in validate_pack(_iter_readable(_path, _read_error_ls), _args.workers, _args.chunksize,
+                                         _args.allow_adjacent, not _args.no_unique):
+                _count[_report['result']] += 1
+                if _args.bad_only and _report['result'] == VALID:
+                    continue
+                _report['path'] = _path
+                _file.write(json.dumps(_report) + '\n')
+            if len(_read_error_ls) > 0:
+                _count[UNREADABLE] += 1
+                _file.write(json.dumps({'path': _path, 'result': UNREADABLE, 'errors': _read_error_ls}) + '\n')
+    finally:
+        if _file is not sys.stdout:
+            _file.close()
+    _seconds = perf_counter() - _start
+    _total = sum(_count.values())
+    print('{} puzzles, {} valid, {} invalid, {} unreadable, {:.2f}s, {:.1f} puzzles/s'.format(
+        _total, _count[VALID], _count[INVALID], _count[UNREADABLE], _seconds, _total / _seconds if _seconds > 0 else 0.0
+    ), file=sys.stderr)